@@ -0,0 +1,344 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.engine import Engine
+from ingestclient.utils.metrics import merge_summaries
+from ingestclient.benchmark.datasets import DATASETS, make_dataset, make_config
+from ingestclient.benchmark.micro import run_micro
+from ingestclient.benchmark.imports import run_imports
+from ingestclient import __version__
+
+import multiprocessing as mp
+import argparse
+import datetime
+import platform
+import tempfile
+import logging
+import shutil
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows. CPU time and memory are not reported
+    resource = None
+
+
+def parse_int_list(value):
+    """Method to parse a comma separated list of integers, e.g. "1,2,4"
+
+    Args:
+        value(str): The argument value
+
+    Returns:
+        (list(int))
+    """
+    try:
+        values = [int(x) for x in value.split(",") if x.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected a comma separated list of integers: {}".format(value))
+    if not values or min(values) < 1:
+        raise argparse.ArgumentTypeError("Values must be at least 1: {}".format(value))
+    return values
+
+
+def get_resource_usage():
+    """Method to get the CPU time and peak memory use of the calling process
+
+    Returns:
+        (dict): {"cpu_seconds": float, "peak_rss_bytes": int}, with None values if the resource module is missing
+    """
+    if resource is None:
+        return {"cpu_seconds": None, "peak_rss_bytes": None}
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {"cpu_seconds": usage.ru_utime + usage.ru_stime, "peak_rss_bytes": peak_rss}
+
+
+def benchmark_worker(config_file, job_id, threads, results):
+    """A benchmark worker process main function. Uploads tiles from the job until it is drained
+
+    Args:
+        config_file(str): Path to the job configuration file
+        job_id(int): ID of the LocalBackend job
+        threads(int): Number of upload threads
+        results(multiprocessing.Queue): Queue the worker's run summary and resource usage are put on
+
+    Returns:
+        None
+    """
+    try:
+        engine = Engine(config_file=config_file, ingest_job_id=job_id, upload_threads=threads)
+        # A local queue is cheap to check, so finish as soon as it is drained. Short idle waits keep the sleep after
+        # the last upload out of the measured time
+        engine.completion_check_interval = 0
+        engine.idle_backoff_min = 0.05
+        engine.idle_backoff_max = 1
+        engine.join()
+        engine.run()
+        summary = engine.stats.to_dict()
+        summary.update(get_resource_usage())
+        results.put(summary)
+    except Exception as e:
+        results.put({"error": "{}: {}".format(type(e).__name__, e)})
+
+
+def run_benchmark(config_file, processes, threads, timeout=3600, trace=None):
+    """Method to upload every tile of a new LocalBackend job with a number of worker processes
+
+    Args:
+        config_file(str): Path to the job configuration file
+        processes(int): Number of worker processes
+        threads(int): Number of upload threads per process
+        timeout(float): Seconds to wait for the workers to finish
+        trace(list(dict)): If provided, the job's upload tasks are taken from this recorded trace instead of the
+                           extent, see LocalBackend.create()
+
+    Returns:
+        (dict): Throughput, CPU and memory measurements for the run
+    """
+    engine = Engine(config_file=config_file)
+    if trace is None:
+        engine.create_job()
+    else:
+        engine.ingest_job_id = engine.backend.create(engine.config.config_data, trace)
+
+    results = mp.Queue()
+    workers = [mp.Process(target=benchmark_worker, args=(config_file, engine.ingest_job_id, threads, results))
+               for _ in range(processes)]
+    start_time = time.time()
+    for worker in workers:
+        worker.start()
+
+    summaries = []
+    errors = []
+    deadline = start_time + timeout
+    for _ in workers:
+        result = results.get(timeout=max(1, deadline - time.time()))
+        if "error" in result:
+            errors.append(result["error"])
+        else:
+            summaries.append(result)
+    for worker in workers:
+        worker.join()
+    wall_seconds = time.time() - start_time
+
+    merged = merge_summaries(summaries)
+    status = engine.backend.get_job_status(engine.ingest_job_id)
+    cpu_seconds = None
+    peak_rss = None
+    if summaries and summaries[0]["cpu_seconds"] is not None:
+        cpu_seconds = sum(x["cpu_seconds"] for x in summaries)
+        peak_rss = [x["peak_rss_bytes"] for x in summaries]
+
+    result = {"processes": processes,
+              "threads": threads,
+              "tiles": merged["counters"].get("tiles_uploaded", 0),
+              "expected_tiles": status["total_message_count"],
+              "bytes": merged["counters"].get("bytes_uploaded", 0),
+              # Throughput is measured over the upload runs. wall_seconds includes starting the workers
+              "seconds": merged["elapsed_seconds"],
+              "wall_seconds": wall_seconds,
+              "tiles_per_second": merged["tiles_per_second"],
+              "megabytes_per_second": merged["megabytes_per_second"],
+              "cpu_seconds": cpu_seconds,
+              # Share of the node's CPU capacity used by the workers over the run
+              "cpu_utilization": cpu_seconds / (wall_seconds * (mp.cpu_count() or 1)) if cpu_seconds else None,
+              # Sum of the workers' peak resident memory, an upper bound on what the node needs
+              "peak_rss_megabytes": sum(peak_rss) / 1e6 if peak_rss else None,
+              "max_worker_rss_megabytes": max(peak_rss) / 1e6 if peak_rss else None,
+              "stages": dict((name, {"mean": stage["mean"], "p95": stage["p95"]})
+                             for name, stage in merged["stages"].items()),
+              "errors": errors}
+    return result
+
+
+def run_suite(work_dir, plugins, tile_sizes, processes, threads, tiles_per_slice=2, num_slices=16, log=None,
+              dtype=None, compressibility=0.8, micro=False):
+    """Method to run the benchmark sweep
+
+    A dataset is generated for each plugin and tile size, then uploaded once for every combination of process and
+    thread counts. With micro set, the plugins are timed on their own with run_micro() instead.
+
+    Args:
+        work_dir(str): Directory for the datasets, job configs and local backend
+        plugins(list(str)): Names of the datasets to benchmark
+        tile_sizes(list(int)): Tile sizes in x and y
+        processes(list(int)): Numbers of worker processes
+        threads(list(int)): Numbers of upload threads per process
+        tiles_per_slice(int): Number of tiles in x and in y of each slice
+        num_slices(int): Number of slices in the dataset
+        log(callable): Called with a progress message before each run
+        dtype(str): Data type of the datasets. None uses each format's default
+        compressibility(float): Share of smooth structure in the datasets, from 0 (noise) to 1
+        micro(bool): Run the plugin microbenchmarks instead of the upload sweep
+
+    Returns:
+        (dict): Environment details and a list of results
+    """
+    report = {"version": __version__,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "cpu_count": mp.cpu_count(),
+              "date": datetime.datetime.now().isoformat(),
+              "parameters": {"tiles_per_slice": tiles_per_slice,
+                             "num_slices": num_slices,
+                             "dtype": dtype,
+                             "compressibility": compressibility},
+              "results": [],
+              "skipped": []}
+
+    for plugin in plugins:
+        for tile_size in tile_sizes:
+            name = "{}_{}".format(plugin, tile_size)
+            shape = (num_slices, tiles_per_slice * tile_size, tiles_per_slice * tile_size)
+            try:
+                dataset = make_dataset(plugin, os.path.join(work_dir, "data", name), shape, tile_size,
+                                       dtype=dtype, compressibility=compressibility)
+            except (ImportError, ValueError) as e:
+                # The plugin's optional dependencies are not installed, or it doesn't support the data type
+                report["skipped"].append({"plugin": plugin, "tile_size": tile_size, "reason": str(e)})
+                continue
+
+            config_data = make_config(dataset, os.path.join(work_dir, "jobs"), tile_size)
+            if micro:
+                if log:
+                    log("{} - tile size {} - microbenchmark".format(plugin, tile_size))
+                result = {"plugin": plugin, "tile_size": tile_size}
+                result.update(run_micro(config_data))
+                report["results"].append(result)
+                continue
+
+            config_file = os.path.join(work_dir, "{}.json".format(name))
+            with open(config_file, 'wt') as file_handle:
+                json.dump(config_data, file_handle, indent=2)
+
+            for num_processes in processes:
+                for num_threads in threads:
+                    if log:
+                        log("{} - tile size {} - {} processes x {} threads".format(plugin, tile_size,
+                                                                                   num_processes, num_threads))
+                    result = {"plugin": plugin, "tile_size": tile_size}
+                    result.update(run_benchmark(config_file, num_processes, num_threads))
+                    report["results"].append(result)
+
+    return report
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark ingest client throughput against a local backend",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="Results are written as JSON. Each run uploads a synthetic dataset "
+                                            "to a local directory, so network and S3 are not measured.")
+    parser.add_argument("--plugins",
+                        default=",".join(x[0] for x in DATASETS),
+                        help="Comma separated datasets to benchmark. Default: all ({})".format(
+                            ", ".join(x[0] for x in DATASETS)))
+    parser.add_argument("--processes", type=parse_int_list,
+                        default=[1],
+                        help="Comma separated numbers of worker processes to sweep, e.g. 1,2,4")
+    parser.add_argument("--threads", type=parse_int_list,
+                        default=[1],
+                        help="Comma separated numbers of upload threads per process to sweep, e.g. 1,4")
+    parser.add_argument("--tile-sizes", type=parse_int_list,
+                        default=[512],
+                        help="Comma separated tile sizes (in x and y) to sweep, e.g. 512,1024")
+    parser.add_argument("--tiles-per-slice", type=int,
+                        default=2,
+                        help="Number of tiles in x and in y of each dataset slice")
+    parser.add_argument("--slices", type=int,
+                        default=16,
+                        help="Number of slices in each dataset")
+    parser.add_argument("--dtype",
+                        default=None,
+                        help="Data type of the datasets, e.g. uint8 or uint16. Defaults to each format's native type. "
+                             "Datasets that don't support it are skipped")
+    parser.add_argument("--compressibility", type=float,
+                        default=0.8,
+                        help="Share of smooth structure in the datasets, from 0 (incompressible noise) to 1")
+    parser.add_argument("--micro",
+                        action="store_true",
+                        default=False,
+                        help="Time the path and tile processors on their own instead of running uploads")
+    parser.add_argument("--imports",
+                        action="store_true",
+                        default=False,
+                        help="Time importing the client, engine, backend and plugins in fresh interpreters instead of "
+                             "running uploads")
+    parser.add_argument("--work-dir",
+                        default=None,
+                        help="Directory for datasets and uploaded tiles. Defaults to a temporary directory that is "
+                             "removed afterwards")
+    parser.add_argument("--output", "-o",
+                        default=None,
+                        help="File to write the JSON results to. Defaults to stdout")
+    parser.add_argument("--log-level", "-v",
+                        default="error",
+                        help="Log level to use: critical, error, warning, info, debug")
+
+    return parser
+
+
+def main(parser_args=None):
+    """Benchmark UI main
+
+    Args:
+        parser_args(argparse.Namespace): Pre-parsed arguments
+
+    Returns:
+        None
+    """
+    parser = get_parser()
+    args = parser_args if parser_args is not None else parser.parse_args()
+
+    plugins = [x.strip() for x in args.plugins.split(",") if x.strip()]
+    unknown = set(plugins) - set(x[0] for x in DATASETS)
+    if unknown:
+        parser.print_usage()
+        print("Error: Unknown plugins: {}".format(", ".join(sorted(unknown))))
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level.upper()),
+                        format='%(asctime)s %(levelname)-8s %(message)s')
+
+    def log(msg):
+        sys.stderr.write("{}\n".format(msg))
+
+    if args.imports:
+        report = {"version": __version__,
+                  "python": platform.python_version(),
+                  "imports": run_imports()}
+    else:
+        work_dir = args.work_dir or tempfile.mkdtemp(prefix="boss-ingest-bench")
+        try:
+            report = run_suite(work_dir, plugins, args.tile_sizes, args.processes, args.threads,
+                               args.tiles_per_slice, args.slices, log, args.dtype, args.compressibility, args.micro)
+        finally:
+            if not args.work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'wt') as file_handle:
+            file_handle.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.config import Configuration
+from ingestclient.utils.synthetic import synthetic_slice
+from functools import partial
+from PIL import Image
+import numpy as np
+import copy
+import os
+
+
+def get_plugins(config_data):
+    """Method to create and set up the path and tile processors of a configuration
+
+    Args:
+        config_data(dict): The configuration. Not modified
+
+    Returns:
+        (ingestclient.plugins.path.PathProcessor, ingestclient.plugins.tile.TileProcessor)
+    """
+    configuration = Configuration(copy.deepcopy(config_data))
+    configuration.load_plugins()
+    path_processor = configuration.path_processor_class
+    path_processor.setup(configuration.get_path_processor_params())
+    tile_processor = configuration.tile_processor_class
+    tile_processor.setup(configuration.get_tile_processor_params())
+    return path_processor, tile_processor
+
+
+def get_path(dataset, tile_size, x_index, y_index, z_index, t_index=0):
+    """Method to get the file a plugin reads a tile from, so generators write files exactly where plugins look
+
+    Args:
+        dataset(dict): The dataset description
+        tile_size(int): Tile size in x and y
+        x_index(int): The tile index in the X dimension
+        y_index(int): The tile index in the Y dimension
+        z_index(int): The tile index in the Z dimension
+        t_index(int): The time index
+
+    Returns:
+        (str)
+    """
+    path_processor, _ = get_plugins(make_config(dataset, None, tile_size))
+    path = path_processor.process(x_index, y_index, z_index, t_index)
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    return path
+
+
+def check_dtype(dtype, supported):
+    """Method to validate the data type requested for a dataset
+
+    Args:
+        dtype(str): The requested data type. None selects the format's default
+        supported(tuple(str)): Data types the format supports. The first is the default
+
+    Returns:
+        (str): The data type to use
+    """
+    if dtype is None:
+        return supported[0]
+    if dtype not in supported:
+        raise ValueError("Unsupported datatype {}, expected one of: {}".format(dtype, ", ".join(supported)))
+    return dtype
+
+
+def make_zstack(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0, extension="png",
+                base_filename="<o:100>_section_<p:4>"):
+    """Method to write an image stack with one file per z slice for the ZindexStack plugin
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (z, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint8" (default) or "uint16"
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+        extension(str): "png" or "tif"
+        base_filename(str): File name template, in the format the plugin's base_filename parameter uses
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    dtype = check_dtype(dtype, ("uint8", "uint16"))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.stack.ZindexStackPathProcessor",
+                                  "params": {"root_dir": root,
+                                             "extension": extension,
+                                             "base_filename": base_filename}},
+               "tile_processor": {"class": "ingestclient.plugins.stack.ZindexStackTileProcessor",
+                                  "params": {"filesystem": "local",
+                                             "extension": extension}},
+               "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, shape[0]], "t": [0, 1]}}
+
+    for z in range(shape[0]):
+        data = synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + z)
+        Image.fromarray(data).save(get_path(dataset, tile_size, 0, 0, z))
+
+    return dataset
+
+
+def make_catmaid(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0, layout="file", filetype="png"):
+    """Method to write a CATMAID tile tree, with one file per tile
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (z, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint8" (default) or "uint16"
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+        layout(str): "file" for {z}/{y}_{x}_{resolution} (CatmaidFileImageStack), "directory" for
+                     {resolution}/{z}/{y}/{y}.{x} (CatmaidDirectoryImageStack) or "zoom" for
+                     {resolution}/{z}/{y}_{x} (CatmaidFileImageStackZoomLevel)
+        filetype(str): "png" or "jpg"
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    dtype = check_dtype(dtype, ("uint8", "uint16"))
+    plugins = {"file": "CatmaidFileImageStack",
+               "directory": "CatmaidDirectoryImageStack",
+               "zoom": "CatmaidFileImageStackZoomLevel"}
+    if layout not in plugins:
+        raise ValueError("Unknown CATMAID layout: {}".format(layout))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.catmaid.{}PathProcessor".format(plugins[layout]),
+                                  "params": {"root_dir": root,
+                                             "filetype": filetype}},
+               "tile_processor": {"class": "ingestclient.plugins.catmaid.{}TileProcessor".format(plugins[layout]),
+                                  "params": {"filetype": filetype}},
+               "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, shape[0]], "t": [0, 1]}}
+
+    for z in range(shape[0]):
+        data = synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + z)
+        for y in range(shape[1] // tile_size):
+            for x in range(shape[2] // tile_size):
+                tile = data[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+                Image.fromarray(tile).save(get_path(dataset, tile_size, x, y, z), format=filetype.upper())
+
+    return dataset
+
+
+def make_multipage_tiff(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0):
+    """Method to write a 16 bit multipage TIFF for the SingleTimeTiff plugin
+
+    The plugin stores time points as pages of one file per z slice, so the z dimension of the shape becomes time.
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (t, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint16", the only type the plugin supports
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    dtype = check_dtype(dtype, ("uint16",))
+    file_path = os.path.join(root, "z_0.tif")
+    pages = [Image.fromarray(synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + t))
+             for t in range(shape[0])]
+    pages[0].save(file_path, save_all=True, append_images=pages[1:])
+
+    return {"path_processor": {"class": "ingestclient.plugins.multipage_tiff.SingleTimeTiffPathProcessor",
+                               "params": {"z_0": file_path}},
+            "tile_processor": {"class": "ingestclient.plugins.multipage_tiff.SingleTimeTiffTileProcessor",
+                               "params": {"datatype": dtype,
+                                          "filetype": "tif"}},
+            "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, 1], "t": [0, shape[0]]}}
+
+
+def make_tiff_hyperstack(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0, time_chunk_size=4):
+    """Method to write a time series split across multipage TIFF files for the TiffMultiFileHyperStack plugin
+
+    The plugin uploads whole frames, so frames are a single tile in size and the z dimension of the shape becomes
+    time.
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Number of time points in shape[0]. The frame size is the tile size
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint16", the only type the plugin supports
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+        time_chunk_size(int): Number of time points in each file
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    dtype = check_dtype(dtype, ("uint16",))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.multipage_tiff.TiffMultiFileHyperStackPathProcessor",
+                                  "params": {"root_dir": root,
+                                             "extension": "tif",
+                                             "base_filename": "series_<p:3>",
+                                             "time_chunk_size": time_chunk_size}},
+               "tile_processor": {"class": "ingestclient.plugins.multipage_tiff.TiffMultiFileHyperStackTileProcessor",
+                                  "params": {"time_chunk_size": time_chunk_size,
+                                             "num_z_slices": 1,
+                                             "num_channels": 1,
+                                             "channel_index": 0,
+                                             "filesystem": "local"}},
+               "extent": {"x": [0, tile_size], "y": [0, tile_size], "z": [0, 1], "t": [0, shape[0]]}}
+
+    for start in range(0, shape[0], time_chunk_size):
+        pages = [Image.fromarray(synthetic_slice(tile_size, tile_size, dtype, compressibility, seed + t))
+                 for t in range(start, min(start + time_chunk_size, shape[0]))]
+        pages[0].save(get_path(dataset, tile_size, 0, 0, 0, start), save_all=True, append_images=pages[1:])
+
+    return dataset
+
+
+def make_hdf5(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0):
+    """Method to write a volume in a single HDF5 file for the Hdf5SingleFile plugin
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (z, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint8" (default), "uint16" or "uint32"
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    import h5py
+
+    dtype = check_dtype(dtype, ("uint8", "uint16", "uint32"))
+    file_path = os.path.join(root, "volume.h5")
+    with h5py.File(file_path, 'w') as h5_file:
+        data = h5_file.create_dataset("img", shape=shape, dtype=dtype)
+        for z in range(shape[0]):
+            data[z, :, :] = synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + z)
+
+    return {"path_processor": {"class": "ingestclient.plugins.hdf5.Hdf5SingleFilePathProcessor",
+                               "params": {"filename": file_path}},
+            "tile_processor": {"class": "ingestclient.plugins.hdf5.Hdf5SingleFileTileProcessor",
+                               "params": {"filesystem": "local",
+                                          "upload_format": "png",
+                                          "offset_x": 0,
+                                          "offset_y": 0,
+                                          "offset_z": 0,
+                                          "data_name": "img",
+                                          "datatype": dtype}},
+            "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, shape[0]], "t": [0, 1]}}
+
+
+def make_hdf5_slice(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0):
+    """Method to write one HDF5 file per z slice for the Hdf5Slice plugin
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (z, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint8" (default) or "uint16"
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    import h5py
+
+    dtype = check_dtype(dtype, ("uint8", "uint16"))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.hdf5.Hdf5SlicePathProcessor",
+                                  "params": {"root_dir": root,
+                                             "extension": "h5",
+                                             "base_filename": "slice_<p:4>"}},
+               "tile_processor": {"class": "ingestclient.plugins.hdf5.Hdf5SliceTileProcessor",
+                                  "params": {"filesystem": "local",
+                                             "upload_format": "png",
+                                             "data_name": "data",
+                                             "offset_name": "offset",
+                                             "extent_name": "extent",
+                                             "offset_origin_x": 0,
+                                             "offset_origin_y": 0,
+                                             "datatype": dtype}},
+               "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, shape[0]], "t": [0, 1]}}
+
+    for z in range(shape[0]):
+        with h5py.File(get_path(dataset, tile_size, 0, 0, z), 'w') as h5_file:
+            h5_file.create_dataset("data", data=synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + z))
+            h5_file.create_dataset("offset", data=np.array([0, 0]))
+            h5_file.create_dataset("extent", data=np.array([shape[1], shape[2]]))
+
+    return dataset
+
+
+def make_hdf5_chunk(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0, z_chunk_size=16):
+    """Method to write a volume as HDF5 chunks of one tile by z_chunk_size slices for the Hdf5Chunk plugin
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (z, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint8" (default), "uint16" or "uint32"
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+        z_chunk_size(int): Number of slices in each chunk
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    import h5py
+
+    dtype = check_dtype(dtype, ("uint8", "uint16", "uint32"))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.hdf5.Hdf5ChunkPathProcessor",
+                                  "params": {"root_dir": root,
+                                             "extension": "h5",
+                                             "prefix": "chunk",
+                                             "x_offset": 0,
+                                             "y_offset": 0,
+                                             "z_offset": 0,
+                                             "x_chunk_size": tile_size,
+                                             "y_chunk_size": tile_size,
+                                             "z_chunk_size": z_chunk_size,
+                                             "use_python_convention": True}},
+               "tile_processor": {"class": "ingestclient.plugins.hdf5.Hdf5ChunkTileProcessor",
+                                  "params": {"filesystem": "local",
+                                             "upload_format": "png",
+                                             "z_chunk_size": z_chunk_size,
+                                             "data_name": "img",
+                                             "datatype": dtype}},
+               "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, shape[0]], "t": [0, 1]}}
+
+    slices = [synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + z) for z in range(shape[0])]
+    for z_start in range(0, shape[0], z_chunk_size):
+        for y in range(shape[1] // tile_size):
+            for x in range(shape[2] // tile_size):
+                chunk = np.stack([data[y * tile_size:(y + 1) * tile_size, x * tile_size:(x + 1) * tile_size]
+                                  for data in slices[z_start:z_start + z_chunk_size]])
+                with h5py.File(get_path(dataset, tile_size, x, y, z_start), 'w') as h5_file:
+                    h5_file.create_dataset("img", data=chunk)
+
+    return dataset
+
+
+def make_hdf5_time_series(root, shape, tile_size, dtype=None, compressibility=0.8, seed=0):
+    """Method to write a single channel time series HDF5 file for the Hdf5TimeSeries plugin
+
+    The plugin stores time points in one file per z slice, so the z dimension of the shape becomes time.
+
+    Args:
+        root(str): Directory to write the dataset to
+        shape(tuple(int)): Size of the volume in (t, y, x)
+        tile_size(int): Tile size in x and y
+        dtype(str): "uint16", the type the plugin uploads
+        compressibility(float): See synthetic_slice()
+        seed(int): Random seed
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    import h5py
+
+    dtype = check_dtype(dtype, ("uint16",))
+    dataset = {"path_processor": {"class": "ingestclient.plugins.hdf5.Hdf5TimeSeriesPathProcessor",
+                                  "params": {"root_dir": root,
+                                             "extension": "h5",
+                                             "base_filename": "series_<p:3>"}},
+               "tile_processor": {"class": "ingestclient.plugins.hdf5.Hdf5TimeSeriesTileProcessor",
+                                  "params": {"filesystem": "local",
+                                             "upload_format": "png",
+                                             "channel_index": 0,
+                                             "scale_factor": 1.0,
+                                             "dataset": "data"}},
+               "extent": {"x": [0, shape[2]], "y": [0, shape[1]], "z": [0, 1], "t": [0, shape[0]]}}
+
+    with h5py.File(get_path(dataset, tile_size, 0, 0, 0), 'w') as h5_file:
+        # Stored as (t, x, y, channel)
+        data = h5_file.create_dataset("data", shape=(shape[0], shape[2], shape[1], 1), dtype=dtype)
+        for t in range(shape[0]):
+            data[t, :, :, 0] = synthetic_slice(shape[1], shape[2], dtype, compressibility, seed + t).T
+
+    return dataset
+
+
+# Dataset generators by name, in the order they are benchmarked
+DATASETS = (("zstack", make_zstack),
+            ("zstack_tiff", partial(make_zstack, extension="tif")),
+            ("catmaid", make_catmaid),
+            ("catmaid_directory", partial(make_catmaid, layout="directory")),
+            ("catmaid_zoom", partial(make_catmaid, layout="zoom")),
+            ("multipage_tiff", make_multipage_tiff),
+            ("tiff_hyperstack", make_tiff_hyperstack),
+            ("hdf5", make_hdf5),
+            ("hdf5_slice", make_hdf5_slice),
+            ("hdf5_chunk", make_hdf5_chunk),
+            ("hdf5_time_series", make_hdf5_time_series))
+
+
+def make_dataset(name, root, shape, tile_size, dtype=None, compressibility=0.8, seed=0):
+    """Method to write a synthetic dataset for a plugin
+
+    Args:
+        name(str): Name of the dataset, one of DATASETS
+        root(str): Directory to write the dataset to. Created if it does not exist
+        shape(tuple(int)): Size of the volume in (z, y, x). x and y should be multiples of tile_size
+        tile_size(int): Tile size in x and y
+        dtype(str): Data type of the voxels. None uses the format's default. Raises ValueError if the plugin does not
+                    support it
+        compressibility(float): Share of smooth structure in the data, from 0 (incompressible noise) to 1
+        seed(int): Random seed
+
+    Returns:
+        (dict): "path_processor" and "tile_processor" config sections, and the "extent" of the ingest job
+    """
+    generators = dict(DATASETS)
+    if name not in generators:
+        raise ValueError("Unknown dataset: {}. Valid datasets are: {}".format(
+            name, ", ".join(x[0] for x in DATASETS)))
+    root = os.path.abspath(root)
+    if not os.path.exists(root):
+        os.makedirs(root)
+    return generators[name](root, shape, tile_size, dtype=dtype, compressibility=compressibility, seed=seed)
+
+
+def make_config(dataset, backend_root, tile_size):
+    """Method to build an ingest job configuration that uploads a synthetic dataset to a LocalBackend
+
+    Args:
+        dataset(dict): Output of make_dataset()
+        backend_root(str): Directory the LocalBackend keeps its jobs in
+        tile_size(int): Tile size in x and y
+
+    Returns:
+        (dict): The configuration
+    """
+    return {"schema": {"name": "boss-v0.1-schema",
+                       "validator": "BossValidatorV01"},
+            "client": {"backend": {"name": "local",
+                                   "class": "LocalBackend",
+                                   "host": backend_root,
+                                   "protocol": "file",
+                                   # Don't wait on an empty queue, so workers finish as soon as it is drained
+                                   "receive_wait_time": 0},
+                       "path_processor": dataset["path_processor"],
+                       "tile_processor": dataset["tile_processor"]},
+            "database": {"collection": "benchmark",
+                         "experiment": "benchmark",
+                         "channel": "benchmark"},
+            "ingest_job": {"resolution": 0,
+                           "extent": dataset["extent"],
+                           "tile_size": {"x": tile_size, "y": tile_size, "z": 1, "t": 1}}}
@@ -0,0 +1,72 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+
+import subprocess
+import json
+import sys
+
+# Slow to import, and only needed by some commands, backends or plugins. Importing the client must not load them
+DEFERRED_MODULES = ("boto3", "botocore.session", "requests", "jsonschema", "pkg_resources", "dateutil", "numpy",
+                    "PIL", "h5py", "intern", "cloudvolume")
+
+# Modules timed by default: the client entry point, the engine and backend, and the plugins
+MODULES = ("ingestclient.client", "ingestclient.core.engine", "ingestclient.core.backend",
+           "ingestclient.utils.filesystem", "ingestclient.plugins.stack", "ingestclient.plugins.hdf5")
+
+TIMER = """
+import json, sys, time
+# Modules imported at startup, e.g. by sitecustomize, are not charged to the import
+before = set(sys.modules)
+start = time.time()
+import {module}
+elapsed = time.time() - start
+print(json.dumps({{"seconds": elapsed,
+                  "loaded": [x for x in {deferred!r} if x in sys.modules and x not in before]}}))
+"""
+
+
+def time_import(module, repeat=5):
+    """Method to time importing a module in fresh interpreters, as a new worker process would
+
+    Args:
+        module(str): Name of the module to import
+        repeat(int): Number of interpreters to time it in
+
+    Returns:
+        (dict): Fastest and median import time in seconds, and the deferred modules the import loaded
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", TIMER.format(module=module,
+                                                                             deferred=DEFERRED_MODULES)])
+        runs.append(json.loads(output.decode("utf-8").strip().splitlines()[-1]))
+    seconds = sorted(run["seconds"] for run in runs)
+    return {"module": module,
+            "min": seconds[0],
+            "median": seconds[len(seconds) // 2],
+            "loaded": runs[-1]["loaded"]}
+
+
+def run_imports(modules=MODULES, repeat=5):
+    """Method to time importing each module
+
+    Args:
+        modules(iterable(str)): Names of the modules to import
+        repeat(int): Number of interpreters to time each module in
+
+    Returns:
+        (list(dict)): Results of time_import() for each module
+    """
+    return [time_import(module, repeat) for module in modules]
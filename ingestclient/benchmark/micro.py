@@ -0,0 +1,124 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.metrics import Histogram
+from ingestclient.benchmark.datasets import get_plugins
+
+from PIL import Image
+import numpy as np
+import time
+import os
+
+
+def get_size(data):
+    """Method to get the size of tile data in bytes
+
+    Args:
+        data: A file handle or numpy array
+
+    Returns:
+        (int): Size in bytes, or None if it can't be determined
+    """
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    try:
+        position = data.tell()
+        data.seek(0, os.SEEK_END)
+        size = data.tell()
+        data.seek(position)
+        return size
+    except (AttributeError, IOError, OSError):
+        return None
+
+
+def get_decoded_size(handle):
+    """Method to get the size of an encoded image tile once decoded
+
+    Args:
+        handle: File handle containing the encoded image
+
+    Returns:
+        (int): Size in bytes, or None if the handle isn't an image Pillow can read
+    """
+    try:
+        handle.seek(0)
+        return np.asarray(Image.open(handle)).nbytes
+    except (AttributeError, IOError, OSError):
+        return None
+
+
+def summarize(histogram):
+    """Method to reduce a histogram to the figures reported by the microbenchmarks
+
+    Args:
+        histogram(Histogram): Durations in seconds
+
+    Returns:
+        (dict): Count, mean, p50, p95 and max
+    """
+    summary = histogram.to_dict()
+    return dict((key, summary[key]) for key in ("count", "mean", "p50", "p95", "max"))
+
+
+def run_micro(config_data, repeat=1):
+    """Method to time a configuration's plugins on every tile of its extent, without the engine or a backend
+
+    PathProcessor.process() and TileProcessor.process() are timed on their own, then the tile processor's read() and
+    encode() stages separately, so decoding and encoding costs can be told apart. The output size is compared with
+    the size of the decoded tile to give a compression ratio.
+
+    Args:
+        config_data(dict): Ingest job configuration, e.g. from datasets.make_config()
+        repeat(int): Number of passes over the tiles
+
+    Returns:
+        (dict): Per stage duration summaries, mean output size and compression ratio
+    """
+    path_processor, tile_processor = get_plugins(config_data)
+    extent = config_data["ingest_job"]["extent"]
+    tile_size = config_data["ingest_job"]["tile_size"]
+    indices = [(x, y, z, t)
+               for t in range(*extent["t"])
+               for z in range(*extent["z"])
+               for y in range(extent["y"][0] // tile_size["y"], extent["y"][1] // tile_size["y"])
+               for x in range(extent["x"][0] // tile_size["x"], extent["x"][1] // tile_size["x"])]
+
+    stages = dict((name, Histogram()) for name in ("path", "process", "read", "encode"))
+    output_bytes = 0
+    raw_bytes = 0
+    for _ in range(repeat):
+        for x, y, z, t in indices:
+            start = time.time()
+            file_path = path_processor.process(x, y, z, t)
+            stages["path"].record(time.time() - start)
+
+            start = time.time()
+            handle = tile_processor.process(file_path, x, y, z, t)
+            stages["process"].record(time.time() - start)
+            output_bytes += get_size(handle) or 0
+            raw_bytes += get_decoded_size(handle) or 0
+
+            start = time.time()
+            data = tile_processor.read(file_path, x, y, z, t)
+            stages["read"].record(time.time() - start)
+
+            start = time.time()
+            tile_processor.encode(data)
+            stages["encode"].record(time.time() - start)
+
+    count = len(indices) * repeat
+    return {"tiles": count,
+            "stages": dict((name, summarize(hist)) for name, hist in stages.items()),
+            "output_bytes": output_bytes / count if count else None,
+            "compression_ratio": raw_bytes / float(output_bytes) if raw_bytes and output_bytes else None}
@@ -0,0 +1,168 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.benchmark.bench import run_benchmark
+from ingestclient.utils.trace import read_trace
+
+import argparse
+import tempfile
+import logging
+import shutil
+import json
+import sys
+import os
+
+
+def get_replay_config(config_data, backend_root):
+    """Method to point an ingest job configuration at a LocalBackend, keeping its plugins and extent
+
+    Args:
+        config_data(dict): The configuration of the recorded run
+        backend_root(str): Directory the LocalBackend keeps its jobs in
+
+    Returns:
+        (dict): The replay configuration
+    """
+    config_data = dict(config_data)
+    config_data["client"] = dict(config_data["client"])
+    config_data["client"]["backend"] = {"name": "local",
+                                        "class": "LocalBackend",
+                                        "host": backend_root,
+                                        "protocol": "file",
+                                        # Don't wait on an empty queue, so workers finish as soon as it is drained
+                                        "receive_wait_time": 0}
+    return config_data
+
+
+def schedule_trace(trace, time_scale=None):
+    """Method to set when each task of a trace is released to the replay queue
+
+    Args:
+        trace(list(dict)): Trace records, ordered by receive time
+        time_scale(float): If provided, each task becomes visible at its recorded offset from the first task,
+                           multiplied by time_scale (e.g. 0.5 replays twice as fast). Otherwise every task is visible
+                           at once and tasks are only kept in order
+
+    Returns:
+        (list(dict)): The records, with a "delay" in seconds if time_scale is set
+    """
+    if time_scale is None or not trace:
+        return trace
+    start = trace[0]["time"]
+    return [dict(record, delay=(record["time"] - start) * time_scale) for record in trace]
+
+
+def replay_trace(config_file, trace_files, work_dir, processes=1, threads=1, time_scale=None):
+    """Method to run the upload tasks of recorded traces through the engine again, against a LocalBackend
+
+    The tasks are queued in the order they were received in the recorded run, so the replay reproduces its access
+    pattern across the source data (and the plugins' caching behaviour) without a Boss server or S3.
+
+    Args:
+        config_file(str): Configuration of the recorded run. Its plugins must be able to read the source data here
+        trace_files(list(str)): Traces written with boss-ingest --record-trace
+        work_dir(str): Directory for the replay configuration and the local backend
+        processes(int): Number of worker processes
+        threads(int): Number of upload threads per process
+        time_scale(float): If provided, tasks are released at their recorded pace, see schedule_trace()
+
+    Returns:
+        (dict): Throughput, CPU and memory measurements for the replay, see run_benchmark()
+    """
+    trace = read_trace(trace_files)
+    if not trace:
+        raise ValueError("No upload tasks found in trace files: {}".format(", ".join(trace_files)))
+
+    with open(config_file, 'rt') as file_handle:
+        config_data = json.load(file_handle)
+
+    replay_config_file = os.path.join(work_dir, "replay.json")
+    with open(replay_config_file, 'wt') as file_handle:
+        json.dump(get_replay_config(config_data, os.path.join(work_dir, "jobs")), file_handle, indent=2)
+
+    result = {"trace_files": trace_files,
+              "time_scale": time_scale}
+    result.update(run_benchmark(replay_config_file, processes, threads, trace=schedule_trace(trace, time_scale)))
+    return result
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Replay recorded upload task traces against a local backend",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="Record traces with boss-ingest --record-trace <dir>. Tiles are read with "
+                                            "the plugins in the configuration file and written to a local "
+                                            "directory, so the source data must be reachable from this machine.")
+    parser.add_argument("--processes", "-p", type=int,
+                        default=1,
+                        help="Number of worker processes")
+    parser.add_argument("--threads", type=int,
+                        default=1,
+                        help="Number of upload threads per process")
+    parser.add_argument("--time-scale", type=float,
+                        default=None,
+                        help="Release tasks at their recorded pace, scaled by this factor (e.g. 1 for real time, "
+                             "0.5 for twice as fast). By default all tasks are queued at once, in recorded order")
+    parser.add_argument("--work-dir",
+                        default=None,
+                        help="Directory for the local backend and uploaded tiles. Defaults to a temporary directory "
+                             "that is removed afterwards")
+    parser.add_argument("--output", "-o",
+                        default=None,
+                        help="File to write the JSON results to. Defaults to stdout")
+    parser.add_argument("--log-level", "-v",
+                        default="error",
+                        help="Log level to use: critical, error, warning, info, debug")
+    parser.add_argument("config_file", help="Path to the ingest job configuration file of the recorded run")
+    parser.add_argument("trace_files", nargs='+', help="Trace files to replay. Traces from several workers are "
+                                                       "merged by receive time")
+
+    return parser
+
+
+def main(parser_args=None):
+    """Replay UI main
+
+    Args:
+        parser_args(argparse.Namespace): Pre-parsed arguments
+
+    Returns:
+        None
+    """
+    parser = get_parser()
+    args = parser_args if parser_args is not None else parser.parse_args()
+
+    logging.basicConfig(level=logging.getLevelName(args.log_level.upper()),
+                        format='%(asctime)s %(levelname)-8s %(message)s')
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="boss-ingest-replay")
+    try:
+        result = replay_trace(args.config_file, args.trace_files, work_dir, args.processes, args.threads,
+                              args.time_scale)
+    except ValueError as e:
+        print("Error: {}".format(e))
+        sys.exit(1)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'wt') as file_handle:
+            file_handle.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
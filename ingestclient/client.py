@@ -16,11 +16,21 @@
 from ingestclient.core.engine import Engine
 from ingestclient.core.config import ConfigFileError
 from ingestclient.core.backend import BossBackend
+from ingestclient.core.pipeline import STAGE_NAMES
+from ingestclient.core.credentials import CredentialBroker
+from ingestclient.core.supervisor import WorkerSupervisor
 from ingestclient import check_version
-from ingestclient.utils.log import always_log_info
+from ingestclient.utils.log import always_log_info, set_log_sampling, configure_worker_logging, LogListener
 from ingestclient.utils.console import print_estimated_job
+from ingestclient.utils.metrics import merge_summaries, format_summary
+from ingestclient.utils.metrics import MetricsAggregator, MetricsCollector, MetricsServer
+from ingestclient.utils.bandwidth import TokenBucket, mbps_to_bytes
+from ingestclient.utils.trace import TraceRecorder
+from ingestclient.utils.profiling import RunProfiler, merge_profiles, install_stack_dump_handler
+from ingestclient.utils.memory import MemoryProfiler
 
 from six.moves import input
+from six.moves import queue
 import datetime
 import argparse
 import sys
@@ -28,6 +38,11 @@ import multiprocessing as mp
 import os
 import time
 import logging
+import glob
+import json
+import signal
+import inspect
+import threading
 
 
 def get_confirmation(prompt, force=False):
@@ -58,7 +73,40 @@ def get_confirmation(prompt, force=False):
         return True
 
 
-def worker_process_run(api_token, job_id, pipe, config_file=None, configuration=None):
+def parse_stage_workers(value):
+    """Method to parse the --stage-workers argument
+
+    Args:
+        value(str): Comma separated list of stage=count pairs, e.g. "read=2,encode=4"
+
+    Returns:
+        (dict): Stage name to number of threads
+    """
+    stage_workers = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        try:
+            name, count = item.split("=")
+            count = int(count)
+        except ValueError:
+            raise argparse.ArgumentTypeError("Stage workers must be given as stage=count pairs: {}".format(item))
+
+        name = name.strip()
+        if name not in STAGE_NAMES:
+            raise argparse.ArgumentTypeError("Unknown pipeline stage '{}'. Valid stages are: {}".format(
+                name, ", ".join(STAGE_NAMES)))
+        if count < 1:
+            raise argparse.ArgumentTypeError("Stage '{}' must have at least one worker".format(name))
+        stage_workers[name] = count
+
+    return stage_workers
+
+
+def worker_process_run(api_token, job_id, pipe, config_file=None, configuration=None, threads_per_process=1,
+                       stage_workers=None, summary_dir=None, adaptive_concurrency=False, bandwidth_limiter=None,
+                       trace_dir=None, profile=False, memory_profile=None, log_queue=None, engine=None,
+                       worker_status=None):
     """A worker process main execution function. Generates an engine, and joins the job
        (that was either created by the main process or joined by it).
        Ends when no more tasks are left that can be executed.
@@ -66,28 +114,76 @@ def worker_process_run(api_token, job_id, pipe, config_file=None, configuration=
     Args:
         api_token(str): the token to initialize the engine with.
         job_id(int): the id of the job the engine needs to join with.
-        pipe(multiprocessing.Pipe): the receiving end of the pipe that communicates with the master process.
+        pipe(multiprocessing.Connection): this worker's end of the duplex pipe to the master process. The master
+                                          sends run/stop decisions and refreshed credentials, and the worker sends
+                                          live metrics back.
         config_file(str): the path to the configuration file (configuration required if omitted)
         configuration(Configuration): a pre-loaded configuration object (config_file required if omitted)
+        threads_per_process(int): the number of threads uploading tiles concurrently in this process
+        stage_workers(dict): the number of threads for each pipeline stage, overriding threads_per_process for uploads
+        summary_dir(str): directory to write this worker's performance summary to when it finishes
+        adaptive_concurrency(bool): adapt the number of concurrent uploads to S3 throttling and latency, up to the
+                                    number of upload threads
+        bandwidth_limiter(ingestclient.utils.bandwidth.TokenBucket): node-wide upload bandwidth limit shared by
+                                                                     all worker processes
+        trace_dir(str): directory to record the upload tasks this worker receives to, for replaying later
+        profile(bool): profile the engine with cProfile and write worker_<pid>.prof to summary_dir when finished
+        memory_profile(float): if provided, sample memory use every memory_profile seconds and add the top
+                               allocators to the run summary
+        log_queue(multiprocessing.Queue): if provided, send log records to the master process over this queue
+                                          instead of writing the log file directly
+        engine(Engine): an engine the master process already configured and joined to the job, inherited by
+                        forking. If provided, the configuration arguments are ignored and the job isn't joined again
+        worker_status(ingestclient.core.supervisor.WorkerStatus): if provided, report liveness and the oldest tile
+                                                                  in progress to the master's supervisor
 
     """
+    configure_worker_logging(log_queue)
     always_log_info("Creating new worker process, pid={}.".format(os.getpid()))
+    if summary_dir:
+        # kill -USR1 <pid> dumps this worker's stacks and samples what it is doing
+        install_stack_dump_handler(summary_dir)
+
+    preforked = engine is not None
+    if preforked:
+        # Keep the master's configuration, plugins and credentials, and reconnect
+        engine.after_fork()
+    else:
+        # Create the engine
+        if config_file is None and configuration is None:
+            raise Exception('Must provide either a configuration instance or a configuration file')
 
-    # Create the engine
-    if config_file is None and configuration is None:
-        raise Exception('Must provide either a configuration instance or a configuration file')
+        try:
+            engine = Engine(config_file=config_file, 
+                            configuration=configuration,
+                            backend_api_token=api_token, 
+                            ingest_job_id=job_id,
+                            upload_threads=threads_per_process,
+                            stage_workers=stage_workers)
+        except ConfigFileError as err:
+            print("ERROR (pid: {}): {}".format(os.getpid(), err))
+            sys.exit(1)
 
-    try:
-        engine = Engine(config_file=config_file, 
-                        configuration=configuration,
-                        backend_api_token=api_token, 
-                        ingest_job_id=job_id)
-    except ConfigFileError as err:
-        print("ERROR (pid: {}): {}".format(os.getpid(), err))
-        sys.exit(1)
+    if summary_dir:
+        engine.summary_path = os.path.join(summary_dir, "worker_{}.json".format(os.getpid()))
+    engine.metrics_callback = lambda snapshot: pipe.send(("metrics", snapshot))
+    engine.adaptive_concurrency = adaptive_concurrency
+    engine.bandwidth_limiter = bandwidth_limiter
+    if trace_dir:
+        engine.trace_recorder = TraceRecorder(os.path.join(trace_dir, "trace_{}.ndjson".format(os.getpid())))
+    if profile:
+        engine.profiler = RunProfiler()
+    if memory_profile:
+        plugin_files = [inspect.getsourcefile(type(x)) for x in (engine.path_processor, engine.tile_processor)]
+        engine.memory_profiler = MemoryProfiler(interval=memory_profile, plugin_files=[x for x in plugin_files if x])
+    engine.worker_status = worker_status
+    # The master process refreshes credentials for all workers
+    engine.external_credentials = True
 
     # Join job
-    engine.join()
+    if not preforked:
+        engine.join()
+    decisions = listen_to_master(pipe, engine)
 
     # Start it up!
     should_run = True
@@ -98,10 +194,136 @@ def worker_process_run(api_token, job_id, pipe, config_file=None, configuration=
             should_run = False
         except KeyboardInterrupt:
             # Make sure they want to stop this client, wait for the main process to send the next step
-            should_run = pipe.recv()
+            should_run = wait_for_decision(decisions)
+    if engine.trace_recorder:
+        engine.trace_recorder.close()
+    if engine.profiler and summary_dir:
+        engine.profiler.dump(os.path.join(summary_dir, "worker_{}.prof".format(os.getpid())))
     always_log_info("  - Process pid={} finished gracefully.".format(os.getpid()))
     
 
+def get_fork_context():
+    """Method to get a multiprocessing context that starts worker processes by forking the master
+
+    Returns:
+        (multiprocessing.context.BaseContext): The context, or None if the platform can't fork
+    """
+    if not hasattr(mp, "get_context"):
+        # Python 2 always forks on platforms that support it
+        return mp if hasattr(os, "fork") else None
+    try:
+        return mp.get_context("fork")
+    except ValueError:
+        return None
+
+
+def write_run_summary(summary_dir, since=None):
+    """Method to merge the worker performance summaries into a single report
+
+    Args:
+        summary_dir(str): Directory containing the worker_<pid>.json summaries
+        since(float): If provided, ignore summaries from runs that started before this time (e.g. left over from a
+                      previous run using the same directory)
+
+    Returns:
+        (dict): The merged summary, or None if no worker summaries were found
+    """
+    summaries = []
+    for file_name in sorted(glob.glob(os.path.join(summary_dir, "worker_*.json"))):
+        try:
+            with open(file_name, 'rt') as file_handle:
+                summary = json.load(file_handle)
+        except (IOError, OSError, ValueError) as e:
+            logging.getLogger('ingest-client').warning("Skipping unreadable worker summary {}: {}".format(file_name, e))
+            continue
+
+        if since is None or summary["start_time"] >= since:
+            summaries.append(summary)
+
+    if not summaries:
+        return None
+
+    summary = merge_summaries(summaries)
+    summary_file = os.path.join(summary_dir, "summary.json")
+    with open(summary_file, 'wt') as file_handle:
+        json.dump(summary, file_handle, indent=2)
+
+    always_log_info(format_summary(summary))
+    always_log_info("Performance summary written to {}".format(summary_file))
+    return summary
+
+
+def listen_to_master(pipe, engine):
+    """Method to start a thread handling the messages the master process sends to a worker
+
+    Refreshed credentials are applied to the engine as soon as they arrive, without interrupting uploads. Run/stop
+    decisions are queued for wait_for_decision().
+
+    Args:
+        pipe(multiprocessing.Connection): The worker's end of the pipe to the master process
+        engine(Engine): The worker's engine
+
+    Returns:
+        (six.moves.queue.Queue): Queue the run/stop decisions are put on
+    """
+    decisions = queue.Queue()
+
+    def listen():
+        logger = logging.getLogger('ingest-client')
+        while True:
+            try:
+                msg = pipe.recv()
+            except (EOFError, IOError, OSError):
+                # Master closed its end of the pipe
+                return
+
+            if isinstance(msg, bool):
+                decisions.put(msg)
+            elif isinstance(msg, tuple) and msg[0] == "credentials":
+                try:
+                    engine.update_credentials(msg[1])
+                except Exception as e:
+                    logger.warning("(pid={}) Failed to switch to refreshed credentials: {}".format(os.getpid(), e))
+
+    listener = threading.Thread(target=listen, name="master-listener")
+    listener.daemon = True
+    listener.start()
+    return decisions
+
+
+def forward_signal_to_workers(workers, signum):
+    """Method to pass a signal the master process receives on to its live worker processes
+
+    Args:
+        workers(list): List of (multiprocessing.Process, multiprocessing.Connection) tuples for the worker processes
+        signum(int): The signal to forward
+
+    Returns:
+        None
+    """
+    def handler(received_signum, frame):
+        for worker_process, _ in workers:
+            if worker_process.is_alive():
+                try:
+                    os.kill(worker_process.pid, signum)
+                except OSError:
+                    pass
+
+    signal.signal(signum, handler)
+
+
+def wait_for_decision(decisions):
+    """Method to wait for the master process to decide if a worker should keep running
+
+    Args:
+        decisions(six.moves.queue.Queue): The decisions received from the master process by listen_to_master()
+
+    Returns:
+        (bool): True if the worker should continue
+    """
+    return decisions.get()
+
+
 def get_parser():
     parser = argparse.ArgumentParser(description="Client for facilitating large-scale data ingest",
                                      formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -119,6 +341,9 @@ def get_parser():
     parser.add_argument("--log-level", "-v",
                         default="warning",
                         help="Log level to use: critical, error, warning, info, debug")
+    parser.add_argument("--log-sample-rate", type=int,
+                        default=100,
+                        help="Log only one in every N per-tile INFO lines (Processing Task, Successfully wrote file). Set to 1 to log every tile. Warnings and errors are never sampled.")
     parser.add_argument("--version",
                         action="store_true",
                         default=False,
@@ -138,6 +363,48 @@ def get_parser():
     parser.add_argument("--processes_nb", "-p", type=int,
                         default=1,
                         help="The number of client processes that will upload the images of the ingest job.")
+    parser.add_argument("--threads-per-process", type=int,
+                        default=1,
+                        help="The number of threads in each client process that upload images concurrently. Tile processing runs serially for plugins that are not thread safe.")
+    parser.add_argument("--stage-workers", type=parse_stage_workers,
+                        default=None,
+                        help="Threads per pipeline stage in each client process, as comma separated stage=count pairs (stages: {}). e.g. read=2,encode=4".format(", ".join(STAGE_NAMES)))
+    parser.add_argument("--adaptive-concurrency", action="store_true",
+                        default=False,
+                        help="Adapt the number of concurrent uploads in each process between 1 and the number of upload threads, backing off when S3 throttles requests or latency rises.")
+    parser.add_argument("--max-upload-mbps", type=float,
+                        default=None,
+                        help="Cap on the combined upload bandwidth of all client processes on this node, in megabits per second.")
+    parser.add_argument("--summary-dir",
+                        default=None,
+                        help="Directory for the per-worker and merged JSON performance summaries. Defaults to a directory next to the log file.")
+    parser.add_argument("--metrics-file",
+                        default=None,
+                        help="Path of a file the master process keeps updated with live worker metrics in Prometheus text format.")
+    parser.add_argument("--metrics-port", type=int,
+                        default=None,
+                        help="If provided, serve live worker metrics in Prometheus text format over HTTP on this port.")
+    parser.add_argument("--metrics-host",
+                        default="127.0.0.1",
+                        help="Address the metrics HTTP endpoint binds to. Defaults to localhost only.")
+    parser.add_argument("--profile", action="store_true",
+                        default=False,
+                        help="Profile each worker with cProfile. Per-worker and merged .prof files are written to the summary directory.")
+    parser.add_argument("--memory-profile", type=float, nargs='?', const=60.0,
+                        default=None, metavar="SECONDS",
+                        help="Track each worker's memory with tracemalloc and RSS samples, every 60 seconds or the interval given. Growth is attributed to plugin, filesystem or engine code and the top allocators are added to the run summary. Slows uploads down.")
+    parser.add_argument("--prefork", action="store_true",
+                        default=False,
+                        help="Configure the job, set up the plugins and join once in the master process, then fork workers that inherit the ready engine. Cuts start-up time and calls to the Boss API with many processes. Needs the fork start method (e.g. Linux).")
+    parser.add_argument("--max-respawns", type=int,
+                        default=10,
+                        help="Number of times worker processes that crash or hang are replaced before the client carries on with fewer workers. 0 disables respawning.")
+    parser.add_argument("--task-deadline", type=float,
+                        default=1800,
+                        help="Seconds a worker may spend on a single tile in one pipeline stage (e.g. a read from a hung file system) before it is killed and replaced. 0 disables the watchdog.")
+    parser.add_argument("--record-trace",
+                        default=None,
+                        help="Directory to record the upload tasks each worker receives to, as NDJSON, so the run can be replayed offline with boss-ingest-replay.")
     parser.add_argument("config_file", nargs='?', help="Path to the ingest job configuration file")
 
     return parser
@@ -216,13 +483,16 @@ def main(configuration=None, parser_args=None):
                         filename=log_file,
                         filemode='a')
     logging.getLogger('ingest-client').addHandler(logging.StreamHandler(sys.stdout))
+    set_log_sampling(args.log_sample_rate)
 
-    # Create an engine instance
+    # Create an engine instance. Pre-forked workers inherit it, so it gets their upload threads
     try:
         engine = Engine(config_file=args.config_file, 
                         backend_api_token=args.api_token, 
                         ingest_job_id=args.job_id, 
-                        configuration=configuration)
+                        configuration=configuration,
+                        upload_threads=args.threads_per_process,
+                        stage_workers=args.stage_workers)
     except ConfigFileError as err:
         print("ERROR: {}".format(err))
         sys.exit(1)
@@ -285,19 +555,103 @@ def main(configuration=None, parser_args=None):
         # Join job
         engine.join()
 
+    # Workers write their performance summaries here, and they are merged once all workers have finished
+    summary_dir = args.summary_dir
+    if not summary_dir:
+        summary_dir = "{}_summary".format(os.path.splitext(log_file)[0])
+    if not os.path.exists(summary_dir):
+        os.makedirs(summary_dir)
+    if args.record_trace:
+        if not os.path.exists(args.record_trace):
+            os.makedirs(args.record_trace)
+        always_log_info("Recording upload task traces to {}".format(args.record_trace))
+
     # Create worker processes
+    workers_start_time = time.time()
     workers = []
-    for i in range(args.processes_nb):
-        new_pipe = mp.Pipe(False)
-        new_process = mp.Process(target=worker_process_run, 
+    metrics = MetricsAggregator()
+    collector = MetricsCollector(workers, metrics)
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = MetricsServer(metrics, args.metrics_port, args.metrics_host)
+
+    # A single token bucket in shared memory caps the upload bandwidth of all workers
+    bandwidth_limiter = None
+    if args.max_upload_mbps:
+        bandwidth_limiter = TokenBucket(mbps_to_bytes(args.max_upload_mbps))
+        always_log_info("Limiting uploads to {:.1f} Mbps".format(args.max_upload_mbps))
+
+    # Workers send their log records here, so only the master writes the log file and stdout
+    log_queue = mp.Queue()
+    log_listener = LogListener(log_queue)
+
+    # Credentials are refreshed once here and pushed to the workers
+    broker = CredentialBroker(engine, workers)
+
+    process_context = mp
+    prefork = False
+    if args.prefork:
+        fork_context = get_fork_context()
+        if fork_context is None:
+            logging.getLogger('ingest-client').warning("Pre-forked workers need the fork start method, which is not "
+                                                       "available on this platform. Each worker will configure "
+                                                       "itself and join the job.")
+        else:
+            process_context = fork_context
+            prefork = True
+            always_log_info("Forking workers from the configured engine")
+
+    def start_worker(worker_status):
+        new_pipe = mp.Pipe()
+        new_process = process_context.Process(target=worker_process_run, 
                                  args=(args.api_token, engine.ingest_job_id, new_pipe[0]),
-                                 kwargs={'config_file': args.config_file, 'configuration': configuration}
+                                 kwargs={'config_file': args.config_file,
+                                         'configuration': configuration,
+                                         'threads_per_process': args.threads_per_process,
+                                         'stage_workers': args.stage_workers,
+                                         'summary_dir': summary_dir,
+                                         'adaptive_concurrency': args.adaptive_concurrency,
+                                         'bandwidth_limiter': bandwidth_limiter,
+                                         'trace_dir': args.record_trace,
+                                         'profile': args.profile,
+                                         'memory_profile': args.memory_profile,
+                                         'log_queue': log_queue,
+                                         'engine': engine if prefork else None,
+                                         'worker_status': worker_status}
                                  )
-        workers.append((new_process, new_pipe[1]))
-        new_process.start()
+        if prefork:
+            # Replacement workers are forked while the credential broker runs. Don't fork a copy of the engine
+            # while the broker is part way through re-joining the job
+            with engine.credential_lock:
+                new_process.start()
+        else:
+            new_process.start()
+        return new_process, new_pipe[1]
+
+    # Replaces workers that crash, get killed, or stay stuck on a tile past the deadline
+    supervisor = WorkerSupervisor(workers, start_worker, max_respawns=args.max_respawns,
+                                  task_deadline=args.task_deadline or None, metrics=metrics)
 
-        # Sleep to slowly ramp up load on lambda
-        time.sleep(.5)
+    for i in range(args.processes_nb):
+        workers.append(supervisor.spawn())
+
+        if not args.adaptive_concurrency:
+            # Sleep to slowly ramp up load on lambda. Adaptive workers start with one upload at a time and ramp up
+            # on their own
+            time.sleep(.5)
+
+    # The helper threads start once the initial workers are running, so those are forked from a process without
+    # other threads that could be holding locks
+    collector.start()
+    if metrics_server:
+        metrics_server.start()
+        always_log_info("Serving live metrics at http://{}:{}/metrics".format(args.metrics_host, args.metrics_port))
+    log_listener.start()
+    broker.start()
+
+    if hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <master pid> makes every worker dump its stacks and sample what it is doing
+        forward_signal_to_workers(workers, signal.SIGUSR1)
 
     # Start the main process engine
     start_time = time.time()
@@ -305,7 +659,8 @@ def main(configuration=None, parser_args=None):
     job_complete = False
     while should_run:
         try:
-            engine.monitor(workers)
+            engine.monitor(workers, metrics=metrics, metrics_file=args.metrics_file,
+                           max_upload_mbps=args.max_upload_mbps, supervisor=supervisor)
             # run will end if no more jobs are available, join other processes
             should_run = False
             job_complete = True
@@ -324,14 +679,30 @@ def main(configuration=None, parser_args=None):
                     print("Enter 'y' or 'n' for 'yes' or 'no'")
 
             # notify the worker processes that they should stop execution
-            for _, worker_pipe in workers:
-                worker_pipe.send(should_run)
+            broker.broadcast(should_run)
 
     always_log_info("Waiting for worker processes to close...\n")
     time.sleep(1)  # Make sure workers have cleaned up
     for worker_process, worker_pipe in workers:
         worker_process.join()
+
+    broker.stop()
+    collector.stop()
+    log_listener.stop()
+    for _, worker_pipe in workers:
         worker_pipe.close()
+    if args.metrics_file:
+        metrics.write(args.metrics_file)
+    if metrics_server:
+        metrics_server.stop()
+
+    if supervisor.respawns or supervisor.hung or supervisor.crashed:
+        always_log_info("Worker processes crashed: {}, killed for hanging on a tile: {}, replaced: {}".format(
+            supervisor.crashed, supervisor.hung, supervisor.respawns))
+
+    write_run_summary(summary_dir, since=workers_start_time)
+    if args.profile:
+        merge_profiles(summary_dir, since=workers_start_time)
 
     if job_complete:
         # If auto-complete, mark the job as complete and cleanup
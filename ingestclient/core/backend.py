@@ -14,18 +14,129 @@
 
 import six
 from abc import ABCMeta, abstractmethod
-import requests
 import json
-import boto3
 import hashlib
 from six.moves import configparser
 import time
-import botocore
-from pkg_resources import resource_filename
+import botocore.exceptions
+import datetime
+import threading
 import os
+import logging
+from collections import deque
 
 from ..utils import WaitPrinter
 from ..utils.log import always_log_info
+from ..utils.errors import Backoff, classify_error, AUTH, PERMANENT
+from .local import LocalQueue, LocalBucket
+
+
+# Keys of the backend config section (or the join response) that set the Backend attribute of the same name
+AWS_SETTINGS = ("region", "s3_endpoint_url", "sqs_endpoint_url", "s3_addressing_style", "s3_use_accelerate_endpoint")
+
+
+def make_tile_key(project_info, resolution, x_index, y_index, z_index, t_index=0):
+    """A function to create a tile key.
+
+    The tile key is the key used for each individual tile file.
+
+    Args:
+        project_info(list): A list of strings containing the project/data model information for where data belongs
+        resolution(int): The level of the resolution hierarchy.  Typically 0
+        x_index(int): The x tile index
+        y_index(int): The y tile index
+        z_index(int): The z tile index
+        t_index(int): The time index
+
+    Returns:
+        (str): The object key to use for uploading to the tile bucket
+    """
+    proj_str = six.u("&".join([str(x) for x in project_info]))
+    base_key = six.u("{}&{}&{}&{}&{}&{}".format(proj_str, resolution, x_index, y_index, z_index, t_index))
+
+    hashm = hashlib.md5()
+    hashm.update(base_key.encode())
+
+    return six.u("{}&{}".format(hashm.hexdigest(), base_key))
+
+
+def make_chunk_key(num_tiles, project_info, resolution, x_index, y_index, z_index, t_index=0):
+    """A function to create a chunk key.
+
+    A "chunk" is the group of tiles that must be uploaded so a cuboid can be ingested.  The chunk key is used
+    to track all tiles in a given group.
+
+    Args:
+        num_tiles(int): The expected number of tiles in this chunk (in the z-dimension). Useful for forcing ingest of partial cuboids
+        project_info(list): A list of strings containing the project/data model information for where data belongs
+        resolution(int): The level of the resolution hierarchy.  Typically 0
+        x_index(int): The x tile index
+        y_index(int): The y tile index
+        z_index(int): The z tile index
+        t_index(int): The time index
+
+    Returns:
+        (str): The object key to use for uploading to the tile bucket
+    """
+    proj_str = six.u("&".join([str(x) for x in project_info]))
+    base_key = six.u("{}&{}&{}&{}&{}&{}&{}".format(num_tiles, proj_str,
+                                                   resolution, x_index, y_index, z_index, t_index))
+
+    hashm = hashlib.md5()
+    hashm.update(base_key.encode())
+
+    return six.u("{}&{}".format(hashm.hexdigest(), base_key))
+
+
+def parse_tile_key(key):
+    """A function to decode the tile key
+
+    The tile key is the key used for each individual tile file.
+
+    Args:
+        key(str): The key to decode
+
+    Returns:
+        (dict): A dictionary containing the components of the key
+    """
+    result = {}
+    parts = key.split('&')
+    result["collection"] = int(parts[1])
+    result["experiment"] = int(parts[2])
+    result["channel"] = int(parts[3])
+    result["resolution"] = int(parts[4])
+    result["x_index"] = int(parts[5])
+    result["y_index"] = int(parts[6])
+    result["z_index"] = int(parts[7])
+    result["t_index"] = int(parts[8])
+
+    return result
+
+
+def parse_chunk_key(key):
+    """A function to decode the chunk key
+
+    The tile key is the key used for each individual tile file.
+
+    Args:
+        key(str): The key to decode
+
+    Returns:
+        (dict): A dictionary containing the components of the key
+    """
+    result = {}
+    parts = key.split('&')
+    result["num_tiles"] = int(parts[1])
+    result["collection"] = int(parts[2])
+    result["experiment"] = int(parts[3])
+    result["channel"] = int(parts[4])
+    result["resolution"] = int(parts[5])
+    result["x_index"] = int(parts[6])
+    result["y_index"] = int(parts[7])
+    result["z_index"] = int(parts[8])
+    result["t_index"] = int(parts[9])
+
+    return result
 
 
 @six.add_metaclass(ABCMeta)
@@ -43,6 +154,36 @@ class Backend(object):
         self.queue = None
         self.s3 = None
         self.bucket = None
+        self.s3_client = None
+
+        # AWS connections share one long-lived session per process. Its credentials are refreshed in place, so
+        # clients and their warm connection pools survive credential renewals
+        self.session = None
+        self.region = "us-east-1"
+        # Alternative endpoints, e.g. VPC endpoints or local stand-ins for S3 and SQS. None uses the AWS default
+        self.s3_endpoint_url = None
+        self.sqs_endpoint_url = None
+        self.s3_addressing_style = None  # "auto", "virtual" or "path"
+        self.s3_use_accelerate_endpoint = False
+        self.configured_aws_settings = set()
+        self.credential_metadata = None
+        self.credential_lifetime = 3600  # Lifetime of the credentials issued for a job, in seconds
+        self._credential_lock = threading.Lock()
+
+        # Client settings. None keeps the botocore default
+        self.max_pool_connections = 10
+        self.retry_mode = None
+        self.max_attempts = None
+        self.connect_timeout = None
+        self.read_timeout = None
+
+        # Local buffer of prefetched upload tasks, stored as (message, time received) tuples
+        self.task_buffer = deque()
+        self.prefetch_size = 10  # SQS will return at most 10 messages per receive call
+        self.visibility_timeout = None
+        self.receive_wait_time = 20  # Long poll so an empty queue costs one request every 20 seconds
+        self.receive_backoff = Backoff()
+        self.stats = None  # Optional RunStats to count errors in, set by the engine
 
     @abstractmethod
     def setup(self):
@@ -149,39 +290,396 @@ class Backend(object):
         """
         return NotImplemented
 
-    def setup_upload_queue(self, credentials, upload_queue, region="us-east-1"):
+    def receive_task(self, num_messages=None, wait_time=None):
+        """
+        Method to get an upload task along with when it was received from the upload queue
+
+        Same as get_task(). A message may wait in the prefetch buffer for a while before it is returned, and its
+        visibility timeout runs from when it was received, not from when it left the buffer.
+
+        Args:
+            num_messages(int): Number of messages to prefetch when the buffer is empty. Defaults to prefetch_size
+            wait_time(int): Seconds to long poll if the queue is empty. Defaults to receive_wait_time
+
+        Returns:
+            (str, str, dict, float): message_id, receipt_handle, message contents, receive time
+        """
+        if num_messages is None:
+            num_messages = self.prefetch_size
+        num_messages = max(1, min(num_messages, 10))
+
+        self.expire_prefetched_tasks()
+
+        if not self.task_buffer:
+            while True:
+                try:
+                    self.fill_task_buffer(num_messages, wait_time)
+                    self.receive_backoff.success()
+                    break
+                except (botocore.exceptions.ClientError, botocore.exceptions.ConnectionError,
+                        botocore.exceptions.HTTPClientError) as e:
+                    error_class = classify_error(e)
+                    if self.stats:
+                        self.stats.increment("{}_errors".format(error_class))
+                    if error_class == PERMANENT:
+                        raise
+
+                    delay = self.receive_backoff.failure(error_class)
+                    if self.receive_backoff.exhausted(error_class):
+                        if error_class == AUTH:
+                            raise Exception("(pid={}) Credentials failed to be come valid".format(os.getpid()))
+                        raise
+                    logger = logging.getLogger('ingest-client')
+                    if error_class == AUTH:
+                        logger.warning("(pid={}) Waiting for credentials to be valid".format(os.getpid()))
+                    else:
+                        logger.warning("(pid={}) Failed to receive upload tasks ({} error), retrying in {:.1f}s: "
+                                       "{}".format(os.getpid(), error_class, delay, e))
+                    time.sleep(delay)
+
+        if self.task_buffer:
+            msg, receive_time = self.task_buffer.popleft()
+            return msg.message_id, msg.receipt_handle, json.loads(msg.body), receive_time
+        else:
+            return None, None, None, None
+
+    def setup_upload_queue(self, credentials, upload_queue, region=None):
         """
         Method to create a connection to the upload task queue
 
         Args:
             credentials(dict): AWS credentials
             upload_queue(str): The URL for the upload SQS queue
-            region(str): The AWS region where the SQS queue exists
+            region(str): The AWS region where the SQS queue exists. Defaults to the backend's region
+
+        Returns:
+            None
+
+        """
+        self.set_credentials(credentials)
+        if self.sqs is None:
+            region = region or self.region
+            self.sqs = self.get_session(region).resource('sqs', region_name=region, endpoint_url=self.sqs_endpoint_url,
+                                                         config=self.get_client_config())
+        if self.queue is None or self.queue.url != upload_queue:
+            self.queue = self.sqs.Queue(url=upload_queue)
+
+    def after_fork(self):
+        """
+        Method to drop the connections of a backend inherited from the master process, in a forked worker
+
+        Sockets and locks can't be shared between processes. Settings and credentials are kept, so
+        setup_upload_queue() and setup_tile_bucket() can connect again without joining the job.
+
+        Returns:
+            None
+        """
+        self._credential_lock = threading.Lock()
+        self.session = None
+        self.sqs = None
+        self.queue = None
+        self.s3 = None
+        self.bucket = None
+        self.s3_client = None
+        self.task_buffer = deque()
+        self.receive_backoff = Backoff()
+
+    def set_credentials(self, credentials):
+        """
+        Method to set the credentials used by every AWS connection of the backend
+
+        Args:
+            credentials(dict): AWS credentials, with "access_key", "secret_key" and optionally "session_token"
+
+        Returns:
+            None
+        """
+        expiry = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.credential_lifetime)
+        with self._credential_lock:
+            generation = self.credential_metadata["generation"] + 1 if self.credential_metadata else 0
+            self.credential_metadata = {"access_key": credentials["access_key"],
+                                        "secret_key": credentials["secret_key"],
+                                        "token": credentials.get("session_token"),
+                                        "expiry_time": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                        "generation": generation}
+
+    def get_credential_metadata(self):
+        """
+        Method to get the latest credentials in the form botocore's RefreshableCredentials expects, plus a
+        generation number that changes every time they are set
+
+        Returns:
+            (dict)
+        """
+        with self._credential_lock:
+            return dict(self.credential_metadata)
+
+    def get_credential_generation(self):
+        """
+        Method to get the generation number of the latest credentials, which changes every time they are set
+
+        Returns:
+            (int)
+        """
+        with self._credential_lock:
+            return self.credential_metadata["generation"]
+
+    def get_session(self, region=None):
+        """
+        Method to get the process wide boto3 session, created on first use
+
+        Its credentials are read from set_credentials() as soon as they change, so new credentials take effect
+        without creating new clients.
+
+        Args:
+            region(str): The default AWS region of the session. Defaults to the backend's region
+
+        Returns:
+            (boto3.session.Session)
+        """
+        if self.session is None:
+            from .session import create_session
+            self.session = create_session(self, region or self.region)
+        return self.session
+
+    def apply_aws_settings(self, settings, override=True):
+        """
+        Method to set the AWS region, endpoints, S3 addressing style and transfer acceleration
+
+        Only affects connections created afterwards, so it must be called before the first join.
+
+        Args:
+            settings(dict): Dictionary that may contain any of the keys in AWS_SETTINGS
+            override(bool): Flag indicating if settings from the backend config section should be replaced
+
+        Returns:
+            None
+        """
+        for key in AWS_SETTINGS:
+            if not override and key in self.configured_aws_settings:
+                continue
+            if settings.get(key) is not None:
+                setattr(self, key, settings[key])
+
+    def get_client_config(self, service=None):
+        """
+        Method to build the botocore client settings from the backend configuration
+
+        Args:
+            service(str): Name of the AWS service the client is for. S3 clients also get the addressing style and
+                          transfer acceleration settings
+
+        Returns:
+            (botocore.config.Config)
+        """
+        options = {"max_pool_connections": self.max_pool_connections}
+        if service == "s3":
+            s3_options = {}
+            if self.s3_addressing_style:
+                s3_options["addressing_style"] = self.s3_addressing_style
+            if self.s3_use_accelerate_endpoint:
+                s3_options["use_accelerate_endpoint"] = True
+            if s3_options:
+                options["s3"] = s3_options
+        if self.connect_timeout is not None:
+            options["connect_timeout"] = self.connect_timeout
+        if self.read_timeout is not None:
+            options["read_timeout"] = self.read_timeout
+        retries = {}
+        if self.retry_mode:
+            retries["mode"] = self.retry_mode
+        if self.max_attempts is not None:
+            retries["total_max_attempts"] = self.max_attempts
+        if retries:
+            options["retries"] = retries
+        import botocore.config
+        return botocore.config.Config(**options)
+
+    def update_credentials(self, credentials):
+        """
+        Method to switch the upload queue and tile bucket connections to new credentials
+
+        Existing clients pick up the new credentials on their next request, so calls already in progress on other
+        threads are not interrupted and connection pools stay warm.
+
+        Args:
+            credentials(dict): AWS credentials
+
+        Returns:
+            None
+        """
+        self.set_credentials(credentials)
+
+    def get_visibility_timeout(self):
+        """
+        Method to get the visibility timeout of the upload queue, looked up once and cached
+
+        Falls back to the SQS default of 30 seconds if the queue attributes cannot be read
+
+        Returns:
+            (int): The visibility timeout in seconds
+        """
+        if self.visibility_timeout is None:
+            try:
+                self.visibility_timeout = int(self.queue.attributes["VisibilityTimeout"])
+            except (botocore.exceptions.ClientError, KeyError, ValueError):
+                self.visibility_timeout = 30
+
+        return self.visibility_timeout
+
+    def fill_task_buffer(self, num_messages, wait_time=None):
+        """
+        Method to receive a batch of messages from the upload queue into the local prefetch buffer
+
+        Args:
+            num_messages(int): Maximum number of messages to receive (1-10)
+            wait_time(int): Seconds to long poll if the queue is empty. Defaults to receive_wait_time
+
+        Returns:
+            (int): The number of messages added to the buffer
+        """
+        if wait_time is None:
+            wait_time = self.receive_wait_time
+        msgs = self.queue.receive_messages(MaxNumberOfMessages=num_messages, WaitTimeSeconds=wait_time)
+        now = time.time()
+        for msg in msgs:
+            self.task_buffer.append((msg, now))
+
+        return len(msgs)
+
+    def get_queue_counts(self):
+        """
+        Method to get the approximate number of visible and in-flight messages in the upload queue
+
+        In-flight messages have been received by a worker but not yet deleted. They become visible again if that
+        worker fails to finish them before their visibility timeout.
+
+        Returns:
+            (dict): {"visible": int, "in_flight": int}, or None if the queue attributes could not be read
+        """
+        try:
+            response = self.sqs.meta.client.get_queue_attributes(
+                QueueUrl=self.queue.url,
+                AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"])
+            attributes = response["Attributes"]
+            return {"visible": int(attributes["ApproximateNumberOfMessages"]),
+                    "in_flight": int(attributes["ApproximateNumberOfMessagesNotVisible"])}
+        except (botocore.exceptions.ClientError, KeyError, ValueError):
+            return None
+
+    def expire_prefetched_tasks(self):
+        """
+        Method to release buffered messages whose visibility deadline is getting close
+
+        A message is released once half of the visibility timeout has elapsed since it was received, leaving the
+        other half for processing by whoever picks it up next.
+
+        Returns:
+            (int): The number of messages released
+        """
+        if not self.task_buffer:
+            return 0
+
+        max_age = self.get_visibility_timeout() / 2.0
+        now = time.time()
+        expired = []
+        fresh = deque()
+        for msg, receive_time in self.task_buffer:
+            if now - receive_time >= max_age:
+                expired.append(msg)
+            else:
+                fresh.append((msg, receive_time))
+
+        self.task_buffer = fresh
+        self.release_messages([msg.receipt_handle for msg in expired])
+        return len(expired)
+
+    def release_tasks(self):
+        """
+        Method to release all buffered messages back to the upload queue
+
+        Should be called when a worker stops so prefetched work is never silently held until the visibility timeout.
+
+        Returns:
+            (int): The number of messages released
+        """
+        receipt_handles = [msg.receipt_handle for msg, _ in self.task_buffer]
+        self.task_buffer.clear()
+        self.release_messages(receipt_handles)
+        return len(receipt_handles)
+
+    def release_messages(self, receipt_handles, delay=0):
+        """
+        Method to make messages visible again on the upload queue, so any worker can pick them up without waiting for
+        their visibility timeout
+
+        Args:
+            receipt_handles(list(str)): Receipt handles of the messages
+            delay(int): Seconds from now until the messages become visible. 0 releases them immediately
 
         Returns:
             None
+        """
+        failed = self.change_visibility(receipt_handles, delay)
+        if failed:
+            # The messages will still reappear once their visibility timeout expires
+            logger = logging.getLogger('ingest-client')
+            logger.warning("(pid={}) Failed to release {} messages".format(os.getpid(), len(failed)))
+
+    def change_visibility(self, receipt_handles, timeout):
+        """
+        Method to set the visibility timeout of messages received from the upload queue, in batches of 10
 
+        Args:
+            receipt_handles(list(str)): Receipt handles of the messages
+            timeout(int): Seconds from now until the messages become visible again
+
+        Returns:
+            (list(str)): Receipt handles that could not be changed, e.g. because the message was already deleted
         """
-        self.sqs = boto3.resource('sqs', region_name=region, aws_access_key_id=credentials["access_key"],
-                                  aws_secret_access_key=credentials["secret_key"])
-        self.queue = self.sqs.Queue(url=upload_queue)
+        failed = []
+        for start in range(0, len(receipt_handles), 10):
+            batch = receipt_handles[start:start + 10]
+            entries = [{"Id": str(idx),
+                        "ReceiptHandle": receipt_handle,
+                        "VisibilityTimeout": timeout} for idx, receipt_handle in enumerate(batch)]
+            try:
+                response = self.queue.change_message_visibility_batch(Entries=entries)
+            except botocore.exceptions.ClientError as e:
+                logger = logging.getLogger('ingest-client')
+                logger.debug("(pid={}) Failed to change message visibility: {}".format(os.getpid(), e))
+                failed.extend(batch)
+                continue
+
+            for entry in response.get("Failed", []):
+                failed.append(batch[int(entry["Id"])])
+
+        return failed
 
-    def setup_tile_bucket(self, credentials, tile_bucket, region="us-east-1"):
+    def setup_tile_bucket(self, credentials, tile_bucket, region=None):
         """
         Method to create a connection to the tile bucket
 
+        The underlying client is thread safe and its connection pool is sized by max_pool_connections, so it can be
+        shared by all upload threads in the process.
+
         Args:
             credentials(dict): AWS credentials
             tile_bucket(str): The name of the bucket
-            region(str): The AWS region where the SQS queue exists
+            region(str): The AWS region where the tile bucket exists. Defaults to the backend's region
 
         Returns:
             None
 
         """
-        self.s3 = boto3.resource('s3', region_name=region, aws_access_key_id=credentials["access_key"],
-                                 aws_secret_access_key=credentials["secret_key"])
-        self.bucket = self.s3.Bucket(tile_bucket)
+        self.set_credentials(credentials)
+        if self.s3 is None:
+            region = region or self.region
+            self.s3 = self.get_session(region).resource('s3', region_name=region, endpoint_url=self.s3_endpoint_url,
+                                                        config=self.get_client_config("s3"))
+            self.s3_client = self.s3.meta.client
+        if self.bucket is None or self.bucket.name != tile_bucket:
+            self.bucket = self.s3.Bucket(tile_bucket)
 
     @abstractmethod
     def encode_tile_key(self, project_info, resolution, x_index, y_index, z_index, t_index=0):
@@ -263,6 +761,8 @@ class Backend(object):
         """
         if backend_str == "BossBackend":
             return BossBackend(config_data)
+        elif backend_str == "LocalBackend":
+            return LocalBackend(config_data)
         else:
             return ValueError("Unsupported Backend: {}".format(backend_str))
 
@@ -284,6 +784,13 @@ class BossBackend(Backend):
         self.validate_ssl = True
         self.credential_timeout = 3300  # Currently credentials expire in 1 hr, so renew after 55 minutes
 
+        # Calls to the ingest service share a pooled HTTP session, created in setup()
+        self.api_session = None
+        self.api_connect_timeout = 10
+        self.api_read_timeout = 60
+        self.api_retries = 5
+        self.api_backoff_factor = 0.5
+
     def setup(self, api_token=None):
         """
         Method to configure the backend based on configuration parameters in the config file
@@ -297,6 +804,25 @@ class BossBackend(Backend):
         """
         self.host = "{}://{}".format(self.config["client"]["backend"]["protocol"],
                                      self.config["client"]["backend"]["host"])
+        self.prefetch_size = int(self.config["client"]["backend"].get("prefetch_size", self.prefetch_size))
+        self.receive_wait_time = int(self.config["client"]["backend"].get("receive_wait_time",
+                                                                          self.receive_wait_time))
+
+        # AWS client settings
+        backend_config = self.config["client"]["backend"]
+        self.max_pool_connections = int(backend_config.get("max_pool_connections", self.max_pool_connections))
+        self.retry_mode = backend_config.get("retry_mode", self.retry_mode)
+        self.max_attempts = backend_config.get("max_attempts", self.max_attempts)
+        self.connect_timeout = backend_config.get("connect_timeout", self.connect_timeout)
+        self.read_timeout = backend_config.get("read_timeout", self.read_timeout)
+        self.apply_aws_settings(backend_config)
+        self.configured_aws_settings = set(key for key in AWS_SETTINGS if key in backend_config)
+
+        # Ingest service settings
+        self.api_connect_timeout = backend_config.get("api_connect_timeout", self.api_connect_timeout)
+        self.api_read_timeout = backend_config.get("api_read_timeout", self.api_read_timeout)
+        self.api_retries = int(backend_config.get("api_retries", self.api_retries))
+        self.api_session = self.create_api_session()
 
         # If API token not provided, load API credentials from intern locations as needed.
         if not api_token:
@@ -320,6 +846,47 @@ class BossBackend(Backend):
         self.api_headers = {'Authorization': 'Token ' + api_token, 'Accept': 'application/json',
                             'content-type': 'application/json'}
 
+    def create_api_session(self):
+        """
+        Method to create the HTTP session used for all calls to the ingest service
+
+        Connections are kept alive and reused. Connection errors and 5xx responses are retried with exponential
+        backoff. Only idempotent requests are retried after they may have reached the server, so a job is never
+        created twice.
+
+        Returns:
+            (requests.Session)
+        """
+        # requests is only needed to talk to the Boss, so the LocalBackend never imports it
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(total=self.api_retries,
+                      backoff_factor=self.api_backoff_factor,
+                      status_forcelist=(500, 502, 503, 504),
+                      raise_on_status=False)
+        session = requests.Session()
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def after_fork(self):
+        """
+        Method to drop the connections of a backend inherited from the master process, in a forked worker
+
+        Returns:
+            None
+        """
+        Backend.after_fork(self)
+        if self.api_session is not None:
+            self.api_session = self.create_api_session()
+
+    @property
+    def api_timeout(self):
+        """(connect, read) timeout in seconds for calls to the ingest service, so a hung call can't block forever"""
+        return self.api_connect_timeout, self.api_read_timeout
+
     def create(self, config_dict):
         """
         Method to upload the config data to the backend to create an ingest job
@@ -333,8 +900,9 @@ class BossBackend(Backend):
 
         """
         always_log_info("Submitting ingest job configuration for creation...")
-        r = requests.post('{}/{}/ingest/'.format(self.host, self.api_version), json=config_dict,
-                          headers=self.api_headers, verify=self.validate_ssl)
+        r = self.api_session.post('{}/{}/ingest/'.format(self.host, self.api_version), json=config_dict,
+                                  headers=self.api_headers, verify=self.validate_ssl,
+                                  timeout=self.api_timeout)
 
         if r.status_code != 201:
             msg = r.json()
@@ -364,8 +932,9 @@ class BossBackend(Backend):
         """
         wp = WaitPrinter()
         while True:
-            r = requests.get('{}/{}/ingest/{}'.format(self.host, self.api_version, ingest_job_id),
-                             headers=self.api_headers, verify=self.validate_ssl)
+            r = self.api_session.get('{}/{}/ingest/{}'.format(self.host, self.api_version, ingest_job_id),
+                                     headers=self.api_headers, verify=self.validate_ssl,
+                                     timeout=self.api_timeout)
 
             if r.status_code != 200:
                 raise Exception("Failed to join ingest job: {}".format(r.text))
@@ -397,8 +966,10 @@ class BossBackend(Backend):
                     params["OBJECTIO_CONFIG"] = result["OBJECTIO_CONFIG"]
                     params["resource"] = result["resource"]
 
-                    self.setup_upload_queue(creds, queue, region="us-east-1")
-                    self.setup_tile_bucket(creds, tile_bucket, region="us-east-1")
+                    # The service may say where the queue and bucket live. Settings in the config file win
+                    self.apply_aws_settings(result, override=False)
+                    self.setup_upload_queue(creds, queue)
+                    self.setup_tile_bucket(creds, tile_bucket)
 
                     return job_status, creds, queue, tile_bucket, params, num_tiles
 
@@ -414,8 +985,9 @@ class BossBackend(Backend):
 
 
         """
-        r = requests.delete('{}/{}/ingest/{}'.format(self.host, self.api_version, ingest_job_id),
-                            headers=self.api_headers, verify=self.validate_ssl)
+        r = self.api_session.delete('{}/{}/ingest/{}'.format(self.host, self.api_version, ingest_job_id),
+                                    headers=self.api_headers, verify=self.validate_ssl,
+                                    timeout=self.api_timeout)
 
         if r.status_code != 204:
             raise Exception("Failed to cancel ingest job: {}".format(r.json()))
@@ -432,39 +1004,29 @@ class BossBackend(Backend):
 
 
         """
-        r = requests.post('{}/{}/ingest/{}/complete'.format(self.host, self.api_version, ingest_job_id),
-                          headers=self.api_headers, verify=self.validate_ssl)
+        r = self.api_session.post('{}/{}/ingest/{}/complete'.format(self.host, self.api_version, ingest_job_id),
+                                  headers=self.api_headers, verify=self.validate_ssl,
+                                  timeout=self.api_timeout)
 
         if r.status_code != 204:
             raise Exception("Failed to complete ingest job: {}".format(r.json()))
 
-    def get_task(self, num_messages=1):
+    def get_task(self, num_messages=None, wait_time=None):
         """
         Method to get an upload task
 
+        Messages are received from the upload queue in batches and held in a local prefetch buffer, so most calls do
+        not require a round trip to SQS.
+
         Args:
-            num_messages(int): Number of messages to pop off the upload task queue
+            num_messages(int): Number of messages to prefetch when the buffer is empty. Defaults to prefetch_size
+            wait_time(int): Seconds to long poll if the queue is empty. Defaults to receive_wait_time
 
         Returns:
             (str, str, dict): message_id, receipt_handle, message contents
         """
-        try_cnt = 0
-        while try_cnt < 19:
-            try:
-                msg = self.queue.receive_messages(MaxNumberOfMessages=1, WaitTimeSeconds=1)
-                break
-            except botocore.exceptions.ClientError as e:
-                print("(pid={}) Waiting for credentials to be valid".format(os.getpid()))
-                try_cnt += 1
-                time.sleep(15)
-
-                if try_cnt >= 20:
-                    raise Exception("(pid={}) Credentials failed to be come valid".format(os.getpid()))
-
-        if msg:
-            return msg[0].message_id, msg[0].receipt_handle, json.loads(msg[0].body)
-        else:
-            return None, None, None
+        message_id, receipt_handle, msg, _ = self.receive_task(num_messages, wait_time)
+        return message_id, receipt_handle, msg
 
     def get_job_status(self, ingest_job_id):
         """
@@ -476,8 +1038,9 @@ class BossBackend(Backend):
         Returns:
             (int)
         """
-        r = requests.get('{}/{}/ingest/{}/status'.format(self.host, self.api_version, ingest_job_id),
-                         headers=self.api_headers, verify=self.validate_ssl)
+        r = self.api_session.get('{}/{}/ingest/{}/status'.format(self.host, self.api_version, ingest_job_id),
+                                 headers=self.api_headers, verify=self.validate_ssl,
+                                 timeout=self.api_timeout)
 
         if r.status_code != 200:
             raise Exception("Failed to get ingest job status: {}".format(r.text))
@@ -500,13 +1063,7 @@ class BossBackend(Backend):
         Returns:
             (str): The object key to use for uploading to the tile bucket
         """
-        proj_str = six.u("&".join([str(x) for x in project_info]))
-        base_key = six.u("{}&{}&{}&{}&{}&{}".format(proj_str, resolution, x_index, y_index, z_index, t_index))
-
-        hashm = hashlib.md5()
-        hashm.update(base_key.encode())
-
-        return six.u("{}&{}".format(hashm.hexdigest(), base_key))
+        return make_tile_key(project_info, resolution, x_index, y_index, z_index, t_index)
 
     def encode_chunk_key(self, num_tiles, project_info, resolution, x_index, y_index, z_index, t_index=0):
         """A method to create a chunk key.
@@ -526,14 +1083,7 @@ class BossBackend(Backend):
         Returns:
             (str): The object key to use for uploading to the tile bucket
         """
-        proj_str = six.u("&".join([str(x) for x in project_info]))
-        base_key = six.u("{}&{}&{}&{}&{}&{}&{}".format(num_tiles, proj_str,
-                                                       resolution, x_index, y_index, z_index, t_index))
-
-        hashm = hashlib.md5()
-        hashm.update(base_key.encode())
-
-        return six.u("{}&{}".format(hashm.hexdigest(), base_key))
+        return make_chunk_key(num_tiles, project_info, resolution, x_index, y_index, z_index, t_index)
 
     def decode_tile_key(self, key):
         """A method to decode the tile key
@@ -546,18 +1096,7 @@ class BossBackend(Backend):
         Returns:
             (dict): A dictionary containing the components of the key
         """
-        result = {}
-        parts = key.split('&')
-        result["collection"] = int(parts[1])
-        result["experiment"] = int(parts[2])
-        result["channel"] = int(parts[3])
-        result["resolution"] = int(parts[4])
-        result["x_index"] = int(parts[5])
-        result["y_index"] = int(parts[6])
-        result["z_index"] = int(parts[7])
-        result["t_index"] = int(parts[8])
-
-        return result
+        return parse_tile_key(key)
 
     def decode_chunk_key(self, key):
         """A method to decode the chunk key
@@ -570,16 +1109,434 @@ class BossBackend(Backend):
         Returns:
             (dict): A dictionary containing the components of the key
         """
-        result = {}
-        parts = key.split('&')
-        result["num_tiles"] = int(parts[1])
-        result["collection"] = int(parts[2])
-        result["experiment"] = int(parts[3])
-        result["channel"] = int(parts[4])
-        result["resolution"] = int(parts[5])
-        result["x_index"] = int(parts[6])
-        result["y_index"] = int(parts[7])
-        result["z_index"] = int(parts[8])
-        result["t_index"] = int(parts[9])
-
-        return result
+        return parse_chunk_key(key)
+
+class LocalBackend(Backend):
+    def __init__(self, config):
+        """
+        A class to implement a backend that runs ingest jobs on the local machine, without a Boss server
+
+        Jobs are stored in directories under the "host" path of the backend config. Creating a job enumerates the
+        extent into a SQLite upload queue using the same keys and messages as the ingest service, and uploaded tiles
+        are written to a directory that acts as the tile bucket. Useful for testing and benchmarking the client.
+
+        Args:
+            config (dict): Dictionary of parameters from the "backend" section of the config file
+
+        """
+        Backend.__init__(self, config)
+        self.root = None
+        self.host = None
+        self.credential_timeout = 10 * 365 * 24 * 3600  # Local jobs don't have credentials that expire
+        self.receive_wait_time = 1  # A local queue is cheap to poll
+        self.queue_visibility_timeout = 30
+        self.tiles_per_chunk = 16  # Number of z slices in a chunk, as used by the ingest service
+
+    def setup(self, api_token=None):
+        """
+        Method to configure the backend based on configuration parameters in the config file
+
+        Args:
+            api_token(str): Not used
+
+        Returns:
+            None
+        """
+        backend_config = self.config["client"]["backend"]
+        self.root = os.path.abspath(os.path.expanduser(backend_config["host"]))
+        try:
+            os.makedirs(self.root)
+        except OSError:
+            # Already there, possibly created by another worker in the meantime
+            if not os.path.isdir(self.root):
+                raise
+        self.host = "file://{}".format(self.root)
+        self.prefetch_size = int(backend_config.get("prefetch_size", self.prefetch_size))
+        self.receive_wait_time = int(backend_config.get("receive_wait_time", self.receive_wait_time))
+
+    def get_job_dir(self, ingest_job_id):
+        """
+        Method to get the directory of an ingest job
+
+        Args:
+            ingest_job_id(int): The ID of the job
+
+        Returns:
+            (str)
+        """
+        return os.path.join(self.root, "ingest_{}".format(ingest_job_id))
+
+    def read_job(self, ingest_job_id):
+        """
+        Method to load the record of an ingest job
+
+        Args:
+            ingest_job_id(int): The ID of the job
+
+        Returns:
+            (dict)
+        """
+        try:
+            with open(os.path.join(self.get_job_dir(ingest_job_id), "job.json"), 'rt') as job_file:
+                return json.load(job_file)
+        except (IOError, OSError):
+            raise Exception("Ingest job {} not found in {}".format(ingest_job_id, self.root))
+
+    def write_job(self, ingest_job_id, job):
+        """
+        Method to save the record of an ingest job, replacing it atomically
+
+        Args:
+            ingest_job_id(int): The ID of the job
+            job(dict): The job record
+
+        Returns:
+            None
+        """
+        job_path = os.path.join(self.get_job_dir(ingest_job_id), "job.json")
+        temp_path = "{}.tmp{}".format(job_path, os.getpid())
+        with open(temp_path, 'wt') as job_file:
+            json.dump(job, job_file)
+        os.rename(temp_path, job_path)
+
+    def get_upload_queue(self, ingest_job_id):
+        """
+        Method to open the upload queue of an ingest job
+
+        Args:
+            ingest_job_id(int): The ID of the job
+
+        Returns:
+            (LocalQueue)
+        """
+        return LocalQueue(os.path.join(self.get_job_dir(ingest_job_id), "upload_queue.sqlite"),
+                          self.queue_visibility_timeout)
+
+    def generate_upload_tasks(self, ingest_job_id, config_dict, project_info):
+        """
+        Generator to enumerate the upload task messages of a job, in the order the ingest service creates them
+
+        Args:
+            ingest_job_id(int): The ID of the job
+            config_dict(dict): config data
+            project_info(list): Collection, experiment and channel of the job
+
+        Returns:
+            (generator(str)): JSON encoded messages
+        """
+        extent = config_dict["ingest_job"]["extent"]
+        tile_size = config_dict["ingest_job"]["tile_size"]
+        resolution = config_dict["ingest_job"]["resolution"]
+        queue_arn = "file://{}".format(self.get_job_dir(ingest_job_id))
+
+        for t in range(extent["t"][0], extent["t"][1]):
+            for z in range(extent["z"][0], extent["z"][1], self.tiles_per_chunk):
+                num_tiles = min(self.tiles_per_chunk, extent["z"][1] - z)
+                for y in range(extent["y"][0], extent["y"][1], tile_size["y"]):
+                    for x in range(extent["x"][0], extent["x"][1], tile_size["x"]):
+                        x_tile = x // tile_size["x"]
+                        y_tile = y // tile_size["y"]
+                        chunk_key = self.encode_chunk_key(num_tiles, project_info, resolution, x_tile, y_tile,
+                                                          z // self.tiles_per_chunk, t)
+                        for z_tile in range(z, z + num_tiles):
+                            tile_key = self.encode_tile_key(project_info, resolution, x_tile, y_tile, z_tile, t)
+                            yield json.dumps({"job_id": ingest_job_id,
+                                              "upload_queue_arn": queue_arn,
+                                              "ingest_queue_arn": queue_arn,
+                                              "chunk_key": chunk_key,
+                                              "tile_key": tile_key})
+
+    def generate_trace_tasks(self, ingest_job_id, trace):
+        """
+        Generator to build the upload task messages of a job from a recorded trace, in the order of the trace
+
+        Args:
+            ingest_job_id(int): The ID of the job
+            trace(list(dict)): Records with "tile_key" and "chunk_key" keys, see ingestclient.utils.trace
+
+        Returns:
+            (generator(str)): JSON encoded messages
+        """
+        queue_arn = "file://{}".format(self.get_job_dir(ingest_job_id))
+        for record in trace:
+            yield json.dumps({"job_id": ingest_job_id,
+                              "upload_queue_arn": queue_arn,
+                              "ingest_queue_arn": queue_arn,
+                              "chunk_key": record["chunk_key"],
+                              "tile_key": record["tile_key"]})
+
+    def create(self, config_dict, trace=None):
+        """
+        Method to create an ingest job and fill its upload queue
+
+        Args:
+            config_dict(dict): config data
+            trace(list(dict)): If provided, the upload tasks are taken from this recorded trace instead of the extent.
+                               Records with a "delay" key become visible that many seconds after the job is created
+
+        Returns:
+            (int): The returned ingest_job_id
+        """
+        # Take the next free job ID. makedirs fails if another process claimed it first
+        existing = [int(x.split("_")[1]) for x in os.listdir(self.root)
+                    if x.startswith("ingest_") and x.split("_")[1].isdigit()]
+        ingest_job_id = max(existing) + 1 if existing else 1
+        while True:
+            try:
+                os.makedirs(self.get_job_dir(ingest_job_id))
+                break
+            except OSError:
+                if not os.path.isdir(self.get_job_dir(ingest_job_id)):
+                    raise
+                ingest_job_id += 1
+
+        always_log_info("Creating local ingest job {} in {}...".format(ingest_job_id, self.root))
+        job = {"status": 0, "tile_count": 0, "tile_bucket_name": "tiles", "config": config_dict}
+        self.write_job(ingest_job_id, job)
+
+        # Project IDs are integers in tile keys. A local job has no project service, so every job uses the same ones
+        project_info = [1, 1, 1]
+        queue = self.get_upload_queue(ingest_job_id)
+        if trace is None:
+            job["tile_count"] = queue.send_messages(self.generate_upload_tasks(ingest_job_id, config_dict,
+                                                                               project_info))
+        else:
+            delays = None
+            if any("delay" in record for record in trace):
+                delays = [record.get("delay", 0) for record in trace]
+            job["tile_count"] = queue.send_messages(self.generate_trace_tasks(ingest_job_id, trace), delays)
+        job["status"] = 1
+        self.write_job(ingest_job_id, job)
+
+        return ingest_job_id
+
+    def join(self, ingest_job_id):
+        """
+        Method to join an ingest job upload
+
+        Job Status: {0: Preparing, 1: Uploading, 2: Complete, 3: Deleted}
+
+        Args:
+            ingest_job_id(int): The ID of the job you'd like to resume processing
+
+        Returns:
+            (int, dict, str, str, dict, int): The job status, AWS credentials, and SQS upload_job_queue,
+                                              tile bucket name, config_params to pass along during upload via metadata,
+                                              and tile count
+        """
+        wp = None
+        while True:
+            job = self.read_job(ingest_job_id)
+            if job["status"] == 3:
+                raise Exception("Failed to join ingest job: Ingest job {} was deleted".format(ingest_job_id))
+
+            if job["status"] != 0:
+                break
+            # Another process is still filling the upload queue
+            if wp is None:
+                wp = WaitPrinter()
+            wp.print_msg("(pid={}) Waiting for ingest job to be created".format(os.getpid()))
+            time.sleep(1)
+        if wp:
+            wp.finished()
+
+        creds = {"access_key": "local", "secret_key": "local"}
+        queue = "file://{}".format(os.path.join(self.get_job_dir(ingest_job_id), "upload_queue.sqlite"))
+        params = {"upload_queue": queue, "ingest_queue": queue}
+        self.setup_upload_queue(creds, queue)
+        self.setup_tile_bucket(creds, job["tile_bucket_name"])
+
+        return job["status"], creds, queue, job["tile_bucket_name"], params, job["tile_count"]
+
+    def setup_upload_queue(self, credentials, upload_queue, region=None):
+        """
+        Method to open the upload task queue
+
+        Args:
+            credentials(dict): Not used
+            upload_queue(str): The file:// URL of the queue database
+            region(str): Not used
+
+        Returns:
+            None
+        """
+        if self.queue is None or self.queue.url != upload_queue:
+            self.queue = LocalQueue(upload_queue[len("file://"):], self.queue_visibility_timeout)
+
+    def setup_tile_bucket(self, credentials, tile_bucket, region=None):
+        """
+        Method to open the tile bucket directory of the joined job. Must be called after setup_upload_queue
+
+        The bucket also stands in for the S3 client, and removes the upload task of each tile it stores
+
+        Args:
+            credentials(dict): Not used
+            tile_bucket(str): The name of the bucket
+            region(str): Not used
+
+        Returns:
+            None
+        """
+        path = os.path.join(os.path.dirname(self.queue.path), tile_bucket)
+        if self.bucket is None or self.bucket.path != path:
+            self.bucket = LocalBucket(tile_bucket, path, self.queue)
+            self.s3_client = self.bucket
+
+    def update_credentials(self, credentials):
+        """
+        Method to switch to new credentials. Local jobs don't use credentials, so there is nothing to do
+
+        Args:
+            credentials(dict): AWS credentials
+
+        Returns:
+            None
+        """
+        pass
+
+    def set_status(self, ingest_job_id, status):
+        """
+        Method to update the status of an ingest job
+
+        Args:
+            ingest_job_id(int): The ID of the job
+            status(int): The new status
+
+        Returns:
+            None
+        """
+        job = self.read_job(ingest_job_id)
+        job["status"] = status
+        self.write_job(ingest_job_id, job)
+
+    def cancel(self, ingest_job_id):
+        """
+        Method to cancel an ingest job, discarding any remaining upload tasks
+
+        Args:
+            ingest_job_id(int): The ID of the job you'd like to cancel
+
+        Returns:
+            None
+        """
+        self.set_status(ingest_job_id, 3)
+        self.get_upload_queue(ingest_job_id).purge()
+
+    def complete(self, ingest_job_id):
+        """
+        Method to complete an ingest job
+
+        Args:
+            ingest_job_id(int): The ID of the job you'd like to complete
+
+        Returns:
+            None
+        """
+        counts = self.get_upload_queue(ingest_job_id).get_counts()
+        if counts["visible"] or counts["in_flight"]:
+            raise Exception("Failed to complete ingest job: {} upload tasks remain".format(
+                counts["visible"] + counts["in_flight"]))
+        self.set_status(ingest_job_id, 2)
+
+    def get_job_status(self, ingest_job_id):
+        """
+        Method to get the job status
+
+        Args:
+            ingest_job_id(int): The ID of the job you'd like to resume processing
+
+        Returns:
+            (dict): The same counts as the ingest service, plus the number of in-flight tasks and stored tiles
+        """
+        job = self.read_job(ingest_job_id)
+        counts = self.get_upload_queue(ingest_job_id).get_counts()
+        bucket_path = os.path.join(self.get_job_dir(ingest_job_id), job["tile_bucket_name"])
+        uploaded = LocalBucket(job["tile_bucket_name"], bucket_path).count_objects()
+        return {"id": ingest_job_id,
+                "status": job["status"],
+                "total_message_count": job["tile_count"],
+                "current_message_count": counts["visible"],
+                "in_flight_message_count": counts["in_flight"],
+                "uploaded_tile_count": uploaded}
+
+    def get_queue_counts(self):
+        """
+        Method to get the number of visible and in-flight messages in the upload queue
+
+        Returns:
+            (dict): {"visible": int, "in_flight": int}
+        """
+        return self.queue.get_counts()
+
+    def get_task(self, num_messages=None, wait_time=None):
+        """
+        Method to get an upload task
+
+        Args:
+            num_messages(int): Number of messages to prefetch when the buffer is empty. Defaults to prefetch_size
+            wait_time(int): Seconds to wait if the queue is empty. Defaults to receive_wait_time
+
+        Returns:
+            (str, str, dict): message_id, receipt_handle, message contents
+        """
+        message_id, receipt_handle, msg, _ = self.receive_task(num_messages, wait_time)
+        return message_id, receipt_handle, msg
+
+    def encode_tile_key(self, project_info, resolution, x_index, y_index, z_index, t_index=0):
+        """
+        Method to create a tile key, in the same format as the ingest service
+
+        Args:
+            project_info(list): Collection, experiment and channel IDs
+            resolution(int): The level of the resolution hierarchy
+            x_index(int): The x tile index
+            y_index(int): The y tile index
+            z_index(int): The z tile index
+            t_index(int): The time index
+
+        Returns:
+            (str)
+        """
+        return make_tile_key(project_info, resolution, x_index, y_index, z_index, t_index)
+
+    def encode_chunk_key(self, num_tiles, project_info, resolution, x_index, y_index, z_index, t_index=0):
+        """
+        Method to create a chunk key, in the same format as the ingest service
+
+        Args:
+            num_tiles(int): The expected number of tiles in this chunk
+            project_info(list): Collection, experiment and channel IDs
+            resolution(int): The level of the resolution hierarchy
+            x_index(int): The x tile index
+            y_index(int): The y tile index
+            z_index(int): The z tile index
+            t_index(int): The time index
+
+        Returns:
+            (str)
+        """
+        return make_chunk_key(num_tiles, project_info, resolution, x_index, y_index, z_index, t_index)
+
+    def decode_tile_key(self, key):
+        """
+        Method to decode a tile key
+
+        Args:
+            key(str): The key to decode
+
+        Returns:
+            (dict): A dictionary containing the components of the key
+        """
+        return parse_tile_key(key)
+
+    def decode_chunk_key(self, key):
+        """
+        Method to decode a chunk key
+
+        Args:
+            key(str): The key to decode
+
+        Returns:
+            (dict): A dictionary containing the components of the key
+        """
+        return parse_chunk_key(key)
@@ -0,0 +1,137 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from contextlib import contextmanager
+import threading
+import logging
+import time
+import os
+
+
+class AIMDController(object):
+    def __init__(self, max_limit, min_limit=1, initial=None, increase=1, decrease=0.5, window=20,
+                 latency_factor=2.0, cooldown=2.0):
+        """
+        A class to adapt the number of concurrent uploads with additive increase, multiplicative decrease (AIMD)
+
+        Callers hold a slot while uploading. After every window of successful uploads the limit is raised by
+        `increase` if the limit was fully used and the window's p95 latency stayed within latency_factor times the
+        best p95 seen. Throttling responses, or p95 latency rising past that, multiply the limit by `decrease`.
+
+        Args:
+            max_limit (int): Upper bound on concurrent uploads, typically the number of upload threads
+            min_limit (int): Lower bound on concurrent uploads
+            initial (int): Starting limit. Defaults to min_limit, so load ramps up gradually
+            increase (int): Amount added to the limit after a good window
+            decrease (float): Factor the limit is multiplied by when backing off
+            window (int): Number of uploads per latency window
+            latency_factor (float): p95 latency growth over the baseline that is treated as congestion
+            cooldown (float): Minimum seconds between two decreases, so a burst of errors only counts once
+        """
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        if initial is None:
+            initial = self.min_limit
+        self.limit = float(max(self.min_limit, min(initial, self.max_limit)))
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+
+        self.active = 0
+        self.baseline = None
+        self.decreases = 0
+        self._samples = []
+        self._saturated = False
+        self._decrease_time = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Context manager to hold one of the concurrent upload slots, blocking until one is free"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self):
+        """Method to take an upload slot, blocking until one is free"""
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._saturated = True
+                self._condition.wait()
+            self.active += 1
+            if self.active >= int(self.limit):
+                self._saturated = True
+
+    def release(self):
+        """Method to give back an upload slot"""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def success(self, latency):
+        """
+        Method to record a successful upload
+
+        Args:
+            latency (float): Duration of the upload in seconds
+
+        Returns:
+            None
+        """
+        with self._condition:
+            self._samples.append(latency)
+            if len(self._samples) < self.window:
+                return
+
+            samples = sorted(self._samples)
+            p95 = samples[int(0.95 * (len(samples) - 1))]
+            saturated = self._saturated
+            self._samples = []
+            self._saturated = False
+
+            if self.baseline is not None and p95 > self.latency_factor * self.baseline:
+                self._decrease("p95 latency rose to {:.3f}s".format(p95))
+            elif saturated and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + self.increase)
+                self._condition.notify_all()
+
+            # Let the baseline drift up slowly so it follows long term changes instead of a single lucky window
+            if self.baseline is None or p95 < self.baseline:
+                self.baseline = p95
+            else:
+                self.baseline = 0.95 * self.baseline + 0.05 * p95
+
+    def throttled(self):
+        """Method to record a throttling response (e.g. SlowDown or 503)"""
+        with self._condition:
+            self._decrease("throttled")
+
+    def _decrease(self, reason):
+        """Method to cut the limit. Must be called with the condition held"""
+        now = time.time()
+        if now - self._decrease_time < self.cooldown:
+            return
+        self._decrease_time = now
+        self._samples = []
+        self._saturated = False
+        new_limit = max(self.min_limit, self.limit * self.decrease)
+        if new_limit < self.limit:
+            self.decreases += 1
+            logger = logging.getLogger('ingest-client')
+            logger.info("(pid={}) Reducing upload concurrency from {} to {} - {}".format(
+                os.getpid(), int(self.limit), int(new_limit), reason))
+        self.limit = new_limit
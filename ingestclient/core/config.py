@@ -17,12 +17,14 @@ from abc import ABCMeta, abstractmethod
 import six
 from six.moves import cPickle as pickle
 import importlib
-from pkg_resources import resource_filename
 import os
 
 from .validator import Validator
 from .backend import Backend
 
+# Located relative to the package rather than with pkg_resources, which is slow to import
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "schema")
+
 
 @six.python_2_unicode_compatible
 class ConfigPropertyObject(object):
@@ -381,7 +383,7 @@ class Configuration(object):
             schema_name = self.config_data['schema']['name']
         except KeyError as err:
             raise ConfigFileError("The specified schema was not found: {}. Try to update your ingest client library or double check your ingest job configuration file".format(self.config_data['schema']['name']))
-        with open(os.path.join(resource_filename("ingestclient", "schema"), "{}.json".format(schema_name)), 'rt') as schema_file:
+        with open(os.path.join(SCHEMA_DIR, "{}.json".format(schema_name)), 'rt') as schema_file:
             self.schema = json.load(schema_file)
 
     def load_plugins(self):
@@ -0,0 +1,117 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from ..utils.log import always_log_info
+import threading
+import datetime
+import logging
+import os
+
+
+class CredentialBroker(object):
+    def __init__(self, engine, workers, lead_time=300, check_interval=10):
+        """
+        A class to refresh the job's AWS credentials once in the master process and push them to the workers
+
+        Without it every worker joins the ingest job again when its credentials get old, so N workers make N
+        requests to the ingest service at roughly the same time and each rebuilds its connections. The broker
+        refreshes on a background thread ahead of the workers' own deadline and sends ("credentials", credentials)
+        over each worker's pipe.
+
+        All messages to the workers should go through broadcast() so they are not interleaved on a pipe.
+
+        Args:
+            engine (ingestclient.core.engine.Engine): The master process engine, already joined to the job
+            workers (list): List of (multiprocessing.Process, multiprocessing.Connection) tuples. Read on every
+                            broadcast, so workers added later are included
+            lead_time (float): Seconds before the engine's credential timeout to refresh
+            check_interval (float): Seconds between checks of the credential age
+        """
+        self.engine = engine
+        self.workers = workers
+        self.lead_time = lead_time
+        self.check_interval = check_interval
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Method to start the refresh thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="credential-broker")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to stop the refresh thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Thread main loop"""
+        logger = logging.getLogger('ingest-client')
+        while not self._stop.wait(self.check_interval):
+            if not self.refresh_due():
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                # Try again on the next check. Workers renew on their own if the broker falls too far behind
+                logger.warning("(pid={}) Failed to refresh credentials: {}".format(os.getpid(), e))
+
+    def refresh_due(self):
+        """
+        Method to check if the credentials should be refreshed
+
+        Returns:
+            (bool)
+        """
+        age = (datetime.datetime.now() - self.engine.credential_create_time).total_seconds()
+        return age >= self.engine.backend.credential_timeout - self.lead_time
+
+    def refresh(self):
+        """
+        Method to get new credentials and push them to every worker
+
+        Returns:
+            (int): Number of workers the credentials were sent to
+        """
+        self.engine.join()
+        sent = self.broadcast(("credentials", self.engine.credentials))
+        always_log_info("(pid={}) Credentials refreshed and sent to {} workers".format(os.getpid(), sent))
+        return sent
+
+    def broadcast(self, message):
+        """
+        Method to send a message to every running worker
+
+        Args:
+            message: The message to send
+
+        Returns:
+            (int): Number of workers the message was sent to
+        """
+        sent = 0
+        with self._send_lock:
+            for worker_process, worker_pipe in list(self.workers):
+                if not worker_process.is_alive():
+                    continue
+                try:
+                    worker_pipe.send(message)
+                    sent += 1
+                except (IOError, OSError, EOFError):
+                    # The worker exited between the check and the send
+                    pass
+        return sent
@@ -12,20 +12,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from six.moves import input
+from six.moves import queue
 import logging
 import datetime
 import json
 import time
-from ..utils.log import always_log_info
+from ..utils.log import always_log_info, SAMPLED
+from ..utils.metrics import RunStats
+from ..utils.memory import get_rss_bytes
+from ..utils.errors import Backoff, classify_error, get_error_code, PERMANENT, THROTTLING
+from timeit import default_timer as timer
 import os
 from math import floor
 import random
 from .config import Configuration, ConfigFileError
+from .heartbeat import VisibilityHeartbeat
+from .concurrency import AIMDController
+from .pipeline import Pipeline, Stage, StageAborted, UploadTask, RetryQueue, STAGE_NAMES
 from collections import deque
+import threading
 
 
 class Engine(object):
-    def __init__(self, config_file=None, backend_api_token=None, ingest_job_id=None, configuration=None):
+    def __init__(self, config_file=None, backend_api_token=None, ingest_job_id=None, configuration=None,
+                 upload_threads=1, stage_workers=None):
         """
         A class to implement the core upload client workflow engine
 
@@ -34,15 +44,27 @@ class Engine(object):
             ingest_job_id (int): ID of the ingest job you want to work on
             backend_api_token (str): The authorization token for the Backend if used
             configuration(ingestclient.core.config.Configuration): A pre-loaded configuration instance
+            upload_threads(int): Number of threads used to upload tiles concurrently
+            stage_workers(dict): Number of threads for each pipeline stage ("path", "read", "encode", "upload").
+                                 An "upload" entry overrides upload_threads
         """
         self.config = None
-        self.msg_wait_iterations = 20  # Each iteration waits for 10 seconds for incoming messages
+        # Consecutive empty receives before a worker gives up if it cannot confirm the job is drained. Each
+        # iteration long polls the queue and then backs off, from idle_backoff_min up to idle_backoff_max seconds
+        self.msg_wait_iterations = 6
+        self.idle_backoff_min = 1
+        self.idle_backoff_max = 30
+        self.completion_check_interval = 30
         self.backend = None
         self.validator = None
         self.tile_processor = None
         self.path_processor = None
         self.backend_api_token = backend_api_token
         self.credential_create_time = None
+        # If set, fresh credentials are pushed in with update_credentials() and run() only renews them itself if they
+        # are credential_grace seconds late, or after repeated auth errors
+        self.external_credentials = False
+        self.credential_grace = 240
 
         # Properties of ingest after creation
         self.credentials = None
@@ -56,6 +78,55 @@ class Engine(object):
         self.access_denied_count = 0
         self.invalid_access_key = False
         self.invalid_access_key_count = 0
+        self.stop_requested = False
+
+        # Concurrency within the process
+        self.stage_workers = dict((name, 1) for name in STAGE_NAMES)
+        self.stage_workers["upload"] = upload_threads
+        if stage_workers:
+            self.stage_workers.update(stage_workers)
+        self.upload_threads = self.stage_workers["upload"]
+        # Tile processors that aren't thread safe may share state between read() and encode(), so one lock covers both
+        self.tile_processor_lock = threading.Lock()
+        # Serializes joining the job and switching credentials, which the master's credential broker and monitor
+        # loop, or a worker's run loop and master listener, may do at the same time
+        self.credential_lock = threading.RLock()
+        self.pipeline = None
+
+        # Tasks that failed with a transient error are retried locally instead of waiting out the visibility timeout
+        self.retry_queue = RetryQueue()
+        self.heartbeat = None
+
+        # Paces uploads from all threads after throttling, auth or network errors
+        self.upload_backoff = Backoff()
+
+        # If set, the number of concurrent uploads adapts between 1 and the number of upload threads, backing off
+        # when S3 throttles or latency rises
+        self.adaptive_concurrency = False
+        self.upload_limiter = None
+
+        # Optional ingestclient.utils.bandwidth.TokenBucket shared with the other processes on the node
+        self.bandwidth_limiter = None
+
+        # Performance instrumentation. If summary_path is set, run() writes its statistics there as JSON when it ends
+        self.stats = RunStats()
+        self.summary_path = None
+
+        # If set, called from run() every metrics_interval seconds with a snapshot of the run statistics
+        self.metrics_callback = None
+        self.metrics_interval = 5
+
+        # Optional ingestclient.utils.trace.TraceRecorder that every received upload task is recorded to
+        self.trace_recorder = None
+
+        # Optional ingestclient.utils.profiling.RunProfiler that profiles the run loop and the pipeline stages
+        self.profiler = None
+
+        # Optional ingestclient.utils.memory.MemoryProfiler. Its report is added to the run statistics
+        self.memory_profiler = None
+
+        # Optional ingestclient.core.supervisor.WorkerStatus that the master's supervisor watches for hung tiles
+        self.worker_status = None
 
         if configuration:
             self.configure(configuration)
@@ -103,8 +174,9 @@ class Engine(object):
         self.config = configuration
         self.config.load_plugins()
 
-        # Get backend
+        # Get backend and size its connection pool so every upload thread can hold a connection
         self.backend = self.config.get_backend(self.backend_api_token)
+        self.backend.max_pool_connections = max(self.backend.max_pool_connections, self.upload_threads)
 
         # Get validator and set config
         self.validator = self.config.get_validator()
@@ -163,12 +235,57 @@ class Engine(object):
 
 
         """
-        self.job_status, self.credentials, self.upload_job_queue, self.tile_bucket, self.job_params, self.tile_count = self.backend.join(self.ingest_job_id)
+        with self.credential_lock:
+            self.job_status, self.credentials, self.upload_job_queue, self.tile_bucket, self.job_params, self.tile_count = self.backend.join(self.ingest_job_id)
 
-        # Set cred time
-        self.credential_create_time = datetime.datetime.now()
+            # Set cred time
+            self.credential_create_time = datetime.datetime.now()
         always_log_info("(pid={}) JOINED INGEST JOB: {}".format(os.getpid(), self.ingest_job_id))
 
+    def after_fork(self):
+        """
+        Method to prepare an engine built by the master process for running in a forked worker
+
+        Configuring, validating, setting up the plugins and joining the job are done once in the master. The worker
+        keeps all of it, including read-only plugin state, shared copy-on-write. Only what can't be shared between
+        processes is recreated: locks another master thread may have held at the fork, the run statistics, and the
+        AWS, HTTP and plugin connections.
+
+        Returns:
+            None
+        """
+        self.tile_processor_lock = threading.Lock()
+        self.credential_lock = threading.RLock()
+        self.retry_queue = RetryQueue()
+        self.upload_backoff = Backoff()
+        self.stats = RunStats()
+        self.stop_requested = False
+
+        self.backend.after_fork()
+        self.backend.setup_upload_queue(self.credentials, self.upload_job_queue)
+        self.backend.setup_tile_bucket(self.credentials, self.tile_bucket)
+        self.path_processor.after_fork()
+        self.tile_processor.after_fork()
+
+    def update_credentials(self, credentials):
+        """
+        Method to switch to credentials obtained elsewhere, e.g. by the master process, without joining the job again
+
+        Safe to call from another thread while run() is uploading.
+
+        Args:
+            credentials(dict): AWS credentials
+
+        Returns:
+            None
+        """
+        with self.credential_lock:
+            self.backend.update_credentials(credentials)
+            self.credentials = credentials
+            self.credential_create_time = datetime.datetime.now()
+        logger = logging.getLogger('ingest-client')
+        logger.info("(pid={}) Switched to refreshed credentials".format(os.getpid()))
+
     def cancel(self):
         """
         Method to cancel an ingest job
@@ -195,9 +312,17 @@ class Engine(object):
         """
         self.backend.complete(self.ingest_job_id)
 
-    def monitor(self, workers):
+    def monitor(self, workers, metrics=None, metrics_file=None, max_upload_mbps=None, supervisor=None):
         """Method to monitor the progress of the ingest job
 
+        Args:
+            workers(list): List of (multiprocessing.Process, multiprocessing.Connection) tuples for the worker processes
+            metrics(ingestclient.utils.metrics.MetricsAggregator): Live worker statistics. Job level gauges are added
+            metrics_file(str): If provided, the aggregated metrics are written here in Prometheus text format
+            max_upload_mbps(float): Bandwidth cap shared by the workers, reported next to the measured upload rate
+            supervisor(ingestclient.core.supervisor.WorkerSupervisor): If provided, crashed and hung workers are
+                                                                       replaced while monitoring
+
         Returns:
             None
         """
@@ -207,6 +332,8 @@ class Engine(object):
         start_time = time.time()
         print_time = time.time()
         avg_tile_rate = 0
+        last_bytes = 0
+        last_bytes_time = time.time()
         while True:
             total_seconds = (datetime.datetime.now() - self.credential_create_time).total_seconds()
             if total_seconds > self.backend.credential_timeout:
@@ -226,6 +353,12 @@ class Engine(object):
 
                 avg_tile_rate = sum(tile_rate_samples) / float(len(tile_rate_samples))
 
+                if metrics:
+                    metrics.set_gauge("upload_queue_messages", status["current_message_count"],
+                                      "Approximate number of upload tasks remaining in the queue")
+                    metrics.set_gauge("upload_queue_total_messages", status["total_message_count"],
+                                      "Total number of upload tasks in the ingest job")
+
             if (time.time() - print_time) > 30:
                 print_time = time.time()
                 # Print an update every 30 seconds
@@ -235,6 +368,15 @@ class Engine(object):
                         log_str += " - Approx {:d} of {:d} tiles remaining".format(status["current_message_count"],
                                                                                    status["total_message_count"])
                         log_str += " - Elapsed time {:.2f} minutes".format((time.time() - start_time) / 60)
+                        if metrics:
+                            summary = metrics.summary()
+                            log_str += " - Workers uploaded {} tiles ({:.1f} MB)".format(
+                                summary["counters"].get("tiles_uploaded", 0),
+                                summary["counters"].get("bytes_uploaded", 0) / 1e6)
+                            log_str += self.format_upload_rate(summary, last_bytes, last_bytes_time,
+                                                               max_upload_mbps, metrics)
+                            last_bytes = summary["counters"].get("bytes_uploaded", 0)
+                            last_bytes_time = time.time()
                         always_log_info(log_str)
                     else:
                         log_str = "Waiting to ensure all upload tasks have been processed. Just a few minutes longer..."
@@ -248,19 +390,62 @@ class Engine(object):
             # Wait to loop
             time.sleep(10)
 
+            if supervisor:
+                supervisor.check()
+
             # Check to see if worker processes have all ended
             alive_cnt = 0
             for worker in workers:
                 if worker[0].is_alive():
                     alive_cnt += 1
 
-            if alive_cnt == 0:
+            if metrics:
+                metrics.set_gauge("workers_alive", alive_cnt, "Number of worker processes still running")
+                if metrics_file:
+                    try:
+                        metrics.write(metrics_file)
+                    except (IOError, OSError) as e:
+                        logger.warning("Failed to write metrics file {}: {}".format(metrics_file, e))
+
+            if alive_cnt == 0 and not (supervisor and supervisor.waiting()):
                 # if no processes are alive you are done (or something broke)! Bail.
                 break
 
+    @staticmethod
+    def format_upload_rate(summary, last_bytes, last_bytes_time, max_upload_mbps=None, metrics=None):
+        """Method to describe the node's upload rate since the last report, relative to the bandwidth cap if set
+
+        Args:
+            summary(dict): Merged worker statistics
+            last_bytes(int): Bytes uploaded at the last report
+            last_bytes_time(float): Time of the last report
+            max_upload_mbps(float): Bandwidth cap, in megabits per second
+            metrics(ingestclient.utils.metrics.MetricsAggregator): If provided, the rate is also set as a gauge
+
+        Returns:
+            (str)
+        """
+        elapsed = time.time() - last_bytes_time
+        if elapsed <= 0:
+            return ""
+        mbps = (summary["counters"].get("bytes_uploaded", 0) - last_bytes) * 8 / 1e6 / elapsed
+        if metrics:
+            metrics.set_gauge("upload_megabits_per_second", mbps, "Upload rate of all workers on the node")
+
+        log_str = " - {:.1f} Mbps".format(mbps)
+        if max_upload_mbps:
+            log_str += " of {:.1f} Mbps cap ({:.0f}%)".format(max_upload_mbps, 100 * mbps / max_upload_mbps)
+            if mbps >= 0.9 * max_upload_mbps:
+                log_str += ", link-bound"
+        return log_str
+
     def run(self):
         """Method to run the upload loop
 
+        Tasks are received on the calling thread and handed to a pipeline of path, read, encode and upload stages.
+        Each stage runs on its own threads (see stage_workers) with a bounded queue in front of it, so a slow stage
+        only backs up the stages feeding it.
+
         Returns:
 
         """
@@ -288,94 +473,429 @@ class Engine(object):
         self.access_denied_count = 0
         self.invalid_access_key = False
         self.invalid_access_key_count = 0
+        self.stop_requested = False
+        self.stats = RunStats()
+        self.backend.stats = self.stats
+        self.upload_backoff = Backoff()
+        self.upload_limiter = None
+        if self.adaptive_concurrency:
+            self.upload_limiter = AIMDController(self.stage_workers["upload"])
+
+        if self.profiler:
+            self.profiler.start()
+        if self.memory_profiler:
+            self.memory_profiler.start()
+        self.pipeline = self.create_pipeline()
+        self.pipeline.start()
+        if self.worker_status:
+            self.worker_status.start(self.pipeline)
+        self.heartbeat = VisibilityHeartbeat(self.backend, self.stats)
+        self.heartbeat.start()
 
         wait_cnt = 0
-        while True:
-            if self.access_denied:
-                self.access_denied = False
-                self.credential_create_time = datetime.datetime.min
-            if self.invalid_access_key:
-                self.invalid_access_key = False
-                if self.invalid_access_key_count % 5 == 4:
-                    # We check for a few times before setting the credentials to be renewed
-                    # because it is possible these are new credentials that have not become valid yet.
-                    self.credential_create_time = datetime.datetime.min
-            # Check if you need to renew credentials
-            total_seconds = (datetime.datetime.now() - self.credential_create_time).total_seconds()
-            if total_seconds > self.backend.credential_timeout:
-                logger.warning("(pid={}) Credentials are expiring soon, attempting to renew credentials".format(
-                    os.getpid()))
-                self.join()
-                always_log_info("(pid={}) Credentials refreshed successfully".format(os.getpid()))
+        idle_wait = self.idle_backoff_min
+        completion_check_time = None
+        depth_log_time = time.time()
+        metrics_time = time.time()
+        try:
+            while not self.stop_requested:
+                # Feed failed tasks that are due for another attempt back in at the stage they failed
+                for task in self.retry_queue.pop_due():
+                    self.put_task(task, task.failed_stage)
 
-            # Get a task
-            message_id, receipt_handle, msg = self.backend.get_task()
+                if self.access_denied:
+                    self.access_denied = False
+                    self.credential_create_time = datetime.datetime.min
+                if self.invalid_access_key:
+                    self.invalid_access_key = False
+                    if self.invalid_access_key_count % 5 == 4:
+                        # We check for a few times before setting the credentials to be renewed
+                        # because it is possible these are new credentials that have not become valid yet.
+                        self.credential_create_time = datetime.datetime.min
+                # Check if you need to renew credentials
+                credential_timeout = self.backend.credential_timeout
+                if self.external_credentials:
+                    credential_timeout += self.credential_grace
+                total_seconds = (datetime.datetime.now() - self.credential_create_time).total_seconds()
+                if total_seconds > credential_timeout:
+                    logger.warning("(pid={}) Credentials are expiring soon, attempting to renew credentials".format(
+                        os.getpid()))
+                    self.join()
+                    always_log_info("(pid={}) Credentials refreshed successfully".format(os.getpid()))
+
+                if (time.time() - depth_log_time) > 30:
+                    depth_log_time = time.time()
+                    logger.info("(pid={}) Stage queue depths - {}".format(
+                        os.getpid(), " ".join("{}:{}".format(k, v) for k, v in self.pipeline.depths().items())))
+
+                if self.metrics_callback and (time.time() - metrics_time) > self.metrics_interval:
+                    metrics_time = time.time()
+                    self.push_metrics()
+
+                # Get a task
+                start = timer()
+                if len(self.retry_queue) > 0:
+                    # Don't long poll while retries are pending or they would be held up
+                    message_id, receipt_handle, msg, received_time = self.backend.receive_task(wait_time=1)
+                else:
+                    message_id, receipt_handle, msg, received_time = self.backend.receive_task()
+                self.stats.record("receive", timer() - start)
+
+                if not msg:
+                    self.stats.increment("empty_receives")
+                    if len(self.retry_queue) > 0:
+                        # Not idle while tasks are still waiting to be retried
+                        continue
+
+                    if completion_check_time is None or \
+                            (time.time() - completion_check_time) >= self.completion_check_interval:
+                        completion_check_time = time.time()
+                        drained = self.check_job_drained()
+                        if drained:
+                            always_log_info("(pid={}) Upload queue is drained. Worker finishing.".format(os.getpid()))
+                            break
+                        elif drained is False:
+                            # Work is still visible or in flight somewhere, so messages may reappear. Keep waiting
+                            wait_cnt = 0
+
+                    wait_cnt += 1
+                    if wait_cnt >= self.msg_wait_iterations:
+                        logger.warning("(pid={}) No upload tasks received after {} attempts. Worker finishing.".format(
+                            os.getpid(), wait_cnt))
+                        break
 
-            if not msg:
-                time.sleep(10)
-                wait_cnt += 1
-                if wait_cnt < self.msg_wait_iterations:
+                    time.sleep(idle_wait)
+                    idle_wait = min(idle_wait * 2, self.idle_backoff_max)
                     continue
-                else:
-                    break
-
-            wait_cnt = 0
-            key_parts = self.backend.decode_tile_key(msg['tile_key'])
-            logger.info("(pid={}) Processing Task -  X:{} Y:{} Z:{} T:{}".format(os.getpid(),
-                                                                                 key_parts["x_index"],
-                                                                                 key_parts["y_index"],
-                                                                                 key_parts["z_index"],
-                                                                                 key_parts["t_index"]))
-
-            # Call path processor
-            filename = self.path_processor.process(key_parts["x_index"],
-                                                   key_parts["y_index"],
-                                                   key_parts["z_index"],
-                                                   key_parts["t_index"])
-
-            # Call tile processor
-            handle = self.tile_processor.process(filename,
-                                                 key_parts["x_index"],
-                                                 key_parts["y_index"],
-                                                 key_parts["z_index"],
-                                                 key_parts["t_index"])
 
+                wait_cnt = 0
+                idle_wait = self.idle_backoff_min
+                completion_check_time = None
+                if self.trace_recorder:
+                    self.trace_recorder.record(msg)
+                task = UploadTask(message_id, receipt_handle, msg, received_time)
+                self.heartbeat.track(task)
+                self.put_task(task)
+        finally:
+            # Let in-flight tiles finish, unless the engine has been told to stop
+            self.pipeline.shutdown(drain=not self.stop_requested)
+            if self.worker_status:
+                self.worker_status.stop()
+            self.heartbeat.stop()
+
+            # Anything still waiting to be retried goes back to the queue for the next worker
+            held = self.retry_queue.pop_all()
+            if held:
+                for task in held:
+                    self.heartbeat.untrack(task)
+                self.backend.release_messages([task.receipt_handle for task in held])
+                self.stats.increment("released_tasks", len(held))
+                logger.info("(pid={}) Released {} failed tasks back to the upload queue".format(os.getpid(),
+                                                                                          len(held)))
+
+            # Hand any prefetched but unprocessed tasks back to the queue so other workers can pick them up
+            released = self.backend.release_tasks()
+            if released:
+                logger.info("(pid={}) Released {} prefetched tasks back to the upload queue".format(os.getpid(),
+                                                                                              released))
+
+            if self.upload_limiter:
+                self.stats.increment("concurrency_decreases", self.upload_limiter.decreases)
+                logger.info("(pid={}) Upload concurrency finished at {} of {} threads".format(
+                    os.getpid(), int(self.upload_limiter.limit), self.upload_limiter.max_limit))
+
+            self.stats.finish()
+            if self.profiler:
+                self.profiler.stop()
+            if self.memory_profiler:
+                self.stats.memory = self.memory_profiler.stop()
+            if self.trace_recorder:
+                self.trace_recorder.flush()
+            if self.metrics_callback:
+                self.push_metrics()
+            if self.summary_path:
+                try:
+                    self.stats.write(self.summary_path)
+                except (IOError, OSError) as e:
+                    logger.error("(pid={}) Failed to write run summary to {}: {}".format(os.getpid(),
+                                                                                         self.summary_path, e))
+
+    def check_job_drained(self):
+        """Method to check if every upload task in the job has been processed
+
+        The job is drained when the ingest service reports no remaining messages, the upload queue has no in-flight
+        messages that could reappear, and this worker has nothing left in its pipeline.
+
+        Returns:
+            (bool): True if drained, False if work remains, None if it could not be determined
+        """
+        logger = logging.getLogger('ingest-client')
+        if self.pipeline and self.pipeline.in_flight() > 0:
+            return False
+        if len(self.retry_queue) > 0:
+            return False
+
+        try:
+            status = self.backend.get_job_status(self.ingest_job_id)
+        except Exception as e:
+            logger.debug("(pid={}) Could not get the ingest job status: {}".format(os.getpid(), e))
+            return None
+
+        if not status or "current_message_count" not in status:
+            return None
+        if status["current_message_count"] > 0:
+            return False
+
+        counts = self.backend.get_queue_counts()
+        if counts is None:
+            return None
+        if counts["visible"] > 0 or counts["in_flight"] > 0:
+            return False
+
+        return True
+
+    def push_metrics(self):
+        """Method to send a snapshot of the run statistics to the metrics callback
+
+        Returns:
+            None
+        """
+        snapshot = self.stats.to_dict()
+        if self.pipeline:
+            snapshot["queue_depths"] = dict(self.pipeline.depths())
+        snapshot["gauges"] = {}
+        if self.upload_limiter:
+            snapshot["gauges"]["upload_concurrency"] = int(self.upload_limiter.limit)
+        if self.memory_profiler:
+            snapshot["gauges"]["rss_bytes"] = get_rss_bytes()
+        try:
+            self.metrics_callback(snapshot)
+        except Exception as e:
+            logger = logging.getLogger('ingest-client')
+            logger.warning("(pid={}) Failed to push metrics: {}".format(os.getpid(), e))
+
+    def put_task(self, task, stage=None):
+        """Method to feed a task into the pipeline, waiting while it is saturated
+
+        Prefetched messages keep ageing while the pipeline applies backpressure, so the ones close to their visibility
+        deadline are released back to the queue while waiting.
+
+        Args:
+            task(UploadTask): The task to process
+            stage(str): Name of the stage to start at. Defaults to the first stage
+
+        Returns:
+            None
+        """
+        while True:
             try:
-                metadata = {'chunk_key': msg['chunk_key'],
-                            'ingest_job': self.ingest_job_id,
-                            'parameters': self.job_params,
-                            }
-                handle.seek(0)
-                response = self.backend.bucket.put_object(ACL='private',
-                                                          Body=handle,
-                                                          Key=msg['tile_key'],
-                                                          Metadata={
-                                                              'message_id': message_id,
-                                                              'receipt_handle': receipt_handle,
-                                                              'metadata': json.dumps(metadata, separators=(',', ':'))
-                                                          },
-                                                          StorageClass='STANDARD')
-                logger.info("(pid={}) Successfully wrote file: {}".format(os.getpid(), response.key))
-
-            except Exception as e:
-                logger.error("(pid={}) Upload Failed -  X:{} Y:{} Z:{} T:{} - {}".format(os.getpid(),
-                                                                                         key_parts["x_index"],
-                                                                                         key_parts["y_index"],
-                                                                                         key_parts["z_index"],
-                                                                                         key_parts["t_index"],
-                                                                                         e))
-                if str(e).startswith("An error occurred (AccessDenied) when calling the PutObject operation"):
-                    self.access_denied = True
-                    self.access_denied_count += 1
-                    if self.access_denied_count >= 20:
-                        logger.error("(pid={}) failed 20 times with same error, breaking out of loop: {} ".format(
-                            os.getpid(), e))
-                        break
-                elif str(e).startswith("An error occurred (InvalidAccessKeyId) when calling the PutObject operation"):
-                    time.sleep(5)
-                    self.invalid_access_key = True
-                    self.invalid_access_key_count += 1
-                    if self.invalid_access_key_count >= 20:
-                        logger.error("(pid={}) failed 20 times with same error, breaking out of loop: {} ".format(
-                            os.getpid(), e))
-                        break
+                self.pipeline.put(task, stage, timeout=1)
+                return
+            except queue.Full:
+                self.backend.expire_prefetched_tasks()
+
+    def create_pipeline(self):
+        """Method to build the staged upload pipeline
+
+        Returns:
+            (ingestclient.core.pipeline.Pipeline)
+        """
+        handlers = {"path": self.resolve_path,
+                    "read": self.read_tile,
+                    "encode": self.encode_tile,
+                    "upload": self.upload_tile}
+        if self.profiler:
+            handlers = dict((name, self.profiler.wrap(handler)) for name, handler in handlers.items())
+        stages = [Stage(name, handlers[name], self.stage_workers.get(name, 1)) for name in STAGE_NAMES]
+        return Pipeline(stages, error_handler=self.task_failed)
+
+    def resolve_path(self, task):
+        """Pipeline stage to decode the tile key and compute the path to the source data
+
+        Args:
+            task(UploadTask): The task to process
+
+        Returns:
+            (UploadTask)
+        """
+        logger = logging.getLogger('ingest-client')
+        task.key_parts = self.backend.decode_tile_key(task.msg['tile_key'])
+        # Per-tile lines are formatted only if they pass the log level and sampling
+        logger.info("(pid=%s) Processing Task -  X:%s Y:%s Z:%s T:%s", os.getpid(), task.key_parts["x_index"],
+                    task.key_parts["y_index"], task.key_parts["z_index"], task.key_parts["t_index"], extra=SAMPLED)
+
+        # Call path processor
+        start = timer()
+        task.filename = self.path_processor.process(task.key_parts["x_index"],
+                                                    task.key_parts["y_index"],
+                                                    task.key_parts["z_index"],
+                                                    task.key_parts["t_index"])
+        self.stats.record("path", timer() - start)
+        return task
+
+    def read_tile(self, task):
+        """Pipeline stage to load the source data for a tile
+
+        Tile processors that are not thread safe are run serially.
+
+        Args:
+            task(UploadTask): The task to process
+
+        Returns:
+            (UploadTask)
+        """
+        start = timer()
+        if self.tile_processor.thread_safe:
+            task.data = self.tile_processor.read(task.filename,
+                                                 task.key_parts["x_index"],
+                                                 task.key_parts["y_index"],
+                                                 task.key_parts["z_index"],
+                                                 task.key_parts["t_index"])
+        else:
+            with self.tile_processor_lock:
+                task.data = self.tile_processor.read(task.filename,
+                                                     task.key_parts["x_index"],
+                                                     task.key_parts["y_index"],
+                                                     task.key_parts["z_index"],
+                                                     task.key_parts["t_index"])
+        self.stats.record("read", timer() - start)
+        return task
+
+    def encode_tile(self, task):
+        """Pipeline stage to encode tile data into a file handle for uploading
+
+        Args:
+            task(UploadTask): The task to process
+
+        Returns:
+            (UploadTask)
+        """
+        start = timer()
+        if self.tile_processor.thread_safe:
+            task.handle = self.tile_processor.encode(task.data)
+        else:
+            with self.tile_processor_lock:
+                task.handle = self.tile_processor.encode(task.data)
+        self.stats.record("encode", timer() - start)
+        task.data = None
+        return task
+
+    def upload_tile(self, task):
+        """Pipeline stage to put the tile in the tile bucket
+
+        Args:
+            task(UploadTask): The task to process
+
+        Returns:
+            None
+        """
+        logger = logging.getLogger('ingest-client')
+        key_parts = task.key_parts
+        try:
+            metadata = {'chunk_key': task.msg['chunk_key'],
+                        'ingest_job': self.ingest_job_id,
+                        'parameters': self.job_params,
+                        }
+            task.handle.seek(0, os.SEEK_END)
+            num_bytes = task.handle.tell()
+            task.handle.seek(0)
+            self.upload_backoff.wait()
+            if self.bandwidth_limiter:
+                self.stats.increment("bandwidth_wait_seconds", self.bandwidth_limiter.consume(num_bytes))
+            if self.upload_limiter:
+                self.upload_limiter.acquire()
+            try:
+                start = timer()
+                self.backend.s3_client.put_object(ACL='private',
+                                                  Body=task.handle,
+                                                  Bucket=self.tile_bucket,
+                                                  Key=task.msg['tile_key'],
+                                                  Metadata={
+                                                      'message_id': task.message_id,
+                                                      'receipt_handle': task.receipt_handle,
+                                                      'metadata': json.dumps(metadata, separators=(',', ':'))
+                                                  },
+                                                  StorageClass='STANDARD')
+                elapsed = timer() - start
+            finally:
+                if self.upload_limiter:
+                    self.upload_limiter.release()
+            self.stats.record("upload", elapsed)
+            if self.upload_limiter:
+                self.upload_limiter.success(elapsed)
+            self.stats.increment("tiles_uploaded")
+            self.stats.increment("bytes_uploaded", num_bytes)
+            self.upload_backoff.success()
+            if self.heartbeat:
+                self.heartbeat.untrack(task)
+            logger.info("(pid=%s) Successfully wrote file: %s", os.getpid(), task.msg['tile_key'], extra=SAMPLED)
+
+        except Exception as e:
+            self.stats.increment("upload_errors")
+            logger.error("(pid={}) Upload Failed -  X:{} Y:{} Z:{} T:{} - {}".format(os.getpid(),
+                                                                                     key_parts["x_index"],
+                                                                                     key_parts["y_index"],
+                                                                                     key_parts["z_index"],
+                                                                                     key_parts["t_index"],
+                                                                                     e))
+            error_class = classify_error(e)
+            code = get_error_code(e)
+            if code == "AccessDenied":
+                self.access_denied = True
+                self.access_denied_count += 1
+            elif code == "InvalidAccessKeyId":
+                self.invalid_access_key = True
+                self.invalid_access_key_count += 1
+
+            if error_class == THROTTLING and self.upload_limiter:
+                self.upload_limiter.throttled()
+            if error_class != PERMANENT:
+                # Slow down every upload thread, not just this one
+                self.upload_backoff.failure(error_class)
+                if self.upload_backoff.exhausted(error_class):
+                    logger.error("(pid={}) failed {} times in a row with {} errors, breaking out of loop: {} ".format(
+                        os.getpid(), self.upload_backoff.attempts[error_class], error_class, e))
+                    self.stop_requested = True
+            raise
+
+    def task_failed(self, task, stage, error):
+        """Method called when a pipeline stage raises an error for a task
+
+        Transient errors are retried locally, restarting at the failed stage, as long as the retry can happen well
+        within the message's visibility timeout. Otherwise the message is made visible on the upload queue again
+        right away so another worker can pick it up. Tasks that failed permanently are hidden for a full visibility
+        timeout instead, so a tile that can never succeed doesn't cycle straight through the workers until the
+        queue's redrive limit moves it to the dead letter queue.
+
+        Args:
+            task(UploadTask): The task that failed
+            stage(str): The name of the stage that failed
+            error(Exception): The error raised by the stage
+
+        Returns:
+            None
+        """
+        logger = logging.getLogger('ingest-client')
+        task.failed_stage = stage
+        error_class = None
+        if not isinstance(error, StageAborted):
+            error_class = classify_error(error)
+            self.stats.increment("{}_errors".format(error_class))
+
+        if error_class not in (None, PERMANENT) and not self.stop_requested:
+            delay = self.retry_queue.next_delay(task)
+            age = time.time() - task.received_time
+            if age + delay < self.backend.get_visibility_timeout() / 2 and self.retry_queue.add(task, delay):
+                self.stats.increment("retried_tasks")
+                logger.warning("(pid={}) Task failed in {} stage, retrying in {:.1f}s (attempt {}) - Key: {} - "
+                               "{}".format(os.getpid(), stage, delay, task.attempts, task.msg.get('tile_key'), error))
+                return
+
+        self.stats.increment("failed_tasks")
+        logger.error("(pid={}) Task failed in {} stage - Key: {} - {}".format(os.getpid(), stage,
+                                                                           task.msg.get('tile_key'), error))
+        if self.heartbeat:
+            self.heartbeat.untrack(task)
+        delay = self.backend.get_visibility_timeout() if error_class == PERMANENT else 0
+        self.backend.release_messages([task.receipt_handle], delay)
+        self.stats.increment("released_tasks")
@@ -0,0 +1,130 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import logging
+import time
+import os
+
+
+class VisibilityHeartbeat(object):
+    def __init__(self, backend, stats=None, interval=None):
+        """
+        A class to keep the upload queue messages of in-flight tasks hidden while they are being worked on
+
+        Slow tiles would otherwise become visible again once the visibility timeout expires and be processed a
+        second time by another worker. A background thread periodically extends the visibility of every tracked
+        message that has not been extended for a quarter of the visibility timeout.
+
+        Args:
+            backend (ingestclient.core.backend.Backend): The backend holding the upload queue
+            stats (ingestclient.utils.metrics.RunStats): Statistics to record extensions in
+            interval (float): Seconds between checks. Defaults to an eighth of the visibility timeout
+        """
+        self.backend = backend
+        self.stats = stats
+        self.interval = interval
+        self.tasks = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Method to start the heartbeat thread"""
+        if self.interval is None:
+            self.interval = max(1.0, self.backend.get_visibility_timeout() / 8.0)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="visibility-heartbeat")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to stop the heartbeat thread"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def track(self, task):
+        """
+        Method to start extending the visibility of a task's message
+
+        Args:
+            task (ingestclient.core.pipeline.UploadTask): The task
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.tasks[task.receipt_handle] = [task, time.time(), 0]
+
+    def untrack(self, task):
+        """
+        Method to stop extending the visibility of a task's message, once it is finished or released
+
+        Args:
+            task (ingestclient.core.pipeline.UploadTask): The task
+
+        Returns:
+            (int): Number of times the task's visibility was extended
+        """
+        with self._lock:
+            entry = self.tasks.pop(task.receipt_handle, None)
+        if entry is None:
+            return 0
+
+        if entry[2] and self.stats:
+            self.stats.increment("extended_tasks")
+        return entry[2]
+
+    def _run(self):
+        """Thread main loop"""
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+    def beat(self):
+        """
+        Method to extend the visibility of every tracked message that is due
+
+        Returns:
+            (int): Number of messages extended
+        """
+        logger = logging.getLogger('ingest-client')
+        timeout = self.backend.get_visibility_timeout()
+        now = time.time()
+        with self._lock:
+            due = [receipt_handle for receipt_handle, (_, last_extended, _) in self.tasks.items()
+                   if now - last_extended >= timeout / 4.0]
+        if not due:
+            return 0
+
+        failed = set(self.backend.change_visibility(due, timeout))
+        extended = 0
+        with self._lock:
+            for receipt_handle in due:
+                entry = self.tasks.get(receipt_handle)
+                if entry is None:
+                    continue
+                if receipt_handle in failed:
+                    # Most likely the message was already deleted once the tile was uploaded
+                    del self.tasks[receipt_handle]
+                    continue
+                entry[1] = now
+                entry[2] += 1
+                extended += 1
+
+        if self.stats and extended:
+            self.stats.increment("visibility_extensions", extended)
+        if failed:
+            logger.debug("(pid={}) Failed to extend visibility of {} messages".format(os.getpid(), len(failed)))
+        return extended
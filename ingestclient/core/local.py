@@ -0,0 +1,301 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import sqlite3
+import shutil
+import uuid
+import time
+import os
+
+
+class LocalMessage(object):
+    """Class to hold a message received from a LocalQueue, with the same attributes as a boto3 SQS Message"""
+    __slots__ = ("message_id", "receipt_handle", "body")
+
+    def __init__(self, message_id, receipt_handle, body):
+        self.message_id = message_id
+        self.receipt_handle = receipt_handle
+        self.body = body
+
+
+class LocalQueue(object):
+    def __init__(self, path, visibility_timeout=30):
+        """
+        A class to implement an upload task queue in a SQLite database
+
+        Supports the subset of the boto3 SQS Queue API used by Backend, so it can stand in for the upload queue.
+        Several processes can share the queue. Each process and thread opens its own connection to the database.
+
+        Args:
+            path (str): Path to the database file. Created if it does not exist
+            visibility_timeout (int): Seconds a received message stays hidden from other receivers
+        """
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+
+        connection = self.connect()
+        connection.execute("CREATE TABLE IF NOT EXISTS messages ("
+                           "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "message_id TEXT NOT NULL, "
+                           "body TEXT NOT NULL, "
+                           "visible_at REAL NOT NULL DEFAULT 0, "
+                           "receipt_handle TEXT, "
+                           "receive_count INTEGER NOT NULL DEFAULT 0)")
+        connection.execute("CREATE INDEX IF NOT EXISTS messages_visible ON messages (visible_at, id)")
+        connection.execute("CREATE INDEX IF NOT EXISTS messages_receipt ON messages (receipt_handle)")
+
+    @property
+    def url(self):
+        return "file://{}".format(self.path)
+
+    @property
+    def attributes(self):
+        return {"VisibilityTimeout": str(self.visibility_timeout)}
+
+    def connect(self):
+        """
+        Method to get the database connection of the calling process and thread
+
+        Returns:
+            (sqlite3.Connection)
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            # Autocommit mode, transactions are started explicitly where needed
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def send_messages(self, bodies, delays=None):
+        """
+        Method to add messages to the queue
+
+        Messages are received in the order they are sent, unless delays are given.
+
+        Args:
+            bodies (iterable(str)): Message bodies
+            delays (iterable(float)): Seconds to hide each message for after sending, like SQS DelaySeconds
+
+        Returns:
+            (int): Number of messages added
+        """
+        if delays is None:
+            rows = ((uuid.uuid4().hex, body, 0) for body in bodies)
+        else:
+            now = time.time()
+            rows = ((uuid.uuid4().hex, body, now + delay) for body, delay in zip(bodies, delays))
+
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.executemany("INSERT INTO messages (message_id, body, visible_at) VALUES (?, ?, ?)",
+                                            rows)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def receive_messages(self, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None):
+        """
+        Method to receive messages, hiding them from other receivers for the visibility timeout
+
+        Args:
+            MaxNumberOfMessages (int): Maximum number of messages to return
+            WaitTimeSeconds (float): Seconds to wait for a message if none are visible
+            VisibilityTimeout (int): Overrides the queue's visibility timeout
+
+        Returns:
+            (list(LocalMessage))
+        """
+        if VisibilityTimeout is None:
+            VisibilityTimeout = self.visibility_timeout
+        deadline = time.time() + WaitTimeSeconds
+        poll_interval = 0.05
+        while True:
+            msgs = self._claim(MaxNumberOfMessages, VisibilityTimeout)
+            if msgs or time.time() >= deadline:
+                return msgs
+            time.sleep(min(poll_interval, max(0, deadline - time.time())))
+            poll_interval = min(poll_interval * 2, 1.0)
+
+    def _claim(self, num_messages, visibility_timeout):
+        """Method to atomically mark up to num_messages visible messages as received"""
+        connection = self.connect()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute("SELECT id, message_id, body FROM messages WHERE visible_at <= ? "
+                                      "ORDER BY visible_at, id LIMIT ?", (now, num_messages)).fetchall()
+            msgs = []
+            for row_id, message_id, body in rows:
+                receipt_handle = uuid.uuid4().hex
+                connection.execute("UPDATE messages SET visible_at = ?, receipt_handle = ?, "
+                                   "receive_count = receive_count + 1 WHERE id = ?",
+                                   (now + visibility_timeout, receipt_handle, row_id))
+                msgs.append(LocalMessage(message_id, receipt_handle, body))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return msgs
+
+    def change_message_visibility_batch(self, Entries):
+        """
+        Method to change how long received messages stay hidden
+
+        Args:
+            Entries (list(dict)): Dictionaries with "Id", "ReceiptHandle" and "VisibilityTimeout" keys
+
+        Returns:
+            (dict): "Successful" and "Failed" lists of {"Id": ...}. A message fails if its receipt handle is no longer
+                    current, e.g. because it was deleted or received again
+        """
+        connection = self.connect()
+        now = time.time()
+        successful = []
+        failed = []
+        for entry in Entries:
+            cursor = connection.execute("UPDATE messages SET visible_at = ? WHERE receipt_handle = ?",
+                                        (now + entry["VisibilityTimeout"], entry["ReceiptHandle"]))
+            if cursor.rowcount:
+                successful.append({"Id": entry["Id"]})
+            else:
+                failed.append({"Id": entry["Id"]})
+        return {"Successful": successful, "Failed": failed}
+
+    def delete_message(self, receipt_handle):
+        """
+        Method to remove a received message from the queue
+
+        Args:
+            receipt_handle (str): Receipt handle of the message
+
+        Returns:
+            (bool): False if no message had that receipt handle
+        """
+        cursor = self.connect().execute("DELETE FROM messages WHERE receipt_handle = ?", (receipt_handle,))
+        return cursor.rowcount > 0
+
+    def get_counts(self):
+        """
+        Method to count the visible and in-flight messages
+
+        Returns:
+            (dict): {"visible": int, "in_flight": int}
+        """
+        visible, in_flight = self.connect().execute(
+            "SELECT COALESCE(SUM(visible_at <= ?), 0), COALESCE(SUM(visible_at > ?), 0) FROM messages",
+            (time.time(), time.time())).fetchone()
+        return {"visible": visible, "in_flight": in_flight}
+
+    def purge(self):
+        """Method to delete every message"""
+        self.connect().execute("DELETE FROM messages")
+
+
+class LocalBucket(object):
+    def __init__(self, name, path, queue=None):
+        """
+        A class to implement the tile bucket as a directory
+
+        Supports the subset of the boto3 S3 client API used by Engine, so it can stand in for both the tile bucket
+        and the S3 client. If a queue is given, the upload task of a tile is deleted from it once the tile has been
+        stored, like the ingest service does when a tile lands in the tile bucket.
+
+        Args:
+            name (str): Name of the bucket
+            path (str): Directory the objects are stored in. Created if it does not exist
+            queue (LocalQueue): The upload task queue
+        """
+        self.name = name
+        self.path = path
+        self.queue = queue
+        try:
+            os.makedirs(path)
+        except OSError:
+            # Another worker joining the job may have created it first
+            if not os.path.isdir(path):
+                raise
+
+    def get_path(self, key):
+        """
+        Method to get the file an object is stored in
+
+        Args:
+            key (str): The object key
+
+        Returns:
+            (str)
+        """
+        return os.path.join(self.path, key.replace("/", "%2F"))
+
+    def put_object(self, Key, Body, Bucket=None, Metadata=None, **kwargs):
+        """
+        Method to store an object
+
+        Args:
+            Key (str): The object key
+            Body: File-like object or bytes with the object data
+            Bucket (str): Name of the bucket. Must match this bucket if provided
+            Metadata (dict): Object metadata. If it contains the receipt_handle of an upload task, the task is deleted
+            **kwargs: Other put_object arguments, which are ignored
+
+        Returns:
+            (dict)
+        """
+        if Bucket is not None and Bucket != self.name:
+            raise ValueError("Unknown bucket: {}".format(Bucket))
+
+        file_path = self.get_path(Key)
+        temp_path = "{}.tmp{}.{}".format(file_path, os.getpid(), threading.current_thread().ident)
+        with open(temp_path, 'wb') as file_handle:
+            if hasattr(Body, "read"):
+                shutil.copyfileobj(Body, file_handle)
+            else:
+                file_handle.write(Body)
+        os.rename(temp_path, file_path)
+
+        if self.queue and Metadata and "receipt_handle" in Metadata:
+            self.queue.delete_message(Metadata["receipt_handle"])
+        return {}
+
+    def get_object(self, Key, Bucket=None):
+        """
+        Method to read an object
+
+        Args:
+            Key (str): The object key
+            Bucket (str): Name of the bucket. Must match this bucket if provided
+
+        Returns:
+            (dict): {"Body": open file handle, "ContentLength": int}
+        """
+        if Bucket is not None and Bucket != self.name:
+            raise ValueError("Unknown bucket: {}".format(Bucket))
+        file_path = self.get_path(Key)
+        return {"Body": open(file_path, 'rb'), "ContentLength": os.path.getsize(file_path)}
+
+    def count_objects(self):
+        """
+        Method to count the objects in the bucket
+
+        Returns:
+            (int)
+        """
+        return len([x for x in os.listdir(self.path) if ".tmp" not in x])
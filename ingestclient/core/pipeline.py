@@ -0,0 +1,378 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from six.moves import queue
+from collections import OrderedDict
+import threading
+import logging
+import random
+import heapq
+import time
+import os
+
+
+# Order of the stages a tile passes through after its message is received
+STAGE_NAMES = ("path", "read", "encode", "upload")
+
+
+class UploadTask(object):
+    """Class to carry a single tile through the upload pipeline"""
+    __slots__ = ("message_id", "receipt_handle", "msg", "key_parts", "filename", "data", "handle",
+                 "received_time", "attempts", "failed_stage")
+
+    def __init__(self, message_id, receipt_handle, msg, received_time=None):
+        """
+
+        Args:
+            message_id(str): The SQS message ID of the task
+            receipt_handle(str): The SQS receipt handle of the task
+            msg(dict): The task message, containing the tile and chunk keys
+            received_time(float): When the message was received from SQS, which starts its visibility timeout.
+                                  Defaults to now
+        """
+        self.message_id = message_id
+        self.receipt_handle = receipt_handle
+        self.msg = msg
+        self.key_parts = None
+        self.filename = None
+        self.data = None
+        self.handle = None
+        self.received_time = received_time if received_time is not None else time.time()
+        self.attempts = 0
+        self.failed_stage = None
+
+
+class RetryQueue(object):
+    def __init__(self, max_size=100, max_attempts=3, base_delay=1.0, max_delay=30.0):
+        """
+        A class to hold failed tasks locally until they are due to be retried
+
+        Delays grow exponentially with the number of attempts and are jittered so tasks that failed together (e.g.
+        during a network blip) are not all retried at the same moment.
+
+        Args:
+            max_size (int): Maximum number of tasks held. Further failures are not retried locally
+            max_attempts (int): Maximum number of retries for a single task
+            base_delay (float): Delay before the first retry, in seconds
+            max_delay (float): Upper bound on the delay, in seconds
+        """
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def next_delay(self, task):
+        """
+        Method to compute the delay before the next retry of a task
+
+        Args:
+            task (UploadTask): The task
+
+        Returns:
+            (float): Delay in seconds
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** task.attempts)
+        return delay * random.uniform(0.5, 1.0)
+
+    def add(self, task, delay=None):
+        """
+        Method to schedule a task to be retried
+
+        Args:
+            task (UploadTask): The task to retry
+            delay (float): Seconds to wait before the retry. Defaults to next_delay(task)
+
+        Returns:
+            (bool): False if the task could not be scheduled because the queue is full or it has no attempts left
+        """
+        if delay is None:
+            delay = self.next_delay(task)
+
+        with self._lock:
+            if len(self._heap) >= self.max_size or task.attempts >= self.max_attempts:
+                return False
+            task.attempts += 1
+            # The counter breaks ties so tasks themselves never need to be compared
+            self._count += 1
+            heapq.heappush(self._heap, (time.time() + delay, self._count, task))
+        return True
+
+    def pop_due(self):
+        """
+        Method to remove and return all tasks that are due to be retried
+
+        Returns:
+            (list(UploadTask))
+        """
+        now = time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def pop_all(self):
+        """
+        Method to remove and return all held tasks, whether due or not
+
+        Returns:
+            (list(UploadTask))
+        """
+        with self._lock:
+            tasks = [x[2] for x in self._heap]
+            self._heap = []
+        return tasks
+
+
+class Stage(object):
+    def __init__(self, name, handler, num_workers=1, max_pending=None):
+        """
+        A class to run one step of the upload pipeline on its own pool of threads
+
+        Items wait in a bounded queue in front of the stage. Putting an item blocks while the queue is full, which
+        caps the number of tiles in flight per stage and pushes back on the stages feeding it.
+
+        Args:
+            name (str): Name of the stage, used for logging and queue depth reporting
+            handler (callable): Function called with an item. Returns the item to pass on, or None to drop it
+            num_workers (int): Number of threads running the stage
+            max_pending (int): Maximum number of items waiting for the stage. Defaults to 2 * num_workers
+        """
+        self.name = name
+        self.handler = handler
+        self.num_workers = max(1, num_workers)
+        if max_pending is None:
+            max_pending = 2 * self.num_workers
+        self.input = queue.Queue(maxsize=max_pending)
+        self.next_stage = None
+        self.error_handler = None
+        self.aborted = False
+        self.active = 0
+        # Thread ID to the time it started running the handler on its current item
+        self.started = {}
+        self.threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Method to start the stage threads"""
+        for idx in range(self.num_workers):
+            thread = threading.Thread(target=self._work, name="{}-{}".format(self.name, idx))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _work(self):
+        """Thread main loop. Handles items until the shutdown sentinel is received"""
+        logger = logging.getLogger('ingest-client')
+        thread_id = threading.current_thread().ident
+        while True:
+            item = self.input.get()
+            if item is None:
+                return
+
+            with self._lock:
+                self.active += 1
+                self.started[thread_id] = time.time()
+            try:
+                if self.aborted:
+                    raise StageAborted("Pipeline stopped before stage '{}' ran".format(self.name))
+                result = self.handler(item)
+                # Waiting for room in the next stage under backpressure isn't time spent on the item
+                self._handled(thread_id)
+                if result is not None and self.next_stage:
+                    self.next_stage.put(result)
+            except Exception as e:
+                self._handled(thread_id)
+                if self.error_handler:
+                    try:
+                        self.error_handler(item, self.name, e)
+                    except Exception as handler_error:
+                        logger.error("(pid={}) Error handler failed in stage '{}': {}".format(os.getpid(), self.name,
+                                                                                            handler_error))
+                else:
+                    logger.error("(pid={}) Unhandled error in stage '{}': {}".format(os.getpid(), self.name, e))
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def _handled(self, thread_id):
+        """Method to record that a thread has finished running the handler on its current item"""
+        with self._lock:
+            self.started.pop(thread_id, None)
+
+    def put(self, item, timeout=None):
+        """
+        Method to queue an item for the stage, blocking while the stage is saturated
+
+        Args:
+            item: The item to handle
+            timeout (float): Seconds to wait for room. Waits indefinitely if None
+
+        Returns:
+            None
+
+        Raises:
+            (queue.Full): If the stage is still saturated after timeout seconds
+        """
+        self.input.put(item, timeout=timeout)
+
+    def depth(self):
+        """
+        Method to get the approximate number of items waiting for the stage
+
+        Returns:
+            (int)
+        """
+        return self.input.qsize()
+
+    def in_flight(self):
+        """
+        Method to get the approximate number of items waiting for or being handled by the stage
+
+        Returns:
+            (int)
+        """
+        return self.input.qsize() + self.active
+
+    def oldest_start(self):
+        """
+        Method to get when the longest running item currently being handled by the stage started
+
+        Returns:
+            (float): Start time in seconds since the epoch, or None if no item is being handled
+        """
+        with self._lock:
+            return min(self.started.values()) if self.started else None
+
+    def stop(self):
+        """Method to stop the stage threads once all queued items have been handled"""
+        for _ in self.threads:
+            self.input.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+
+class StageAborted(Exception):
+    """Custom error passed to the error handler for items dropped because the pipeline is stopping"""
+    pass
+
+
+class Pipeline(object):
+    def __init__(self, stages, error_handler=None):
+        """
+        A class to chain stages together with bounded queues between them
+
+        Args:
+            stages (list(Stage)): The stages, in the order items pass through them
+            error_handler (callable): Function called with (item, stage_name, exception) when a stage fails on an item
+        """
+        self.stages = stages
+        for stage, next_stage in zip(stages[:-1], stages[1:]):
+            stage.next_stage = next_stage
+        for stage in stages:
+            stage.error_handler = error_handler
+
+    def start(self):
+        """Method to start all stages"""
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item, stage=None, timeout=None):
+        """
+        Method to feed an item into the pipeline, blocking while the stage is saturated
+
+        Args:
+            item: The item to process
+            stage (str): Name of the stage to start at. Defaults to the first stage
+            timeout (float): Seconds to wait for room. Waits indefinitely if None
+
+        Returns:
+            None
+
+        Raises:
+            (queue.Full): If the stage is still saturated after timeout seconds
+        """
+        if stage is None:
+            self.stages[0].put(item, timeout)
+        else:
+            self.get_stage(stage).put(item, timeout)
+
+    def get_stage(self, name):
+        """
+        Method to look up a stage by name
+
+        Args:
+            name (str): Name of the stage
+
+        Returns:
+            (Stage)
+        """
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError("No pipeline stage named '{}'".format(name))
+
+    def depths(self):
+        """
+        Method to get the number of items waiting in front of each stage
+
+        Returns:
+            (OrderedDict): Stage name to queue depth
+        """
+        return OrderedDict((stage.name, stage.depth()) for stage in self.stages)
+
+    def in_flight(self):
+        """
+        Method to get the total number of items anywhere in the pipeline
+
+        Returns:
+            (int)
+        """
+        return sum(stage.in_flight() for stage in self.stages)
+
+    def oldest_start(self):
+        """
+        Method to get when the longest running item currently being handled by any stage started
+
+        Returns:
+            (float): Start time in seconds since the epoch, or None if every stage is idle
+        """
+        started = [x for x in (stage.oldest_start() for stage in self.stages) if x is not None]
+        return min(started) if started else None
+
+    def shutdown(self, drain=True):
+        """
+        Method to stop the pipeline
+
+        Stages are stopped in order so every item already accepted reaches the end of the pipeline. If drain is
+        False, items that have not started a stage yet are passed to the error handler instead of being processed.
+
+        Args:
+            drain (bool): Flag indicating if queued items should still be processed
+
+        Returns:
+            None
+        """
+        if not drain:
+            for stage in self.stages:
+                stage.aborted = True
+
+        for stage in self.stages:
+            stage.stop()
@@ -0,0 +1,85 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import boto3.session
+import botocore.session
+import botocore.credentials
+import dateutil.parser
+
+
+class BackendCredentials(botocore.credentials.RefreshableCredentials):
+    def __init__(self, backend):
+        """
+        A class to feed the credentials set on a backend to botocore
+
+        Botocore only refreshes credentials as they approach their expiry time. These are also refreshed as soon as
+        new credentials are set on the backend, e.g. after joining the job again or being pushed by the master.
+
+        Args:
+            backend (Backend): The backend holding the credentials
+        """
+        self.backend = backend
+        metadata = backend.get_credential_metadata()
+        self.generation = metadata["generation"]
+        super(BackendCredentials, self).__init__(metadata["access_key"], metadata["secret_key"], metadata["token"],
+                                                 dateutil.parser.parse(metadata["expiry_time"]),
+                                                 self.fetch, "ingest-client")
+
+    def fetch(self):
+        """Method called by botocore to get the latest credentials"""
+        metadata = self.backend.get_credential_metadata()
+        self.generation = metadata["generation"]
+        return metadata
+
+    def refresh_needed(self, refresh_in=None):
+        if self.generation != self.backend.get_credential_generation():
+            return True
+        return super(BackendCredentials, self).refresh_needed(refresh_in)
+
+
+class BackendCredentialProvider(botocore.credentials.CredentialProvider):
+    METHOD = "ingest-client"
+    CANONICAL_NAME = "IngestClient"
+
+    def __init__(self, backend):
+        """
+        A class to add the credentials of a backend to botocore's credential provider chain
+
+        Args:
+            backend (Backend): The backend holding the credentials
+        """
+        super(BackendCredentialProvider, self).__init__()
+        self.backend = backend
+
+    def load(self):
+        """Method called by botocore to get the credentials of a session"""
+        return BackendCredentials(self.backend)
+
+
+def create_session(backend, region=None):
+    """Method to create a boto3 session that reads its credentials from a backend
+
+    boto3 and botocore take a noticeable time to import, so this module is only imported once a backend needs AWS.
+
+    Args:
+        backend (ingestclient.core.backend.Backend): The backend holding the credentials
+        region(str): The default AWS region of the session
+
+    Returns:
+        (boto3.session.Session)
+    """
+    botocore_session = botocore.session.get_session()
+    # Ahead of the environment, config files and instance metadata, which would otherwise take precedence
+    resolver = botocore_session.get_component('credential_provider')
+    resolver.insert_before(resolver.providers[0].METHOD, BackendCredentialProvider(backend))
+    return boto3.session.Session(botocore_session=botocore_session, region_name=region)
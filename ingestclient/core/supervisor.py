@@ -0,0 +1,252 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from ..utils.log import always_log_info
+import multiprocessing as mp
+import threading
+import logging
+import time
+import os
+
+# Written in place of the heartbeat time once a worker's run loop has ended, so it is no longer watched
+FINISHED = -1.0
+
+
+class WorkerStatus(object):
+    def __init__(self, interval=1.0):
+        """
+        A class to share the liveness of a worker process with the master process's supervisor
+
+        The state lives in shared memory. While the engine runs, a background thread in the worker writes the
+        current time and when the oldest tile still being handled by a pipeline stage started that stage. If the
+        worker stops writing, e.g. because a thread is stuck in C code holding the GIL, the heartbeat goes stale.
+
+        Args:
+            interval(float): Seconds between updates
+        """
+        self.interval = interval
+        # [heartbeat time, start time of the oldest tile in a stage or 0]
+        self._values = mp.RawArray('d', 2)
+        self._thread = None
+        self._stop_event = None
+
+    def start(self, pipeline):
+        """
+        Method to start reporting on a background thread in the worker
+
+        Args:
+            pipeline(ingestclient.core.pipeline.Pipeline): The running pipeline
+
+        Returns:
+            None
+        """
+        self._stop_event = threading.Event()
+        self.update(pipeline.oldest_start())
+        self._thread = threading.Thread(target=self._run, args=(pipeline,), name="worker-status")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to stop reporting, marking the worker as finished"""
+        if self._thread:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self._values[0] = FINISHED
+
+    def _run(self, pipeline):
+        while not self._stop_event.wait(self.interval):
+            self.update(pipeline.oldest_start())
+
+    def update(self, oldest_start=None):
+        """
+        Method to record that the worker is alive
+
+        Args:
+            oldest_start(float): When the oldest tile still being handled started its current stage, if any
+
+        Returns:
+            None
+        """
+        self._values[1] = oldest_start or 0
+        self._values[0] = time.time()
+
+    def read(self):
+        """
+        Method to get the latest report
+
+        Returns:
+            (float, float): Heartbeat time (0 before the run starts, FINISHED after it ends) and the start time of the
+                            oldest tile in a stage, or None
+        """
+        return self._values[0], self._values[1] or None
+
+    def stuck_for(self, now=None):
+        """
+        Method to get how long the worker appears to have been stuck
+
+        Returns:
+            (float): Seconds since the last heartbeat or since the oldest tile started its stage, whichever is longer.
+                     0 if the worker isn't running the upload loop
+        """
+        heartbeat, oldest_start = self.read()
+        if heartbeat <= 0:
+            return 0
+        now = now or time.time()
+        return max(now - heartbeat, now - oldest_start if oldest_start else 0)
+
+
+class WorkerSupervisor(object):
+    def __init__(self, workers, start_worker, max_respawns=10, task_deadline=None, backoff_min=1, backoff_max=60,
+                 stable_time=300, metrics=None):
+        """
+        A class to keep the worker processes of a node running
+
+        Workers that exit with an error, or are killed (e.g. by the OOM killer), are replaced after a backoff delay
+        that doubles each time the same slot fails again within stable_time. Workers stuck on a tile for longer than
+        task_deadline seconds (e.g. on a hung NFS read) are terminated and replaced. Their tasks become visible on the
+        upload queue again once the visibility timeout expires, as nothing extends it any more. Workers that exit
+        cleanly are not replaced.
+
+        check() must be called periodically, e.g. from Engine.monitor().
+
+        Args:
+            workers(list): List of (multiprocessing.Process, multiprocessing.Connection) tuples. Replacements are
+                           swapped in place, so the collector and credential broker sharing the list see them
+            start_worker(callable): Called with a WorkerStatus. Starts a worker process reporting to it and returns
+                                    its (multiprocessing.Process, multiprocessing.Connection) tuple
+            max_respawns(int): Total number of replacements before giving up. 0 disables respawning
+            task_deadline(float): Seconds a worker may spend on a tile stage before it is killed. None disables the
+                                  watchdog
+            backoff_min(float): Delay before replacing a worker that failed for the first time
+            backoff_max(float): Longest delay before replacing a worker
+            stable_time(float): Seconds a worker must run before its slot's backoff is reset
+            metrics(ingestclient.utils.metrics.MetricsAggregator): If provided, respawns and kills are counted here
+        """
+        self.workers = workers
+        self.start_worker = start_worker
+        self.max_respawns = max_respawns
+        self.task_deadline = task_deadline
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stable_time = stable_time
+        self.metrics = metrics
+
+        self.respawns = 0
+        self.crashed = 0
+        self.hung = 0
+        # pid -> (WorkerStatus, start time, consecutive failures of the slot)
+        self.slots = {}
+        # Slots waiting to be refilled, as [due time, index in workers, consecutive failures]
+        self.pending = []
+
+    def spawn(self, failures=0):
+        """
+        Method to start a worker process
+
+        Args:
+            failures(int): Consecutive failures of the slot the worker fills
+
+        Returns:
+            (multiprocessing.Process, multiprocessing.Connection)
+        """
+        status = WorkerStatus()
+        worker = self.start_worker(status)
+        self.slots[worker[0].pid] = (status, time.time(), failures)
+        return worker
+
+    def check(self):
+        """
+        Method to replace crashed workers and kill hung ones
+
+        Returns:
+            None
+        """
+        logger = logging.getLogger('ingest-client')
+        now = time.time()
+        pending_indices = set(entry[1] for entry in self.pending)
+        for index, (process, pipe) in enumerate(list(self.workers)):
+            if index in pending_indices or process.pid not in self.slots:
+                continue
+            status, start_time, failures = self.slots[process.pid]
+
+            if process.is_alive():
+                stuck_for = status.stuck_for(now)
+                if not self.task_deadline or stuck_for <= self.task_deadline:
+                    continue
+                logger.error("(pid={}) Worker pid={} has been stuck on a tile for {:.0f}s, longer than the {:.0f}s "
+                             "deadline. Killing it".format(os.getpid(), process.pid, stuck_for, self.task_deadline))
+                self.kill(process)
+                self.hung += 1
+                self.count("workers_killed_hung", "Worker processes killed for being stuck on a tile")
+            elif process.exitcode == 0:
+                continue
+            else:
+                logger.error("(pid={}) Worker pid={} exited with code {}".format(os.getpid(), process.pid,
+                                                                                 process.exitcode))
+                self.crashed += 1
+                self.count("workers_crashed", "Worker processes that exited with an error or were killed")
+
+            del self.slots[process.pid]
+            if now - start_time >= self.stable_time:
+                failures = 0
+            if self.respawns + len(self.pending) >= self.max_respawns:
+                logger.error("(pid={}) Not replacing worker pid={}, the limit of {} respawns has been "
+                             "reached".format(os.getpid(), process.pid, self.max_respawns))
+                continue
+            delay = min(self.backoff_min * 2 ** failures, self.backoff_max)
+            self.pending.append([now + delay, index, failures + 1])
+            always_log_info("(pid={}) Replacing worker pid={} in {:.0f}s".format(os.getpid(), process.pid, delay))
+
+        for entry in sorted(self.pending):
+            due_time, index, failures = entry
+            if due_time > now:
+                continue
+            self.pending.remove(entry)
+            self.workers[index][1].close()
+            self.workers[index] = self.spawn(failures)
+            self.respawns += 1
+            self.count("worker_respawns", "Worker processes started to replace crashed or hung workers")
+            always_log_info("(pid={}) Started worker pid={} as a replacement".format(os.getpid(),
+                                                                                  self.workers[index][0].pid))
+
+    @staticmethod
+    def kill(process, timeout=5):
+        """
+        Method to stop a worker process, forcibly if it doesn't exit on SIGTERM
+
+        Args:
+            process(multiprocessing.Process): The worker to stop
+            timeout(float): Seconds to wait for it to exit after SIGTERM
+
+        Returns:
+            None
+        """
+        process.terminate()
+        process.join(timeout)
+        if process.is_alive() and hasattr(process, "kill"):
+            process.kill()
+            process.join(timeout)
+
+    def count(self, name, help_str):
+        if self.metrics:
+            self.metrics.increment(name, help_str=help_str)
+
+    def waiting(self):
+        """
+        Method to check if any worker is waiting to be replaced
+
+        Returns:
+            (bool)
+        """
+        return len(self.pending) > 0
@@ -13,7 +13,6 @@
 # limitations under the License.
 from abc import ABCMeta, abstractmethod
 import six
-import jsonschema
 import json
 
 
@@ -45,6 +44,8 @@ class Validator(object):
         if not self.schema:
             raise ValueError("Schema has not been populated yet. Cannot validate.")
 
+        # jsonschema is slow to import, and not needed until a configuration is validated
+        import jsonschema
         try:
             jsonschema.validate(self.config, self.schema)
         except jsonschema.ValidationError as e:
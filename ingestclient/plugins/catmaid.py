@@ -70,6 +70,8 @@ class CatmaidFileImageStackZoomLevelPathProcessor(PathProcessor):
 
 class CatmaidFileImageStackZoomLevelTileProcessor(TileProcessor):
     """A Tile processor for a file where a multi-page TIFF contains all time points for a single z-slice"""
+    thread_safe = True
+
     def __init__(self):
         """Constructor to add custom class var"""
         TileProcessor.__init__(self)
@@ -101,11 +103,39 @@ class CatmaidFileImageStackZoomLevelTileProcessor(TileProcessor):
             (io.BufferedReader): A file handle for the specified tile
 
         """
-        # Save img to png and return handle
+        return self.encode(self.read(file_path, x_index, y_index, z_index, t_index))
+
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Method to load the tile image
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            (PIL.Image.Image): The decoded tile image
+
+        """
         tile_data = Image.open(file_path)
+        tile_data.load()
+        return tile_data
+
+    def encode(self, data):
+        """
+        Method to save the tile image in the configured file type
 
+        Args:
+            data(PIL.Image.Image): The decoded tile image
+
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
         output = six.BytesIO()
-        tile_data.save(output, format=self.parameters["filetype"].upper())
+        data.save(output, format=self.parameters["filetype"].upper())
 
         # Send handle back
         return output
@@ -159,6 +189,8 @@ class CatmaidDirectoryImageStackPathProcessor(PathProcessor):
 
 class CatmaidDirectoryImageStackTileProcessor(TileProcessor):
     """A Tile processor for a file where a multi-page TIFF contains all time points for a single z-slice"""
+    thread_safe = True
+
     def __init__(self):
         """Constructor to add custom class var"""
         TileProcessor.__init__(self)
@@ -190,11 +222,39 @@ class CatmaidDirectoryImageStackTileProcessor(TileProcessor):
             (io.BufferedReader): A file handle for the specified tile
 
         """
-        # Save img to png and return handle
+        return self.encode(self.read(file_path, x_index, y_index, z_index, t_index))
+
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Method to load the tile image
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            (PIL.Image.Image): The decoded tile image
+
+        """
         tile_data = Image.open(file_path)
+        tile_data.load()
+        return tile_data
+
+    def encode(self, data):
+        """
+        Method to save the tile image in the configured file type
+
+        Args:
+            data(PIL.Image.Image): The decoded tile image
 
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
         output = six.BytesIO()
-        tile_data.save(output, format=self.parameters["filetype"].upper())
+        data.save(output, format=self.parameters["filetype"].upper())
 
         # Send handle back
         return output
@@ -248,6 +308,8 @@ class CatmaidFileImageStackPathProcessor(PathProcessor):
 
 class CatmaidFileImageStackTileProcessor(TileProcessor):
     """A Tile processor for a file where a multi-page TIFF contains all time points for a single z-slice"""
+    thread_safe = True
+
     def __init__(self):
         """Constructor to add custom class var"""
         TileProcessor.__init__(self)
@@ -279,11 +341,39 @@ class CatmaidFileImageStackTileProcessor(TileProcessor):
             (io.BufferedReader): A file handle for the specified tile
 
         """
-        # Save img to png and return handle
+        return self.encode(self.read(file_path, x_index, y_index, z_index, t_index))
+
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Method to load the tile image
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            (PIL.Image.Image): The decoded tile image
+
+        """
         tile_data = Image.open(file_path)
+        tile_data.load()
+        return tile_data
 
+    def encode(self, data):
+        """
+        Method to save the tile image in the configured file type
+
+        Args:
+            data(PIL.Image.Image): The decoded tile image
+
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
         output = six.BytesIO()
-        tile_data.save(output, format=self.parameters["filetype"].upper())
+        data.save(output, format=self.parameters["filetype"].upper())
 
         # Send handle back
         return output
@@ -8,9 +8,6 @@ from .tile import TileProcessor
 
 from PIL import Image
 
-from cloudvolume import CloudVolume
-from cloudvolume.lib import Bbox
-
 class CloudVolumePathProcessor(PathProcessor):
     """Class for simple image stacks that only increment in Z, uses the dynamic filesystem utility"""
     def __init__(self):
@@ -77,6 +74,7 @@ class CloudVolumeTileProcessor(TileProcessor):
             None
         """
         self.parameters = parameters
+        from cloudvolume import CloudVolume
         self.cv = CloudVolume(parameters['source_url'], fill_missing=True, progress=True)
 
     def process(self, file_path, x_index, y_index, z_index, t_index=0):
@@ -97,6 +95,7 @@ class CloudVolumeTileProcessor(TileProcessor):
         # Compute cutout args
 
         tile_size = self.parameters['ingest_job']['tile_size']
+        from cloudvolume.lib import Bbox
         bbox = Bbox( 
             (
                 tile_size["x"] * x_index,
@@ -16,13 +16,11 @@ import six
 from PIL import Image
 import re
 import os
-import h5py
 import numpy as np
 from math import floor
-import botocore
+import botocore.exceptions
 import logging
 
-
 from ..utils.filesystem import DynamicFilesystemAbsPath
 from .path import PathProcessor
 from .tile import TileProcessor
@@ -160,6 +158,7 @@ class Hdf5TimeSeriesTileProcessor(TileProcessor):
                    self.parameters["ingest_job"]["tile_size"]["y"] * (y_index + 1)]
 
         # Open hdf5
+        import h5py
         h5_file = h5py.File(file_path, 'r')
 
         # Save sub-img to png and return handle
@@ -235,6 +234,7 @@ class Hdf5TimeSeriesLabelTileProcessor(TileProcessor):
                    self.parameters["ingest_job"]["tile_size"]["y"] * (y_index + 1)]
 
         # Open hdf5
+        import h5py
         h5_file = h5py.File(file_path, 'r')
 
         # Save sub-img to png and return handle
@@ -383,6 +383,7 @@ class Hdf5SliceTileProcessor(TileProcessor):
                         self.parameters["ingest_job"]["tile_size"]["y"] * (y_index + 1)]
 
         # Open hdf5
+        import h5py
         h5_file = h5py.File(file_path, 'r')
 
         # Compute range in actual data, taking offsets into account
@@ -569,6 +570,7 @@ class Hdf5ChunkTileProcessor(TileProcessor):
             file_path = self.fs.get_file(file_path)
 
             # Open hdf5
+            import h5py
             h5_file = h5py.File(file_path, 'r')
 
             # Compute z-index (plugin assumes xy extent fits in a tile)
@@ -695,6 +697,7 @@ class Hdf5SingleFileTileProcessor(TileProcessor):
                           self.parameters["ingest_job"]["tile_size"]["y"] * (y_index + 1)]
 
         # Open hdf5
+        import h5py
         h5_file = h5py.File(file_path, 'r')
 
         # Compute range in actual data, taking offsets into account
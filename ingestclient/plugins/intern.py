@@ -14,8 +14,6 @@
 from __future__ import absolute_import
 import six
 from PIL import Image
-from intern.remote.boss import BossRemote
-from intern.resource.boss.resource import ChannelResource
 import numpy as np
 import time
 
@@ -89,12 +87,20 @@ class InternTileProcessor(TileProcessor):
             None
         """
         self.parameters = parameters
+        # intern is only required by this plugin, so it is imported when the plugin is set up
+        from intern.remote.boss import BossRemote
+        from intern.resource.boss.resource import ChannelResource
         self.remote = BossRemote()
         self.channel = ChannelResource(self.parameters["channel"],
                                        self.parameters["collection"],
                                        self.parameters["experiment"])
         self.channel = self.remote.get_project(self.channel)
 
+    def after_fork(self):
+        """Method to open a new connection to the Boss in a worker forked after setup(), keeping the channel"""
+        from intern.remote.boss import BossRemote
+        self.remote = BossRemote()
+
     def process(self, file_path, x_index, y_index, z_index, t_index=0):
         """
         Method to load the image file.
@@ -13,7 +13,6 @@
 # limitations under the License.
 import six
 from abc import ABCMeta, abstractmethod
-from pkg_resources import resource_filename
 import os
 
 
@@ -60,6 +59,18 @@ class PathProcessor(object):
         """
         return NotImplemented
 
+    def after_fork(self):
+        """
+        Method called in each pre-forked worker process after setup() ran in the master, to re-open connections and
+        file handles. See TileProcessor.after_fork()
+
+        Returns:
+            None
+        """
+        fs = getattr(self, "fs", None)
+        if fs is not None and hasattr(fs, "after_fork"):
+            fs.after_fork()
+
 
 class TestPathProcessor(PathProcessor):
     """Example processor for unit tests"""
@@ -93,6 +104,7 @@ class TestPathProcessor(PathProcessor):
             (str): An absolute file path that contains the specified data
 
         """
+        from pkg_resources import resource_filename
         return os.path.join(resource_filename("ingestclient", "test/data"), "test_tile.png")
 
 
@@ -138,6 +138,23 @@ class ZindexStackTileProcessor(TileProcessor):
         Returns:
             (io.BufferedReader): A file handle for the specified tile
 
+        """
+        return self.encode(self.read(file_path, x_index, y_index, z_index, t_index))
+
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Method to load the image file and crop out the requested tile
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            (PIL.Image.Image): The cropped tile
+
         """
         # Load tile
         file_handle = self.fs.get_file(file_path)
@@ -147,11 +164,25 @@ class ZindexStackTileProcessor(TileProcessor):
         y_range = [self.parameters["ingest_job"]["tile_size"]["y"] * y_index,
                    self.parameters["ingest_job"]["tile_size"]["y"] * (y_index + 1)]
 
-        # Save sub-img to png and return handle
         tile_data = Image.open(file_handle)
         upload_img = tile_data.crop((x_range[0], y_range[0], x_range[1], y_range[1]))
+
+        # Crop is lazy, so make sure the pixels are decoded here rather than during encode
+        upload_img.load()
+        return upload_img
+
+    def encode(self, data):
+        """
+        Method to save a cropped tile in the configured image format
+
+        Args:
+            data(PIL.Image.Image): The cropped tile
+
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
         output = six.BytesIO()
-        upload_img.save(output, format=canonical_extension(self.parameters["extension"]))
+        data.save(output, format=canonical_extension(self.parameters["extension"]))
 
         # Send handle back
         return output
@@ -13,12 +13,15 @@
 # limitations under the License.
 import six
 from abc import ABCMeta, abstractmethod
-import numpy as np
 from PIL import Image
 
 
 @six.add_metaclass(ABCMeta)
 class TileProcessor(object):
+    # Set to True in subclasses whose process() method can be called from several threads at once. Otherwise the
+    # engine serializes calls to process() when uploading with multiple threads.
+    thread_safe = False
+
     def __init__(self):
         """
         A class to implement a tile processor which outputs a list of file handles for uploading
@@ -60,9 +63,57 @@ class TileProcessor(object):
         """
         return NotImplemented
 
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Method to load the data for a tile without encoding it
+
+        The engine runs read() and encode() as separate pipeline stages. Plugins that can split loading from encoding
+        should override both so slow storage and CPU-bound encoding can overlap. By default the whole tile is produced
+        by process() here and encode() passes it through unchanged.
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            The decoded tile data, passed to encode()
+        """
+        return self.process(file_path, x_index, y_index, z_index, t_index)
+
+    def encode(self, data):
+        """
+        Method to encode tile data returned by read() into a file handle for uploading
+
+        Args:
+            data: The tile data returned by read()
+
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
+        return data
+
+    def after_fork(self):
+        """
+        Method called in each worker process forked from the master after setup(), when workers are pre-forked
+
+        State built in setup(), e.g. file indexes or metadata, is inherited and shared with the other workers
+        copy-on-write, so it should be kept. Connections and open file handles can't be shared between processes and
+        should be re-opened here. By default the plugin's filesystem (self.fs), if it has one, reconnects.
+
+        Returns:
+            None
+        """
+        fs = getattr(self, "fs", None)
+        if fs is not None and hasattr(fs, "after_fork"):
+            fs.after_fork()
+
 
 class TestTileProcessor(TileProcessor):
     """Example processor for unit tests"""
+    thread_safe = True
 
     def setup(self, parameters):
         """
@@ -99,7 +150,17 @@ class TestTileProcessor(TileProcessor):
 
 
 class TestRandomTileProcessor(TileProcessor):
-    """Example processor for scale tests"""
+    """Example processor for scale tests
+
+    Tiles are drawn from a small pool of synthetic slices generated once in setup(), so load tests measure encoding
+    and uploading realistic data rather than the random number generator.
+    """
+    thread_safe = True
+
+    def __init__(self):
+        """Constructor to add custom class var"""
+        TileProcessor.__init__(self)
+        self.tiles = []
 
     def setup(self, parameters):
         """
@@ -107,17 +168,27 @@ class TestRandomTileProcessor(TileProcessor):
 
         e.g. Open a multi-page tiff, connect to a database, etc.
 
+        OPTIONAL CUSTOM PARAMETERS: "compressibility": <float between 0 (noise) and 1 (smooth), default 0.8>,
+                                    "pool_size": <number of distinct tiles, default 8>
+
         Args:
             parameters (dict): Parameters for the dataset to be processed
 
         Returns:
             None
         """
+        from ingestclient.utils.synthetic import synthetic_slice
+
         self.parameters = parameters
+        self.tiles = [synthetic_slice(parameters["ingest_job"]["tile_size"]["y"],
+                                      parameters["ingest_job"]["tile_size"]["x"],
+                                      compressibility=parameters.get("compressibility", 0.8),
+                                      seed=seed)
+                      for seed in range(parameters.get("pool_size", 8))]
 
     def process(self, file_path, x_index, y_index, z_index, t_index=None):
         """
-        Generate a random tile
+        Generate a synthetic tile
 
         Args:
             file_path(str): An absolute file path for the specified tile
@@ -130,9 +201,35 @@ class TestRandomTileProcessor(TileProcessor):
             (io.BufferedReader): A file handle for the specified tile
 
         """
-        tile = np.random.randint(1, 254, size=(self.parameters["ingest_job"]["tile_size"]["y"],
-                                               self.parameters["ingest_job"]["tile_size"]["x"]), dtype=np.uint8)
-        tile_data = Image.fromarray(tile)
+        return self.encode(self.read(file_path, x_index, y_index, z_index, t_index))
+
+    def read(self, file_path, x_index, y_index, z_index, t_index=0):
+        """
+        Pick tile data from the pool
+
+        Args:
+            file_path(str): An absolute file path for the specified tile
+            x_index(int): The tile index in the X dimension
+            y_index(int): The tile index in the Y dimension
+            z_index(int): The tile index in the Z dimension
+            t_index(int): The time index
+
+        Returns:
+            (np.ndarray): The tile data
+        """
+        return self.tiles[(x_index + y_index + z_index + (t_index or 0)) % len(self.tiles)]
+
+    def encode(self, data):
+        """
+        Encode tile data as a TIFF
+
+        Args:
+            data(np.ndarray): The tile data
+
+        Returns:
+            (io.BufferedReader): A file handle for the specified tile
+        """
+        tile_data = Image.fromarray(data)
         output = six.BytesIO()
         tile_data.save(output, format="TIFF")
 
@@ -14,7 +14,9 @@
 from __future__ import absolute_import
 from ingestclient.core.backend import BossBackend, Backend
 from ingestclient.test.aws import Setup
+from ingestclient.utils.errors import Backoff, BackoffPolicy, TRANSIENT
 
+import botocore.exceptions
 import os
 import unittest
 import json
@@ -138,6 +140,150 @@ class BossBackendTestMixin(object):
         assert isinstance(rx_handle, str)
         assert msg_body == self.setup_helper.test_msg[1]
 
+    def test_get_task_prefetch(self):
+        """Test that tasks are prefetched in batches and can be released back to the queue"""
+        b = BossBackend(self.example_config_data)
+        b.setup(self.api_token)
+
+        # Put some stuff on the task queue
+        self.setup_helper.add_tasks(self.aws_creds["access_key"], self.aws_creds['secret_key'], self.queue_url, b)
+
+        # Join and get a task. The remaining tasks should be held in the local buffer
+        b.join(23)
+        msg_id, rx_handle, msg_body = b.get_task()
+        assert msg_body == self.setup_helper.test_msg[0]
+        assert len(b.task_buffer) == 3
+
+        # Releasing makes the buffered tasks immediately available again
+        assert b.release_tasks() == 3
+        assert len(b.task_buffer) == 0
+
+        msg_id, rx_handle, msg_body = b.get_task()
+        assert msg_body == self.setup_helper.test_msg[1]
+        assert len(b.task_buffer) == 2
+
+        # Buffered tasks keep the time they were received from SQS
+        received_time = b.task_buffer[0][1]
+        msg_id, rx_handle, msg_body, task_received_time = b.receive_task()
+        assert msg_body == self.setup_helper.test_msg[2]
+        assert task_received_time == received_time
+
+    def test_get_task_read_timeout(self):
+        """Test that a read timeout while receiving tasks is retried"""
+        b = BossBackend(self.example_config_data)
+        b.setup(self.api_token)
+        self.setup_helper.add_tasks(self.aws_creds["access_key"], self.aws_creds['secret_key'], self.queue_url, b)
+        b.join(23)
+        b.receive_backoff = Backoff({TRANSIENT: BackoffPolicy(0.01, 0.01)})
+
+        fill_task_buffer = b.fill_task_buffer
+        calls = []
+
+        def flaky_fill(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise botocore.exceptions.ReadTimeoutError(endpoint_url=self.queue_url)
+            return fill_task_buffer(*args)
+
+        b.fill_task_buffer = flaky_fill
+        msg_id, rx_handle, msg_body = b.get_task()
+        assert msg_body == self.setup_helper.test_msg[0]
+        assert len(calls) == 2
+
+    def test_change_visibility(self):
+        """Test extending the visibility of a received message"""
+        b = BossBackend(self.example_config_data)
+        b.setup(self.api_token)
+        self.setup_helper.add_tasks(self.aws_creds["access_key"], self.aws_creds['secret_key'], self.queue_url, b)
+
+        b.join(23)
+        msg_id, rx_handle, msg_body = b.get_task(num_messages=1)
+        assert b.change_visibility([rx_handle], 120) == []
+        assert b.change_visibility(["not-a-handle"], 120) == ["not-a-handle"]
+
+        # Leave the queue empty for the other tests
+        b.release_tasks()
+        b.queue.purge()
+
+    def test_update_credentials(self):
+        """Test switching connections to new credentials without joining again"""
+        b = BossBackend(self.example_config_data)
+        b.setup(self.api_token)
+        b.join(23)
+        old_client = b.s3_client
+
+        b.update_credentials({"access_key": "new-key", "secret_key": "new-secret"})
+
+        # The same clients are kept, and use the new credentials straight away
+        assert b.s3_client is old_client
+        assert b.queue.url == self.queue_url
+        assert b.bucket.name == self.tile_bucket_name
+        assert b.session.get_credentials().method == "ingest-client"
+        credentials = b.session.get_credentials().get_frozen_credentials()
+        assert credentials.access_key == "new-key"
+        assert credentials.secret_key == "new-secret"
+
+        # Joining again also reuses the clients
+        b.join(23)
+        assert b.s3_client is old_client
+        assert b.session.get_credentials().get_frozen_credentials().access_key == self.aws_creds["access_key"]
+
+    def test_client_config(self):
+        """Test configuring the AWS clients from the backend config section"""
+        config = json.loads(json.dumps(self.example_config_data))
+        config["client"]["backend"].update({"max_pool_connections": 32, "retry_mode": "adaptive", "max_attempts": 4,
+                                            "connect_timeout": 5, "read_timeout": 30})
+        b = BossBackend(config)
+        b.setup(self.api_token)
+
+        client_config = b.get_client_config()
+        assert client_config.max_pool_connections == 32
+        assert client_config.retries == {"mode": "adaptive", "total_max_attempts": 4}
+        assert client_config.connect_timeout == 5
+        assert client_config.read_timeout == 30
+
+    def test_api_session(self):
+        """Test that calls to the ingest service share a session with retries and timeouts"""
+        config = json.loads(json.dumps(self.example_config_data))
+        config["client"]["backend"].update({"api_connect_timeout": 3, "api_read_timeout": 20, "api_retries": 2})
+        b = BossBackend(config)
+        b.setup(self.api_token)
+
+        assert b.api_timeout == (3, 20)
+        retry = b.api_session.get_adapter("https://api.theboss.io").max_retries
+        assert retry.total == 2
+        assert 503 in retry.status_forcelist
+
+        # Job creation is never retried once the request may have been sent
+        assert retry.is_retry("POST", 503) is False
+        assert retry.is_retry("GET", 503) is True
+
+    def test_aws_settings(self):
+        """Test configuring the AWS region, endpoints and S3 options"""
+        config = json.loads(json.dumps(self.example_config_data))
+        config["client"]["backend"].update({"s3_endpoint_url": "http://localhost:9000",
+                                            "sqs_endpoint_url": "http://localhost:9324",
+                                            "s3_addressing_style": "path"})
+        b = BossBackend(config)
+        b.setup(self.api_token)
+
+        # Settings from the service don't override the config file
+        b.apply_aws_settings({"region": "us-west-2", "s3_endpoint_url": "https://s3.example.com"}, override=False)
+        assert b.region == "us-west-2"
+
+        b.setup_tile_bucket(self.aws_creds, self.tile_bucket_name)
+        b.setup_upload_queue(self.aws_creds, self.queue_url)
+        assert b.s3_client.meta.endpoint_url == "http://localhost:9000"
+        assert b.s3_client.meta.region_name == "us-west-2"
+        assert b.s3_client.meta.config.s3["addressing_style"] == "path"
+        assert b.sqs.meta.client.meta.endpoint_url == "http://localhost:9324"
+
+        b = BossBackend(self.example_config_data)
+        b.setup(self.api_token)
+        b.apply_aws_settings({"s3_use_accelerate_endpoint": True})
+        assert b.get_client_config("s3").s3 == {"use_accelerate_endpoint": True}
+        assert b.get_client_config("sqs").s3 is None
+
     def test_encode_tile_key(self):
         """Test encoding an object key"""
         b = BossBackend(self.example_config_data)
@@ -0,0 +1,57 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.bandwidth import TokenBucket, mbps_to_bytes
+
+import multiprocessing as mp
+import time
+import unittest
+
+
+def consume_from(bucket, amount, count):
+    for _ in range(count):
+        bucket.consume(amount)
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_mbps_to_bytes(self):
+        """Test converting megabits per second to bytes per second"""
+        assert mbps_to_bytes(8) == 1e6
+
+    def test_burst_then_limit(self):
+        """Test that the initial capacity is available right away and later requests are paced"""
+        bucket = TokenBucket(1000)
+        assert bucket.reserve(1000) == 0
+        assert 0.45 <= bucket.reserve(500) <= 0.5
+        # Callers queue up behind the debt
+        assert 0.95 <= bucket.reserve(500) <= 1.0
+
+    def test_large_request(self):
+        """Test that a request larger than the capacity is allowed after waiting"""
+        bucket = TokenBucket(1000, capacity=100)
+        assert 1.85 <= bucket.reserve(2000) <= 1.9
+
+    def test_shared_between_processes(self):
+        """Test that the limit applies to the combined rate of several processes"""
+        bucket = TokenBucket(10000, capacity=1000)
+        start = time.time()
+        workers = [mp.Process(target=consume_from, args=(bucket, 1000, 5)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        # 10000 tokens minus the initial 1000 at 10000 per second
+        assert time.time() - start >= 0.85
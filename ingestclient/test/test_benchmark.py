@@ -0,0 +1,146 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.benchmark.bench import run_suite, parse_int_list
+from ingestclient.benchmark.datasets import DATASETS, make_dataset, make_config, get_plugins
+from ingestclient.utils.synthetic import synthetic_slice
+from ingestclient.benchmark.micro import run_micro
+from ingestclient.benchmark.imports import time_import
+from ingestclient.benchmark.replay import replay_trace, schedule_trace
+from ingestclient.core.backend import BossBackend
+
+import io
+import os
+import json
+import shutil
+import argparse
+import tempfile
+import unittest
+from PIL import Image
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_parse_int_list(self):
+        """Test parsing the sweep arguments"""
+        assert parse_int_list("1,2, 4") == [1, 2, 4]
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_int_list("1,a")
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_int_list("0")
+
+    def test_make_dataset(self):
+        """Test the generated datasets match the extent they report"""
+        dataset = make_dataset("catmaid", os.path.join(self.temp_dir, "catmaid"), (2, 128, 192), 64)
+        assert dataset["extent"]["x"] == [0, 192]
+        assert os.path.exists(os.path.join(self.temp_dir, "catmaid", "1", "1_2_0.png"))
+
+        with self.assertRaises(ValueError):
+            make_dataset("missing", self.temp_dir, (1, 64, 64), 64)
+        with self.assertRaises(ValueError):
+            make_dataset("multipage_tiff", self.temp_dir, (1, 64, 64), 64, dtype="uint8")
+
+    def test_datasets_match_plugins(self):
+        """Test every plugin can load every tile of its generated dataset"""
+        for name, _ in DATASETS:
+            try:
+                dataset = make_dataset(name, os.path.join(self.temp_dir, name), (3, 128, 128), 64)
+            except ImportError:
+                # Optional plugin dependency (e.g. h5py) not installed
+                continue
+
+            path_processor, tile_processor = get_plugins(make_config(dataset, None, 64))
+            extent = dataset["extent"]
+            for t in range(*extent["t"]):
+                for z in range(*extent["z"]):
+                    for y in range(extent["y"][1] // 64):
+                        for x in range(extent["x"][1] // 64):
+                            handle = tile_processor.process(path_processor.process(x, y, z, t), x, y, z, t)
+                            handle.seek(0)
+                            assert len(handle.read()) > 0, name
+
+    def test_synthetic_slice_compressibility(self):
+        """Test compressibility controls how well slices encode"""
+        sizes = []
+        for compressibility in (0, 0.8, 1):
+            data = synthetic_slice(256, 256, "uint16", compressibility)
+            assert data.dtype.name == "uint16"
+            output = io.BytesIO()
+            Image.fromarray(data).save(output, format="PNG")
+            sizes.append(len(output.getvalue()))
+        assert sizes[0] > sizes[1] > sizes[2]
+
+    def test_run_micro(self):
+        """Test the plugin microbenchmarks time each stage of every tile"""
+        dataset = make_dataset("zstack", self.temp_dir, (2, 128, 128), 64)
+        result = run_micro(make_config(dataset, None, 64), repeat=2)
+
+        assert result["tiles"] == 16
+        for stage in ("path", "process", "read", "encode"):
+            assert result["stages"][stage]["count"] == 16
+        assert result["output_bytes"] > 0
+
+    def test_import_deferred(self):
+        """Test importing the client or a plugin doesn't load slow modules it only needs later"""
+        result = time_import("ingestclient.client", repeat=1)
+        assert result["min"] > 0
+        assert result["loaded"] == []
+
+        # Plugins need numpy and Pillow for every tile, but not their optional libraries until they are set up
+        for module in ("ingestclient.plugins.hdf5", "ingestclient.plugins.intern", "ingestclient.plugins.cloudvolume"):
+            loaded = time_import(module, repeat=1)["loaded"]
+            assert set(loaded) <= {"numpy", "PIL"}, "{} loaded {}".format(module, loaded)
+
+    def test_run_suite(self):
+        """Test a small sweep uploads every tile in each run"""
+        report = run_suite(self.temp_dir, ["zstack", "multipage_tiff"], [64], [1, 2], [2], num_slices=2)
+
+        assert len(report["results"]) == 4
+        for result in report["results"]:
+            assert result["errors"] == []
+            assert result["tiles"] == result["expected_tiles"] == 8
+            assert result["tiles_per_second"] > 0
+            assert result["megabytes_per_second"] > 0
+            assert "upload" in result["stages"]
+        assert report["results"][1]["processes"] == 2
+
+    def test_replay_trace(self):
+        """Test replaying a trace uploads each of its tiles, in any order across z"""
+        dataset = make_dataset("zstack", os.path.join(self.temp_dir, "data"), (3, 128, 128), 64)
+        config_file = os.path.join(self.temp_dir, "config.json")
+        with open(config_file, 'wt') as f:
+            json.dump(make_config(dataset, os.path.join(self.temp_dir, "recorded"), 64), f)
+
+        backend = BossBackend(None)
+        trace_file = os.path.join(self.temp_dir, "trace.ndjson")
+        with open(trace_file, 'wt') as f:
+            for time, (x, z) in enumerate([(1, 2), (0, 0), (1, 0), (0, 2), (1, 1)]):
+                f.write(json.dumps({"time": 100.0 + time / 10.0, "pid": 1,
+                                    "tile_key": backend.encode_tile_key([4, 5, 6], 0, x, 1, z, 0),
+                                    "chunk_key": backend.encode_chunk_key(3, [4, 5, 6], 0, x, 1, 0, 0)}) + "\n")
+
+        work_dir = os.path.join(self.temp_dir, "replay")
+        os.makedirs(work_dir)
+        result = replay_trace(config_file, [trace_file], work_dir, time_scale=1)
+        assert result["errors"] == []
+        assert result["tiles"] == result["expected_tiles"] == 5
+
+        delays = [x["delay"] for x in schedule_trace([{"time": 10.0}, {"time": 12.0}], 0.5)]
+        assert delays == [0, 1.0]
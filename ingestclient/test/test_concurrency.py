@@ -0,0 +1,88 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.concurrency import AIMDController
+
+import threading
+import unittest
+
+
+class TestAIMDController(unittest.TestCase):
+
+    def saturate(self, controller, latency):
+        """Helper to run one full window of uploads with every slot in use"""
+        for _ in range(controller.window):
+            with controller.slot():
+                pass
+            controller._saturated = True
+            controller.success(latency)
+
+    def test_additive_increase(self):
+        """Test that the limit grows by one per good window up to the maximum"""
+        controller = AIMDController(4, window=5)
+        assert controller.limit == 1
+        self.saturate(controller, 0.1)
+        assert controller.limit == 2
+        for _ in range(5):
+            self.saturate(controller, 0.1)
+        assert controller.limit == 4
+
+    def test_no_increase_when_idle(self):
+        """Test that the limit only grows if it was actually used"""
+        controller = AIMDController(4, initial=2, window=5)
+        for _ in range(5):
+            controller.success(0.1)
+        assert controller.limit == 2
+
+    def test_multiplicative_decrease(self):
+        """Test that throttling and rising latency halve the limit"""
+        controller = AIMDController(16, initial=16, window=5, cooldown=0)
+        controller.throttled()
+        assert controller.limit == 8
+        controller.throttled()
+        assert controller.limit == 4
+
+        self.saturate(controller, 0.1)
+        assert controller.limit == 5
+        self.saturate(controller, 0.5)
+        assert controller.limit == 2.5
+        assert controller.decreases == 3
+
+        for _ in range(5):
+            controller.throttled()
+        assert controller.limit == 1
+
+    def test_cooldown(self):
+        """Test that a burst of throttling responses only cuts the limit once"""
+        controller = AIMDController(16, initial=16, cooldown=60)
+        for _ in range(5):
+            controller.throttled()
+        assert controller.limit == 8
+
+    def test_slots(self):
+        """Test that no more than the limit can hold a slot at once"""
+        controller = AIMDController(4, initial=2)
+        controller.acquire()
+        controller.acquire()
+
+        waiter = threading.Thread(target=controller.acquire)
+        waiter.daemon = True
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive()
+
+        controller.release()
+        waiter.join(1)
+        assert not waiter.is_alive()
+        assert controller.active == 2
@@ -0,0 +1,89 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.credentials import CredentialBroker
+from ingestclient.client import listen_to_master, wait_for_decision
+
+import multiprocessing as mp
+import datetime
+import unittest
+
+
+class StubBackend(object):
+    credential_timeout = 3300
+
+
+class StubEngine(object):
+    """Minimal engine recording joins and credential updates"""
+    def __init__(self):
+        self.backend = StubBackend()
+        self.credential_create_time = datetime.datetime.now()
+        self.credentials = {"access_key": "key0", "secret_key": "secret0"}
+        self.joins = 0
+        self.updates = []
+
+    def join(self):
+        self.joins += 1
+        self.credentials = {"access_key": "key{}".format(self.joins), "secret_key": "secret"}
+        self.credential_create_time = datetime.datetime.now()
+
+    def update_credentials(self, credentials):
+        self.updates.append(credentials)
+
+
+class StubProcess(object):
+    def __init__(self, alive=True):
+        self.alive = alive
+
+    def is_alive(self):
+        return self.alive
+
+
+class TestCredentialBroker(unittest.TestCase):
+
+    def test_refresh_due(self):
+        """Test that credentials are refreshed ahead of the engine's credential timeout"""
+        engine = StubEngine()
+        broker = CredentialBroker(engine, [], lead_time=300)
+        assert broker.refresh_due() is False
+
+        engine.credential_create_time = datetime.datetime.now() - datetime.timedelta(seconds=3000)
+        assert broker.refresh_due() is True
+
+    def test_refresh_pushes_to_workers(self):
+        """Test that a single refresh is sent to every running worker"""
+        engine = StubEngine()
+        pipes = [mp.Pipe() for _ in range(3)]
+        workers = [(StubProcess(), pipes[0][1]), (StubProcess(), pipes[1][1]), (StubProcess(False), pipes[2][1])]
+        broker = CredentialBroker(engine, workers)
+
+        assert broker.refresh() == 2
+        assert engine.joins == 1
+        for worker_pipe, _ in pipes[:2]:
+            assert worker_pipe.recv() == ("credentials", {"access_key": "key1", "secret_key": "secret"})
+        assert pipes[2][0].poll() is False
+
+    def test_worker_listener(self):
+        """Test that workers apply credentials as they arrive and queue run decisions"""
+        engine = StubEngine()
+        worker_pipe, master_pipe = mp.Pipe()
+        decisions = listen_to_master(worker_pipe, engine)
+
+        broker = CredentialBroker(engine, [(StubProcess(), master_pipe)])
+        broker.refresh()
+        broker.broadcast(False)
+
+        assert wait_for_decision(decisions) is False
+        assert engine.updates == [{"access_key": "key1", "secret_key": "secret"}]
+        master_pipe.close()
@@ -13,18 +13,23 @@
 # limitations under the License.
 from __future__ import absolute_import
 from ingestclient.core.engine import Engine
+from ingestclient.core.pipeline import UploadTask
 from ingestclient.core.validator import Validator, BossValidatorV01
 from ingestclient.core.backend import Backend, BossBackend
 from ingestclient.core.config import Configuration, ConfigFileError
 from ingestclient.test.aws import Setup
 
+from six.moves import queue
 import os
+import time
+import threading
 import unittest
 import json
 import responses
 from pkg_resources import resource_filename
 import tempfile
 import boto3
+import botocore.exceptions
 
 
 class ResponsesMixin(object):
@@ -117,6 +122,93 @@ class EngineBossTestMixin(object):
         assert engine.upload_job_queue == self.queue_url
         assert engine.job_status == 1
 
+    def test_join_concurrent(self):
+        """Test that joins from several threads, e.g. the credential broker and the monitor loop, don't interleave"""
+        engine = Engine(self.config_file, self.api_token, 23)
+        join = engine.backend.join
+        active = []
+        overlaps = []
+
+        def slow_join(job_id):
+            active.append(job_id)
+            overlaps.append(len(active))
+            time.sleep(0.05)
+            result = join(job_id)
+            active.pop()
+            return result
+
+        engine.backend.join = slow_join
+        threads = [threading.Thread(target=engine.join) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert overlaps == [1, 1, 1]
+        assert engine.upload_job_queue == self.queue_url
+
+    def test_tile_processor_not_thread_safe(self):
+        """Test that reads and encodes of a tile processor that isn't thread safe never overlap"""
+        engine = Engine(self.config_file, self.api_token, 23)
+        active = []
+        overlaps = []
+
+        class SharedStateProcessor(object):
+            thread_safe = False
+
+            def call(self, result):
+                active.append(True)
+                overlaps.append(len(active))
+                time.sleep(0.02)
+                active.pop()
+                return result
+
+            def read(self, filename, x_index, y_index, z_index, t_index):
+                return self.call("data")
+
+            def encode(self, data):
+                return self.call("handle")
+
+        engine.tile_processor = SharedStateProcessor()
+        key_parts = {"x_index": 0, "y_index": 0, "z_index": 0, "t_index": 0}
+        tasks = [UploadTask(str(idx), "rh", {"tile_key": "key"}) for idx in range(3)]
+        for task in tasks:
+            task.key_parts = key_parts
+            task.data = "data"
+        threads = [threading.Thread(target=engine.read_tile, args=(task,)) for task in tasks]
+        threads += [threading.Thread(target=engine.encode_tile, args=(task,)) for task in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert overlaps == [1] * 6
+
+    def test_put_task_expires_prefetched(self):
+        """Test that prefetched tasks are expired while the pipeline applies backpressure"""
+        engine = Engine(self.config_file, self.api_token, 23)
+        expired = []
+        engine.backend.expire_prefetched_tasks = lambda: expired.append(True)
+
+        class SaturatedPipeline(object):
+            def __init__(self):
+                self.items = []
+                self.full_count = 2
+
+            def put(self, item, stage=None, timeout=None):
+                if self.full_count:
+                    self.full_count -= 1
+                    raise queue.Full()
+                self.items.append((item, stage))
+
+        engine.pipeline = SaturatedPipeline()
+        task = UploadTask("1", "rh1", {"tile_key": "key1"}, received_time=100)
+        engine.put_task(task, "upload")
+
+        assert engine.pipeline.items == [(task, "upload")]
+        assert len(expired) == 2
+        assert task.received_time == 100
+
     def test_run(self):
         """Test getting a task from the upload queue"""
         engine = Engine(self.config_file, self.api_token, 23)
@@ -139,6 +231,101 @@ class EngineBossTestMixin(object):
                 # Make sure the key was valid an data was loaded into the file handles
                 assert data.tell() == 182300
 
+    def test_check_job_drained(self):
+        """Test deciding if the upload queue has been drained"""
+        engine = Engine(self.config_file, self.api_token, 23)
+        engine.join()
+
+        # Job status not available
+        assert engine.check_job_drained() is None
+
+        status = {"id": 23, "status": 1, "total_message_count": 4, "current_message_count": 2}
+        responses.add(responses.GET, 'https://api.theboss.io/latest/ingest/23/status', json=status, status=200)
+        assert engine.check_job_drained() is False
+
+        # No visible messages, but some are still being worked on elsewhere
+        responses.reset()
+        status["current_message_count"] = 0
+        responses.add(responses.GET, 'https://api.theboss.io/latest/ingest/23/status', json=status, status=200)
+        engine.backend.get_queue_counts = lambda: {"visible": 0, "in_flight": 3}
+        assert engine.check_job_drained() is False
+
+        engine.backend.get_queue_counts = lambda: {"visible": 0, "in_flight": 0}
+        assert engine.check_job_drained() is True
+
+    def test_task_failed(self):
+        """Test that transient failures are retried locally and others are released right away"""
+        engine = Engine(self.config_file, self.api_token, 23)
+        engine.join()
+        released = []
+        delays = []
+
+        def release_messages(receipt_handles, delay=0):
+            released.extend(receipt_handles)
+            delays.append(delay)
+
+        engine.backend.release_messages = release_messages
+        engine.backend.get_visibility_timeout = lambda: 120
+
+        task = UploadTask("1", "rh1", {"tile_key": "key1"})
+        error = botocore.exceptions.ClientError({"Error": {"Code": "SlowDown"}}, "PutObject")
+        engine.task_failed(task, "upload", error)
+        assert len(engine.retry_queue) == 1
+        assert task.failed_stage == "upload"
+        assert released == []
+
+        task = UploadTask("2", "rh2", {"tile_key": "key2"})
+        engine.task_failed(task, "read", ValueError("bad tile"))
+        assert len(engine.retry_queue) == 1
+        assert released == ["rh2"]
+        # Permanent failures stay hidden for a visibility timeout instead of going straight to another worker
+        assert delays == [120]
+
+        # Not enough of the visibility timeout left to retry
+        task = UploadTask("3", "rh3", {"tile_key": "key3"})
+        task.received_time -= 60
+        engine.task_failed(task, "upload", error)
+        assert released == ["rh2", "rh3"]
+        assert delays == [120, 0]
+        assert engine.stats.counters["retried_tasks"] == 1
+        assert engine.stats.counters["released_tasks"] == 2
+        assert engine.stats.counters["throttling_errors"] == 2
+        assert engine.stats.counters["permanent_errors"] == 1
+
+    def test_run_threaded(self):
+        """Test uploading tasks from a pool of threads"""
+        engine = Engine(self.config_file, self.api_token, 23, upload_threads=4)
+        engine.msg_wait_iterations = 2
+
+        assert engine.backend.max_pool_connections >= 4
+
+        # Put some stuff on the task queue
+        self.setup_helper.add_tasks(self.aws_creds["access_key"], self.aws_creds['secret_key'], self.queue_url, engine.backend)
+
+        engine.summary_path = os.path.join(tempfile.mkdtemp(), "worker.json")
+        engine.adaptive_concurrency = True
+        engine.join()
+        engine.run()
+
+        # Check the run summary
+        with open(engine.summary_path, 'rt') as summary_file:
+            summary = json.load(summary_file)
+        assert summary["counters"]["tiles_uploaded"] == 4
+        assert summary["counters"]["bytes_uploaded"] == 4 * 182300
+        for stage in ["receive", "path", "read", "encode", "upload"]:
+            assert stage in summary["stages"]
+        assert summary["stages"]["upload"]["count"] == 4
+        assert summary["counters"]["concurrency_decreases"] == 0
+
+        # Check for all tiles to exist
+        s3 = boto3.resource('s3')
+        tile_bucket = s3.Bucket(self.tile_bucket_name)
+        for msg in self.setup_helper.test_msg:
+            with tempfile.NamedTemporaryFile() as test_file:
+                with open(test_file.name, 'wb') as data:
+                    tile_bucket.download_fileobj(msg["tile_key"], data)
+                    assert data.tell() == 182300
+
 
 class TestBossEngine(EngineBossTestMixin, ResponsesMixin, unittest.TestCase):
 
@@ -0,0 +1,88 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.errors import is_transient_error, get_error_code, classify_error, Backoff, BackoffPolicy
+from ingestclient.utils.errors import THROTTLING, AUTH, TRANSIENT, PERMANENT
+
+import botocore.exceptions
+import socket
+import errno
+import time
+import unittest
+
+
+class TestErrors(unittest.TestCase):
+
+    def test_client_errors(self):
+        """Test classifying AWS client errors"""
+        error = botocore.exceptions.ClientError({"Error": {"Code": "SlowDown"}}, "PutObject")
+        assert get_error_code(error) == "SlowDown"
+        assert is_transient_error(error) is True
+
+        error = botocore.exceptions.ClientError({"Error": {"Code": "NoSuchBucket"},
+                                                 "ResponseMetadata": {"HTTPStatusCode": 404}}, "PutObject")
+        assert is_transient_error(error) is False
+
+        error = botocore.exceptions.ClientError({"Error": {"Code": "Unknown"},
+                                                 "ResponseMetadata": {"HTTPStatusCode": 503}}, "PutObject")
+        assert is_transient_error(error) is True
+
+    def test_other_errors(self):
+        """Test classifying connection, file and plugin errors"""
+        assert is_transient_error(botocore.exceptions.EndpointConnectionError(endpoint_url="http://s3")) is True
+        assert is_transient_error(IOError(errno.ENOENT, "No such file")) is False
+        assert is_transient_error(IOError(errno.EIO, "I/O error")) is True
+        # e.g. PIL.UnidentifiedImageError for a corrupt tile
+        assert is_transient_error(OSError("cannot identify image file")) is False
+        assert is_transient_error(socket.timeout("timed out")) is True
+        assert is_transient_error(ValueError("bad tile")) is False
+        assert get_error_code(ValueError("bad tile")) is None
+
+    def test_classify(self):
+        """Test sorting errors into classes"""
+        def client_error(code, status=400):
+            return botocore.exceptions.ClientError({"Error": {"Code": code},
+                                                    "ResponseMetadata": {"HTTPStatusCode": status}}, "PutObject")
+
+        assert classify_error(client_error("SlowDown", 503)) == THROTTLING
+        assert classify_error(client_error("RequestLimitExceeded")) == THROTTLING
+        assert classify_error(client_error("AccessDenied", 403)) == AUTH
+        assert classify_error(client_error("InvalidAccessKeyId", 403)) == AUTH
+        assert classify_error(client_error("InternalError", 500)) == TRANSIENT
+        assert classify_error(client_error("NoSuchBucket", 404)) == PERMANENT
+        assert classify_error(botocore.exceptions.ReadTimeoutError(endpoint_url="http://s3")) == TRANSIENT
+        assert classify_error(KeyError("x_index")) == PERMANENT
+
+    def test_backoff(self):
+        """Test that consecutive failures back off per class and a success resets them"""
+        backoff = Backoff({THROTTLING: BackoffPolicy(0.1, 0.4), AUTH: BackoffPolicy(0.1, 1.0, max_attempts=2)})
+        assert 0.05 <= backoff.failure(THROTTLING) <= 0.1
+        assert 0.1 <= backoff.failure(THROTTLING) <= 0.2
+        assert 0.2 <= backoff.failure(THROTTLING) <= 0.4
+        assert 0.2 <= backoff.failure(THROTTLING) <= 0.4
+        assert backoff.exhausted(THROTTLING) is False
+
+        # Waiting honours the latest resume time
+        start = time.time()
+        backoff.wait()
+        assert time.time() - start >= 0.15
+
+        backoff.failure(AUTH)
+        assert backoff.exhausted(AUTH) is False
+        backoff.failure(AUTH)
+        assert backoff.exhausted(AUTH) is True
+
+        backoff.success()
+        assert backoff.exhausted(AUTH) is False
+        assert backoff.attempts[THROTTLING] == 0
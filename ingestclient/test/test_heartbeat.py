@@ -0,0 +1,76 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.heartbeat import VisibilityHeartbeat
+from ingestclient.core.pipeline import UploadTask
+from ingestclient.utils.metrics import RunStats
+
+import time
+import unittest
+
+
+class QueueBackend(object):
+    """Minimal backend recording visibility changes"""
+    def __init__(self, deleted=()):
+        self.changes = []
+        self.deleted = set(deleted)
+
+    def get_visibility_timeout(self):
+        return 0.4
+
+    def change_visibility(self, receipt_handles, timeout):
+        self.changes.append((sorted(receipt_handles), timeout))
+        return [x for x in receipt_handles if x in self.deleted]
+
+
+class TestVisibilityHeartbeat(unittest.TestCase):
+
+    def test_beat(self):
+        """Test that only messages due for an extension are extended"""
+        backend = QueueBackend()
+        stats = RunStats()
+        heartbeat = VisibilityHeartbeat(backend, stats)
+        slow = UploadTask("1", "rh1", {})
+        heartbeat.track(slow)
+        assert heartbeat.beat() == 0
+
+        time.sleep(0.15)
+        heartbeat.track(UploadTask("2", "rh2", {}))
+        assert heartbeat.beat() == 1
+        assert backend.changes == [(["rh1"], 0.4)]
+
+        assert heartbeat.untrack(slow) == 1
+        assert stats.counters["visibility_extensions"] == 1
+        assert stats.counters["extended_tasks"] == 1
+
+    def test_deleted_message(self):
+        """Test that messages that can no longer be extended are dropped"""
+        backend = QueueBackend(deleted=["rh1"])
+        heartbeat = VisibilityHeartbeat(backend)
+        heartbeat.track(UploadTask("1", "rh1", {}))
+        time.sleep(0.15)
+        assert heartbeat.beat() == 0
+        assert heartbeat.tasks == {}
+
+    def test_thread(self):
+        """Test that the background thread keeps extending a slow task"""
+        backend = QueueBackend()
+        heartbeat = VisibilityHeartbeat(backend, interval=0.05)
+        task = UploadTask("1", "rh1", {})
+        heartbeat.track(task)
+        heartbeat.start()
+        time.sleep(0.5)
+        heartbeat.stop()
+
+        assert heartbeat.untrack(task) >= 2
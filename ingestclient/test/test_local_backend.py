@@ -0,0 +1,207 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.backend import Backend, BossBackend, LocalBackend
+from ingestclient.core.local import LocalQueue, LocalBucket
+from ingestclient.core.engine import Engine
+
+import multiprocessing as mp
+import os
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from pkg_resources import resource_filename
+
+
+def run_forked(engine):
+    engine.after_fork()
+    engine.run()
+
+
+class TestLocalQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.queue = LocalQueue(os.path.join(self.temp_dir, "queue.sqlite"), visibility_timeout=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_receive(self):
+        """Test that received messages are hidden until released or deleted"""
+        assert self.queue.send_messages(["a", "b", "c"]) == 3
+
+        msgs = self.queue.receive_messages(MaxNumberOfMessages=2)
+        assert [msg.body for msg in msgs] == ["a", "b"]
+        assert self.queue.get_counts() == {"visible": 1, "in_flight": 2}
+
+        # Release one, delete the other
+        response = self.queue.change_message_visibility_batch(
+            Entries=[{"Id": "0", "ReceiptHandle": msgs[0].receipt_handle, "VisibilityTimeout": 0}])
+        assert response["Successful"] == [{"Id": "0"}]
+        assert self.queue.delete_message(msgs[1].receipt_handle) is True
+        assert self.queue.get_counts() == {"visible": 2, "in_flight": 0}
+
+        # The deleted message can't be changed any more
+        response = self.queue.change_message_visibility_batch(
+            Entries=[{"Id": "0", "ReceiptHandle": msgs[1].receipt_handle, "VisibilityTimeout": 0}])
+        assert response["Failed"] == [{"Id": "0"}]
+
+        assert sorted(msg.body for msg in self.queue.receive_messages(MaxNumberOfMessages=10)) == ["a", "c"]
+        assert self.queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=0.1) == []
+
+    def test_delayed_send(self):
+        """Test delayed messages stay hidden until their delay has passed"""
+        self.queue.send_messages(["a", "b"], delays=[0, 0.3])
+
+        assert [msg.body for msg in self.queue.receive_messages(MaxNumberOfMessages=10)] == ["a"]
+        assert self.queue.get_counts() == {"visible": 0, "in_flight": 2}
+        assert [msg.body for msg in self.queue.receive_messages(MaxNumberOfMessages=10, WaitTimeSeconds=2)] == ["b"]
+
+    def test_bucket(self):
+        """Test storing a tile removes its upload task"""
+        self.queue.send_messages(["a"])
+        msg = self.queue.receive_messages()[0]
+        bucket = LocalBucket("tiles", os.path.join(self.temp_dir, "tiles"), self.queue)
+
+        bucket.put_object(Bucket="tiles", Key="abc&1&2", Body=io.BytesIO(b"data"),
+                          Metadata={"receipt_handle": msg.receipt_handle})
+
+        assert bucket.count_objects() == 1
+        assert bucket.get_object(Bucket="tiles", Key="abc&1&2")["Body"].read() == b"data"
+        assert self.queue.get_counts() == {"visible": 0, "in_flight": 0}
+
+
+class TestLocalBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open(os.path.join(resource_filename("ingestclient", "test/data"), "boss-v0.1-test.json"), 'rt') as f:
+            self.config_data = json.load(f)
+        self.config_data["client"]["backend"] = {"name": "local",
+                                                 "class": "LocalBackend",
+                                                 "host": os.path.join(self.temp_dir, "jobs"),
+                                                 "protocol": "file"}
+        # 2 x 2 tiles in 20 slices, so the z extent spans two chunks
+        self.config_data["ingest_job"]["extent"] = {"x": [0, 1024], "y": [0, 1024], "z": [0, 20], "t": [0, 1]}
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_create_join(self):
+        """Test creating and joining a job enumerates the same tasks as the ingest service"""
+        b = Backend.factory("LocalBackend", self.config_data)
+        assert isinstance(b, LocalBackend)
+        assert not isinstance(b, BossBackend)
+        b.setup()
+
+        job_id = b.create(self.config_data)
+        assert job_id == 1
+        assert b.create(self.config_data) == 2
+
+        status, creds, queue, bucket, params, num_tiles = b.join(job_id)
+        assert status == 1
+        assert num_tiles == 2 * 2 * 20
+
+        message_id, receipt_handle, msg = b.get_task()
+        assert msg["tile_key"] == b.encode_tile_key([1, 1, 1], 0, 0, 0, 0)
+        assert msg["chunk_key"] == b.encode_chunk_key(16, [1, 1, 1], 0, 0, 0, 0)
+        assert b.decode_chunk_key(msg["chunk_key"])["num_tiles"] == 16
+
+        job_status = b.get_job_status(job_id)
+        assert job_status["total_message_count"] == 80
+        assert job_status["current_message_count"] + job_status["in_flight_message_count"] == 80
+
+        b.s3_client.put_object(Bucket=bucket, Key=msg["tile_key"], Body=b"tile",
+                               Metadata={"receipt_handle": receipt_handle})
+        b.release_tasks()
+        job_status = b.get_job_status(job_id)
+        assert job_status["current_message_count"] == 79
+        assert job_status["in_flight_message_count"] == 0
+        assert job_status["uploaded_tile_count"] == 1
+
+        # Can't complete with tasks remaining
+        with self.assertRaises(Exception):
+            b.complete(job_id)
+
+        b.cancel(job_id)
+        assert b.get_job_status(job_id)["status"] == 3
+        with self.assertRaises(Exception):
+            b.join(job_id)
+
+    def test_create_from_trace(self):
+        """Test a job created from a trace queues its tasks in trace order"""
+        b = Backend.factory("LocalBackend", self.config_data)
+        b.setup()
+        trace = [{"tile_key": b.encode_tile_key([1, 1, 1], 0, x, 0, z, 0),
+                  "chunk_key": b.encode_chunk_key(16, [1, 1, 1], 0, x, 0, 0, 0)}
+                 for z, x in [(5, 1), (0, 0), (17, 1), (5, 0)]]
+
+        job_id = b.create(self.config_data, trace)
+        assert b.join(job_id)[5] == 4
+
+        received = [b.get_task()[2] for _ in trace]
+        assert [msg["tile_key"] for msg in received] == [record["tile_key"] for record in trace]
+        assert received[0]["chunk_key"] == trace[0]["chunk_key"]
+        assert received[0]["job_id"] == job_id
+
+    def test_run(self):
+        """Test uploading a whole job with the engine"""
+        config_file = os.path.join(self.temp_dir, "config.json")
+        self.config_data["ingest_job"]["extent"]["z"] = [0, 3]
+        with open(config_file, 'wt') as f:
+            json.dump(self.config_data, f)
+
+        engine = Engine(config_file, upload_threads=2)
+        engine.msg_wait_iterations = 1
+        engine.create_job()
+        engine.join()
+        engine.run()
+
+        status = engine.backend.get_job_status(engine.ingest_job_id)
+        assert status["uploaded_tile_count"] == 12
+        assert status["current_message_count"] == 0
+        assert engine.check_job_drained() is True
+        engine.complete()
+        assert engine.backend.get_job_status(engine.ingest_job_id)["status"] == 2
+
+    @unittest.skipIf(not hasattr(os, "fork"), "fork not available")
+    def test_run_forked(self):
+        """Test workers forked from a configured and joined engine upload the whole job without joining again"""
+        config_file = os.path.join(self.temp_dir, "config.json")
+        self.config_data["ingest_job"]["extent"]["z"] = [0, 3]
+        with open(config_file, 'wt') as f:
+            json.dump(self.config_data, f)
+
+        engine = Engine(config_file, upload_threads=2)
+        engine.msg_wait_iterations = 1
+        engine.create_job()
+        engine.join()
+        # The master has used its queue connection before forking
+        assert engine.backend.get_queue_counts()["visible"] == 12
+
+        context = mp.get_context("fork")
+        workers = [context.Process(target=run_forked, args=(engine,)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(60)
+            assert worker.exitcode == 0
+
+        status = engine.backend.get_job_status(engine.ingest_job_id)
+        assert status["uploaded_tile_count"] == 12
+        assert status["current_message_count"] == 0
+        assert engine.check_job_drained() is True
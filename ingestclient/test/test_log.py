@@ -0,0 +1,107 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.log import SamplingFilter, LogListener, configure_worker_logging, SAMPLED, QueueHandler
+from ingestclient.utils.log import always_log_info
+
+import multiprocessing as mp
+import threading
+import unittest
+import logging
+
+
+class CaptureHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def log_from_worker(log_queue):
+    configure_worker_logging(log_queue)
+    logger = logging.getLogger('ingest-client.test-log')
+    logger.setLevel(logging.INFO)
+    logger.info("tile %d", 1, extra=SAMPLED)
+    logger.error("failed %s", "upload")
+
+
+class TestLog(unittest.TestCase):
+
+    def make_record(self, msg, level=logging.INFO, sampled=True):
+        record = logging.LogRecord("ingest-client", level, __file__, 1, msg, (1,), None)
+        if sampled:
+            record.sampled = True
+        return record
+
+    def test_always_log_info_threads(self):
+        """Test that logging from several threads at once leaves the logger's level as it was"""
+        logger = logging.getLogger('ingest-client')
+        previous = logger.level
+        handler = CaptureHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+        try:
+            threads = [threading.Thread(target=lambda: [always_log_info("message") for _ in range(200)])
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert logger.level == logging.WARNING
+            assert len(handler.messages) == 800
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(previous)
+
+    def test_sampling(self):
+        """Test one in every rate per-tile records pass, counted per message"""
+        log_filter = SamplingFilter(rate=3)
+        passed = [log_filter.filter(self.make_record("Processing %d")) for _ in range(7)]
+        self.assertEqual(passed, [True, False, False, True, False, False, True])
+        self.assertTrue(log_filter.filter(self.make_record("Wrote %d")))
+
+    def test_sampling_unsampled(self):
+        """Test warnings and records not marked for sampling always pass"""
+        log_filter = SamplingFilter(rate=1000)
+        log_filter.filter(self.make_record("Processing %d"))
+        for _ in range(5):
+            self.assertTrue(log_filter.filter(self.make_record("Processing %d", level=logging.ERROR)))
+            self.assertTrue(log_filter.filter(self.make_record("Stage depths %d", sampled=False)))
+        self.assertFalse(log_filter.filter(self.make_record("Processing %d")))
+
+    @unittest.skipIf(QueueHandler is None, "QueueHandler not available")
+    def test_worker_listener(self):
+        """Test worker records are written by the master's handlers through the listener"""
+        handler = CaptureHandler()
+        logger = logging.getLogger('ingest-client.test-log')
+        logger.addHandler(handler)
+        log_queue = mp.Queue()
+        listener = LogListener(log_queue)
+        listener.start()
+        try:
+            worker = mp.Process(target=log_from_worker, args=(log_queue,))
+            worker.start()
+            worker.join(30)
+            self.assertEqual(worker.exitcode, 0)
+        finally:
+            listener.stop()
+            logger.removeHandler(handler)
+        self.assertEqual(handler.messages, ["tile 1", "failed upload"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.memory import MemoryProfiler, classify_file, attribute, merge_memory_reports, format_memory
+from ingestclient.utils.memory import PACKAGE_DIR
+from ingestclient.utils.metrics import RunStats, merge_summaries, format_summary
+from ingestclient.core.engine import Engine
+
+from collections import namedtuple
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from pkg_resources import resource_filename
+
+
+def allocate(size):
+    return bytearray(size)
+
+
+Frame = namedtuple("Frame", ["filename", "lineno"])
+
+
+class TestMemory(unittest.TestCase):
+
+    def test_classify_file(self):
+        """Test source files are attributed to the right part of the client"""
+        assert classify_file(os.path.join(PACKAGE_DIR, "plugins", "hdf5.py")) == "plugin"
+        assert classify_file(os.path.join(PACKAGE_DIR, "utils", "filesystem.py")) == "filesystem"
+        assert classify_file(os.path.join(PACKAGE_DIR, "core", "engine.py")) == "engine"
+        assert classify_file(os.path.join(PACKAGE_DIR, "utils", "metrics.py")) == "ingestclient"
+        assert classify_file("/usr/lib/python3/site-packages/numpy/core/numeric.py") is None
+        assert classify_file("/opt/plugins/my_plugin.py", {"/opt/plugins/my_plugin.py"}) == "plugin"
+
+    def test_attribute_frame_order(self):
+        """Test allocations are charged to the innermost client frame whichever way the traceback is ordered"""
+        # Oldest call first: the engine calls the plugin, which calls numpy
+        frames = [Frame(os.path.join(PACKAGE_DIR, "core", "engine.py"), 10),
+                  Frame(os.path.join(PACKAGE_DIR, "plugins", "stack.py"), 20),
+                  Frame("/usr/lib/python3/site-packages/numpy/core/numeric.py", 30)]
+        assert attribute(frames, most_recent_first=False) == ("plugin", os.path.join("plugins", "stack.py") + ":20")
+        assert attribute(frames[::-1], most_recent_first=True) == ("plugin",
+                                                                   os.path.join("plugins", "stack.py") + ":20")
+
+        # Without client frames, the frame that made the allocation is reported
+        frames = [Frame("/usr/lib/python3/threading.py", 1), Frame("/usr/lib/python3/numeric.py", 2)]
+        assert attribute(frames, most_recent_first=False) == ("other", "/usr/lib/python3/numeric.py:2")
+        assert attribute(frames[::-1], most_recent_first=True) == ("other", "/usr/lib/python3/numeric.py:2")
+
+    @unittest.skipIf(sys.version_info < (3, 4), "tracemalloc not available")
+    def test_profiler(self):
+        """Test memory held since profiling started is attributed to the code that allocated it"""
+        profiler = MemoryProfiler(interval=60, plugin_files=[__file__])
+        profiler.start()
+        held = allocate(5 * 1024 * 1024)
+        report = profiler.stop()
+
+        assert report["growth_by_category"]["plugin"] >= 5 * 1024 * 1024
+        assert report["top_allocators"][0]["category"] == "plugin"
+        assert "test_memory.py:" in report["top_allocators"][0]["location"]
+        assert report["rss"]["peak"] >= report["rss"]["start"] > 0
+        assert len(held) == 5 * 1024 * 1024
+
+    @unittest.skipIf(sys.version_info < (3, 4), "tracemalloc not available")
+    def test_engine(self):
+        """Test the engine adds the memory report to its run statistics"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(resource_filename("ingestclient", "test/data"), "boss-v0.1-test.json"), 'rt') as f:
+                config_data = json.load(f)
+            config_data["client"]["backend"] = {"name": "local",
+                                                "class": "LocalBackend",
+                                                "host": os.path.join(temp_dir, "jobs"),
+                                                "protocol": "file"}
+            config_data["ingest_job"]["extent"] = {"x": [0, 1024], "y": [0, 1024], "z": [0, 1], "t": [0, 1]}
+            config_file = os.path.join(temp_dir, "config.json")
+            with open(config_file, 'wt') as f:
+                json.dump(config_data, f)
+
+            engine = Engine(config_file)
+            engine.msg_wait_iterations = 1
+            engine.memory_profiler = MemoryProfiler()
+            engine.create_job()
+            engine.join()
+            engine.run()
+
+            memory = engine.stats.to_dict()["memory"]
+            assert memory["rss"]["peak"] > 0
+            assert set(memory["growth_by_category"]) == {"plugin", "filesystem", "engine", "ingestclient", "other"}
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_merge(self):
+        """Test memory reports are combined in the run summary"""
+        summaries = []
+        for pid, size in [(1, 2e6), (2, 3e6)]:
+            stats = RunStats()
+            stats.pid = pid
+            stats.memory = {"interval": 60,
+                            "rss": {"start": 1e8, "end": 1e8 + size, "peak": 1e8 + size, "samples": []},
+                            "growth_by_category": {"plugin": size, "engine": 1000},
+                            "top_allocators": [{"category": "plugin", "location": "plugins/hdf5.py:10",
+                                                "size_diff": size, "count_diff": 1}]}
+            stats.finish()
+            summaries.append(stats.to_dict())
+
+        summary = merge_summaries(summaries)
+        assert summary["memory"]["rss"]["peak"] == 1e8 + 3e6
+        assert summary["memory"]["growth_by_category"]["plugin"] == 5e6
+        assert summary["memory"]["top_allocators"][0]["size_diff"] == 5e6
+        assert summary["workers"][1]["peak_rss_bytes"] == 1e8 + 3e6
+        assert "plugins/hdf5.py:10 5.0MB" in format_summary(summary)
+
+        assert "memory" not in merge_summaries([RunStats().to_dict()])
+        assert format_memory(merge_memory_reports([])) == "Memory - peak RSS 0.0 MB"
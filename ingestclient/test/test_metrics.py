@@ -0,0 +1,149 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.metrics import Histogram, RunStats, merge_summaries, format_summary
+from ingestclient.utils.metrics import MetricsAggregator, MetricsCollector, MetricsServer
+
+import json
+import multiprocessing
+import os
+import requests
+import tempfile
+import unittest
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentiles(self):
+        """Test percentiles are within the bucket resolution"""
+        hist = Histogram()
+        for idx in range(1, 1001):
+            hist.record(idx / 1000.0)
+
+        assert hist.count == 1000
+        assert abs(hist.percentile(50) - 0.5) / 0.5 < 0.1
+        assert abs(hist.percentile(95) - 0.95) / 0.95 < 0.1
+        assert abs(hist.percentile(99) - 0.99) / 0.99 < 0.1
+        assert hist.percentile(100) == 1.0
+        assert hist.min == 0.001
+
+    def test_empty(self):
+        """Test an empty histogram"""
+        hist = Histogram()
+        assert hist.percentile(50) is None
+        assert hist.to_dict()["count"] == 0
+
+    def test_merge_round_trip(self):
+        """Test merging histograms after encoding them"""
+        hist1 = Histogram()
+        hist2 = Histogram()
+        for idx in range(100):
+            hist1.record(0.01)
+            hist2.record(1.0)
+
+        merged = Histogram.from_dict(json.loads(json.dumps(hist1.to_dict())))
+        merged.merge(Histogram.from_dict(json.loads(json.dumps(hist2.to_dict()))))
+
+        assert merged.count == 200
+        assert merged.min == 0.01
+        assert merged.max == 1.0
+        assert merged.percentile(25) < 0.012
+        assert merged.percentile(75) == 1.0
+
+
+class TestRunStats(unittest.TestCase):
+
+    def test_summary(self):
+        """Test writing and merging worker summaries"""
+        stats1 = RunStats()
+        stats2 = RunStats()
+        for stats in [stats1, stats2]:
+            stats.record("upload", 0.2)
+            stats.increment("tiles_uploaded")
+            stats.increment("bytes_uploaded", 1000)
+            stats.finish()
+
+        summary_file = os.path.join(tempfile.mkdtemp(), "worker.json")
+        stats1.write(summary_file)
+        with open(summary_file, 'rt') as file_handle:
+            summary1 = json.load(file_handle)
+
+        assert summary1["counters"]["tiles_uploaded"] == 1
+        assert summary1["stages"]["upload"]["count"] == 1
+
+        merged = merge_summaries([summary1, stats2.to_dict()])
+        assert merged["num_workers"] == 2
+        assert merged["counters"]["tiles_uploaded"] == 2
+        assert merged["counters"]["bytes_uploaded"] == 2000
+        assert merged["stages"]["upload"]["count"] == 2
+        assert len(merged["workers"]) == 2
+        assert "upload" in format_summary(merged)
+
+
+class TestMetricsAggregator(unittest.TestCase):
+
+    def setUp(self):
+        self.aggregator = MetricsAggregator()
+        for pid in [101, 102]:
+            stats = RunStats()
+            stats.record("upload", 0.2)
+            stats.increment("tiles_uploaded", 3)
+            self.aggregator.update(pid, stats.to_dict())
+        self.aggregator.set_gauge("workers_alive", 2, "Number of worker processes still running")
+
+    def test_prometheus_format(self):
+        """Test rendering the aggregated metrics"""
+        text = self.aggregator.to_prometheus()
+
+        assert 'ingest_tiles_uploaded_total{worker="101"} 3' in text
+        assert 'ingest_tiles_uploaded_total{worker="102"} 3' in text
+        assert "ingest_workers_alive 2" in text
+        assert 'ingest_stage_latency_seconds_count{stage="upload"} 2' in text
+        assert self.aggregator.summary()["counters"]["tiles_uploaded"] == 6
+
+    def test_write(self):
+        """Test writing the metrics file"""
+        metrics_file = os.path.join(tempfile.mkdtemp(), "metrics.prom")
+        self.aggregator.write(metrics_file)
+
+        with open(metrics_file, 'rt') as file_handle:
+            assert file_handle.read() == self.aggregator.to_prometheus()
+
+    def test_collector(self):
+        """Test collecting snapshots sent over worker pipes"""
+        class FakeProcess(object):
+            pid = 555
+
+        aggregator = MetricsAggregator()
+        master_end, worker_end = multiprocessing.Pipe()
+        collector = MetricsCollector([(FakeProcess(), master_end)], aggregator)
+
+        stats = RunStats()
+        stats.increment("tiles_uploaded", 7)
+        worker_end.send(("metrics", stats.to_dict()))
+        collector.poll()
+
+        assert aggregator.workers[555]["counters"]["tiles_uploaded"] == 7
+
+    def test_server(self):
+        """Test serving metrics over HTTP"""
+        server = MetricsServer(self.aggregator, 0)
+        server.start()
+        try:
+            port = server.server.server_address[1]
+            response = requests.get("http://127.0.0.1:{}/metrics".format(port))
+            assert response.status_code == 200
+            assert "ingest_workers_alive 2" in response.text
+        finally:
+            server.stop()
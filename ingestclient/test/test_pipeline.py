@@ -0,0 +1,194 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.pipeline import Pipeline, Stage, StageAborted, RetryQueue, UploadTask
+
+import threading
+import time
+import unittest
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_items_pass_through_stages(self):
+        """Test that every item passes through all stages in order"""
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        pipeline = Pipeline([Stage("double", lambda x: x * 2, 2),
+                             Stage("increment", lambda x: x + 1, 3),
+                             Stage("collect", collect, 1)])
+        pipeline.start()
+        for idx in range(50):
+            pipeline.put(idx)
+        pipeline.shutdown()
+
+        assert sorted(results) == [x * 2 + 1 for x in range(50)]
+
+    def test_errors_go_to_handler(self):
+        """Test that a failing item is passed to the error handler and does not stop the stage"""
+        errors = []
+        results = []
+
+        def check(item):
+            if item == 3:
+                raise ValueError("bad item")
+            return item
+
+        pipeline = Pipeline([Stage("check", check), Stage("collect", results.append)],
+                            error_handler=lambda item, stage, e: errors.append((item, stage)))
+        pipeline.start()
+        for idx in range(5):
+            pipeline.put(idx)
+        pipeline.shutdown()
+
+        assert errors == [(3, "check")]
+        assert results == [0, 1, 2, 4]
+
+    def test_backpressure(self):
+        """Test that a full stage blocks the stages feeding it"""
+        release = threading.Event()
+
+        def slow(item):
+            release.wait()
+
+        pipeline = Pipeline([Stage("fast", lambda x: x, 1, max_pending=1),
+                             Stage("slow", slow, 1, max_pending=1)])
+        pipeline.start()
+
+        def feed():
+            for idx in range(10):
+                pipeline.put(idx)
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.start()
+        feeder.join(0.5)
+
+        # The feeder must be blocked with only a handful of items accepted
+        assert feeder.is_alive()
+        assert pipeline.in_flight() <= 4
+        assert pipeline.depths()["slow"] <= 1
+
+        release.set()
+        feeder.join()
+        pipeline.shutdown()
+        assert pipeline.in_flight() == 0
+
+    def test_shutdown_without_drain(self):
+        """Test that queued items are handed to the error handler when not draining"""
+        started = threading.Event()
+        release = threading.Event()
+        aborted = []
+
+        def block(item):
+            started.set()
+            release.wait()
+
+        def on_error(item, stage, e):
+            if isinstance(e, StageAborted):
+                aborted.append(item)
+
+        stage = Stage("block", block, 1, max_pending=5)
+        pipeline = Pipeline([stage], error_handler=on_error)
+        pipeline.start()
+        for idx in range(4):
+            pipeline.put(idx)
+        started.wait()
+
+        stopper = threading.Thread(target=pipeline.shutdown, kwargs={"drain": False})
+        stopper.start()
+        while not stage.aborted:
+            time.sleep(0.01)
+        release.set()
+        stopper.join()
+
+        assert aborted == [1, 2, 3]
+
+    def test_put_at_stage(self):
+        """Test feeding an item into the middle of the pipeline"""
+        results = []
+        pipeline = Pipeline([Stage("double", lambda x: x * 2), Stage("collect", results.append)])
+        pipeline.start()
+        pipeline.put(1)
+        pipeline.put(5, "collect")
+        pipeline.shutdown()
+
+        assert sorted(results) == [2, 5]
+        with self.assertRaises(KeyError):
+            pipeline.get_stage("missing")
+
+    def test_oldest_start(self):
+        """Test that the pipeline reports when its longest running item started"""
+        release = threading.Event()
+        pipeline = Pipeline([Stage("block", lambda x: release.wait(), 2), Stage("collect", lambda x: None)])
+        assert pipeline.oldest_start() is None
+
+        pipeline.start()
+        before = time.time()
+        pipeline.put(1)
+        time.sleep(0.05)
+        pipeline.put(2)
+        time.sleep(0.05)
+        oldest = pipeline.oldest_start()
+        assert before <= oldest < before + 0.05
+
+        release.set()
+        pipeline.shutdown()
+        assert pipeline.oldest_start() is None
+
+
+class TestRetryQueue(unittest.TestCase):
+
+    def test_retry_order(self):
+        """Test that tasks are returned once they are due, soonest first"""
+        retries = RetryQueue()
+        first = UploadTask("1", "rh1", {})
+        second = UploadTask("2", "rh2", {})
+        assert retries.add(second, 0.1) is True
+        assert retries.add(first, 0) is True
+        assert len(retries) == 2
+
+        assert retries.pop_due() == [first]
+        time.sleep(0.15)
+        assert retries.pop_due() == [second]
+        assert len(retries) == 0
+        assert first.attempts == 1
+
+    def test_limits(self):
+        """Test that the queue size and number of attempts are bounded"""
+        retries = RetryQueue(max_size=2, max_attempts=2)
+        task = UploadTask("1", "rh1", {})
+        assert retries.add(task, 0) is True
+        assert retries.add(UploadTask("2", "rh2", {}), 0) is True
+        assert retries.add(UploadTask("3", "rh3", {}), 0) is False
+
+        assert len(retries.pop_all()) == 2
+        assert retries.add(task, 0) is True
+        retries.pop_all()
+        assert retries.add(task, 0) is False
+
+    def test_delay(self):
+        """Test the jittered exponential backoff"""
+        retries = RetryQueue(base_delay=1.0, max_delay=3.0)
+        task = UploadTask("1", "rh1", {})
+        assert 0.5 <= retries.next_delay(task) <= 1.0
+        task.attempts = 1
+        assert 1.0 <= retries.next_delay(task) <= 2.0
+        task.attempts = 5
+        assert 1.5 <= retries.next_delay(task) <= 3.0
@@ -0,0 +1,148 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.profiling import RunProfiler, SINGLE_PROFILER, StackSampler, merge_profiles, install_stack_dump_handler
+from ingestclient.core.engine import Engine
+
+import os
+import json
+import glob
+import time
+import pstats
+import signal
+import shutil
+import tempfile
+import threading
+import unittest
+from pkg_resources import resource_filename
+
+
+def busy_work(seconds):
+    end_time = time.time() + seconds
+    total = 0
+    while time.time() < end_time:
+        total += sum(range(100))
+    return total
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @unittest.skipIf(SINGLE_PROFILER, "only one profiler can be active")
+    def test_run_profiler(self):
+        """Test functions run on other threads are included in the merged profile"""
+        profiler = RunProfiler()
+        profiler.start()
+        thread = threading.Thread(target=profiler.wrap(busy_work), args=(0.05,))
+        thread.start()
+        thread.join()
+        profiler.stop()
+
+        assert len(profiler.profiles) == 2
+        profiler.dump(os.path.join(self.temp_dir, "worker_1.prof"))
+        profiler.dump(os.path.join(self.temp_dir, "worker_2.prof"))
+
+        merged = merge_profiles(self.temp_dir)
+        assert merged == os.path.join(self.temp_dir, "profile.prof")
+        functions = [func[2] for func in pstats.Stats(merged).stats]
+        assert "busy_work" in functions
+
+        assert merge_profiles(self.temp_dir, since=time.time() + 60) is None
+
+    def test_engine_profile(self):
+        """Test the engine profiles its pipeline stages"""
+        with open(os.path.join(resource_filename("ingestclient", "test/data"), "boss-v0.1-test.json"), 'rt') as f:
+            config_data = json.load(f)
+        config_data["client"]["backend"] = {"name": "local",
+                                            "class": "LocalBackend",
+                                            "host": os.path.join(self.temp_dir, "jobs"),
+                                            "protocol": "file"}
+        config_data["ingest_job"]["extent"] = {"x": [0, 1024], "y": [0, 1024], "z": [0, 1], "t": [0, 1]}
+        config_file = os.path.join(self.temp_dir, "config.json")
+        with open(config_file, 'wt') as f:
+            json.dump(config_data, f)
+
+        engine = Engine(config_file, upload_threads=2)
+        engine.msg_wait_iterations = 1
+        engine.profiler = RunProfiler()
+        engine.create_job()
+        engine.join()
+        engine.run()
+
+        # Profiling must not fail any tiles
+        status = engine.backend.get_job_status(engine.ingest_job_id)
+        assert status["uploaded_tile_count"] == status["total_message_count"] > 0
+        assert status["current_message_count"] == 0
+
+        assert engine.profiler.dump(os.path.join(self.temp_dir, "worker.prof")) is True
+        functions = set(func[2] for func in pstats.Stats(os.path.join(self.temp_dir, "worker.prof")).stats)
+        assert {"receive_task", "resolve_path", "read_tile", "encode_tile", "upload_tile"} <= functions
+
+    def test_profiler_already_active(self):
+        """Test wrapped functions still run when another profiler is active"""
+        class ActiveProfile(object):
+            def enable(self):
+                raise ValueError("Another profiling tool is already active")
+
+            def disable(self):
+                pass
+
+        profiler = RunProfiler()
+        profiler.get_profile = lambda: ActiveProfile()
+        profiler.start()
+        assert profiler.wrap(busy_work)(0.01) > 0
+        profiler.stop()
+
+    def test_stack_sampler(self):
+        """Test the sampler attributes samples to the function that is running"""
+        thread = threading.Thread(target=busy_work, args=(0.5,), name="read-0")
+        thread.start()
+        sampler = StackSampler(duration=0.3, interval=0.005)
+        sampler.start()
+        sampler.join()
+        thread.join()
+
+        assert sampler.num_samples > 0
+        assert any(stack.startswith("read;") and "busy_work" in stack for stack in sampler.samples)
+
+        file_path = os.path.join(self.temp_dir, "samples.folded")
+        sampler.write(file_path)
+        with open(file_path, 'rt') as f:
+            stack, count = f.readline().rsplit(" ", 1)
+        assert int(count) > 0
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "SIGUSR1 not available")
+    def test_signal_handler(self):
+        """Test SIGUSR1 dumps the stacks and writes samples"""
+        previous = signal.getsignal(signal.SIGUSR1)
+        try:
+            assert install_stack_dump_handler(self.temp_dir, duration=0.2, interval=0.01) is True
+            os.kill(os.getpid(), signal.SIGUSR1)
+
+            deadline = time.time() + 5
+            while not glob.glob(os.path.join(self.temp_dir, "*_samples.folded")) and time.time() < deadline:
+                time.sleep(0.05)
+
+            stacks = glob.glob(os.path.join(self.temp_dir, "worker_{}_*_stacks.txt".format(os.getpid())))
+            assert len(stacks) == 1
+            with open(stacks[0], 'rt') as f:
+                assert "test_signal_handler" in f.read()
+            assert len(glob.glob(os.path.join(self.temp_dir, "*_samples.folded"))) == 1
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
@@ -0,0 +1,191 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.core.supervisor import WorkerStatus, WorkerSupervisor
+from ingestclient.core.pipeline import Stage
+from ingestclient.utils.metrics import MetricsAggregator
+
+import multiprocessing as mp
+import time
+import sys
+import unittest
+
+
+def crash(status):
+    sys.exit(1)
+
+
+def finish(status):
+    status.update()
+    status.stop()
+
+
+def hang(status):
+    # A tile that has been in a stage for 100 seconds, with the heartbeat thread still running
+    status.update(time.time() - 100)
+    time.sleep(60)
+
+
+class FakePipeline(object):
+    def __init__(self, oldest_start=None):
+        self.start_time = oldest_start
+
+    def oldest_start(self):
+        return self.start_time
+
+
+class TestWorkerStatus(unittest.TestCase):
+
+    def test_stuck_for(self):
+        """Test that a worker is stuck for as long as its oldest tile has been in a stage"""
+        status = WorkerStatus(interval=0.01)
+        # Not reporting until the run starts
+        assert status.stuck_for() == 0
+
+        pipeline = FakePipeline()
+        status.start(pipeline)
+        assert status.stuck_for() < 1
+
+        pipeline.start_time = time.time() - 50
+        time.sleep(0.05)
+        assert 49 < status.stuck_for() < 51
+
+        status.stop()
+        assert status.stuck_for() == 0
+
+    def test_backpressure_not_stuck(self):
+        """Test that a worker waiting for room in a full downstream stage isn't reported as stuck"""
+        read = Stage("read", lambda x: x, 1)
+        # The upload stage isn't taking items, e.g. while uploads wait for bandwidth
+        upload = Stage("upload", lambda x: None, 1, max_pending=1)
+        read.next_stage = upload
+        read.start()
+        status = WorkerStatus(interval=0.01)
+        status.start(read)
+        for idx in range(2):
+            read.put(idx)
+        time.sleep(0.3)
+
+        # One item fills the upload queue and the read thread is holding the other
+        assert read.in_flight() == 1
+        assert status.stuck_for() < 0.1
+
+        upload.start()
+        read.stop()
+        upload.stop()
+        status.stop()
+
+    def test_stale_heartbeat(self):
+        """Test that a worker that stopped reporting counts as stuck"""
+        status = WorkerStatus()
+        status.update()
+        assert 19 < status.stuck_for(time.time() + 20) < 21
+
+
+class TestWorkerSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mp.get_context("fork") if hasattr(mp, "get_context") else mp
+        self.targets = []
+
+    def start_worker(self, status):
+        target = self.targets.pop(0) if self.targets else finish
+        pipe = mp.Pipe()
+        process = self.context.Process(target=target, args=(status,))
+        process.start()
+        return process, pipe[1]
+
+    def wait_for_exit(self, workers):
+        for process, _ in workers:
+            process.join(10)
+
+    def test_respawn_crashed(self):
+        """Test that a worker that exits with an error is replaced after the backoff"""
+        self.targets = [crash, finish]
+        metrics = MetricsAggregator()
+        workers = []
+        supervisor = WorkerSupervisor(workers, self.start_worker, backoff_min=0.2, metrics=metrics)
+        workers.append(supervisor.spawn())
+        crashed_pid = workers[0][0].pid
+        self.wait_for_exit(workers)
+
+        supervisor.check()
+        assert supervisor.crashed == 1
+        assert supervisor.waiting()
+        # Still backing off
+        assert workers[0][0].pid == crashed_pid
+
+        time.sleep(0.25)
+        supervisor.check()
+        assert not supervisor.waiting()
+        assert supervisor.respawns == 1
+        assert workers[0][0].pid != crashed_pid
+
+        # The replacement finishes cleanly and is left alone
+        self.wait_for_exit(workers)
+        supervisor.check()
+        assert workers[0][0].exitcode == 0
+        assert supervisor.respawns == 1
+        assert not supervisor.waiting()
+
+        prometheus = metrics.to_prometheus()
+        assert "ingest_workers_crashed_total 1" in prometheus
+        assert "ingest_worker_respawns_total 1" in prometheus
+
+    def test_max_respawns(self):
+        """Test that workers are no longer replaced once the respawn limit is reached"""
+        self.targets = [crash, crash, crash, crash]
+        workers = []
+        supervisor = WorkerSupervisor(workers, self.start_worker, max_respawns=2, backoff_min=0)
+        workers.append(supervisor.spawn())
+        for _ in range(4):
+            self.wait_for_exit(workers)
+            supervisor.check()
+
+        assert supervisor.respawns == 2
+        assert supervisor.crashed == 3
+        assert not supervisor.waiting()
+        assert self.targets == [crash]
+
+    def test_kill_hung(self):
+        """Test that a worker stuck on a tile past the deadline is killed and replaced"""
+        self.targets = [hang, finish]
+        workers = []
+        supervisor = WorkerSupervisor(workers, self.start_worker, task_deadline=10, backoff_min=0)
+        workers.append(supervisor.spawn())
+        hung_process = workers[0][0]
+        time.sleep(0.5)
+
+        supervisor.check()
+        assert supervisor.hung == 1
+        assert not hung_process.is_alive()
+        assert supervisor.respawns == 1
+        assert workers[0][0].pid != hung_process.pid
+
+        self.wait_for_exit(workers)
+        supervisor.check()
+        assert supervisor.hung == 1
+
+    def test_watchdog_disabled(self):
+        """Test that without a deadline a slow worker is left running"""
+        self.targets = [hang]
+        workers = []
+        supervisor = WorkerSupervisor(workers, self.start_worker)
+        workers.append(supervisor.spawn())
+        time.sleep(0.5)
+
+        supervisor.check()
+        assert workers[0][0].is_alive()
+        assert supervisor.hung == 0
+        WorkerSupervisor.kill(workers[0][0])
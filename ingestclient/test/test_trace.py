@@ -0,0 +1,79 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import absolute_import
+from ingestclient.utils.trace import TraceRecorder, read_trace
+from ingestclient.core.engine import Engine
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from pkg_resources import resource_filename
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_record_read(self):
+        """Test traces from several workers merge in receive order, skipping truncated records"""
+        first = os.path.join(self.temp_dir, "trace_1.ndjson")
+        second = os.path.join(self.temp_dir, "trace_2.ndjson")
+        with open(first, 'wt') as f:
+            f.write('{"time":1.0,"pid":1,"tile_key":"a","chunk_key":"c"}\n')
+            f.write('{"time":3.0,"pid":1,"tile_key":"c","chunk_key":"c"}\n')
+            f.write('{"time":4.0,"pid":1,"tile_')
+        recorder = TraceRecorder(second)
+        recorder.record({"tile_key": "b", "chunk_key": "c", "job_id": 1})
+        recorder.close()
+        with open(second, 'rt') as f:
+            record = json.loads(f.readline())
+        record["time"] = 2.0
+        with open(second, 'wt') as f:
+            f.write(json.dumps(record))
+
+        assert recorder.count == 1
+        assert sorted(record.keys()) == ["chunk_key", "pid", "tile_key", "time"]
+        assert [x["tile_key"] for x in read_trace([first, second])] == ["a", "b", "c"]
+
+    def test_engine_records(self):
+        """Test the engine records every task it receives"""
+        with open(os.path.join(resource_filename("ingestclient", "test/data"), "boss-v0.1-test.json"), 'rt') as f:
+            config_data = json.load(f)
+        config_data["client"]["backend"] = {"name": "local",
+                                            "class": "LocalBackend",
+                                            "host": os.path.join(self.temp_dir, "jobs"),
+                                            "protocol": "file"}
+        config_data["ingest_job"]["extent"] = {"x": [0, 1024], "y": [0, 1024], "z": [0, 2], "t": [0, 1]}
+        config_file = os.path.join(self.temp_dir, "config.json")
+        with open(config_file, 'wt') as f:
+            json.dump(config_data, f)
+
+        engine = Engine(config_file)
+        engine.msg_wait_iterations = 1
+        engine.trace_recorder = TraceRecorder(os.path.join(self.temp_dir, "trace.ndjson"))
+        engine.create_job()
+        engine.join()
+        engine.run()
+        engine.trace_recorder.close()
+
+        trace = read_trace([os.path.join(self.temp_dir, "trace.ndjson")])
+        assert len(trace) == 8
+        assert len(set(x["tile_key"] for x in trace)) == 8
+        assert trace[0]["pid"] == os.getpid()
@@ -0,0 +1,81 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import multiprocessing as mp
+import time
+
+
+def mbps_to_bytes(mbps):
+    """Method to convert a rate in megabits per second to bytes per second
+
+    Args:
+        mbps(float): Rate in megabits per second
+
+    Returns:
+        (float): Rate in bytes per second
+    """
+    return mbps * 1e6 / 8.0
+
+
+class TokenBucket(object):
+    def __init__(self, rate, capacity=None):
+        """
+        A class to limit the combined rate of uploads from several processes
+
+        The bucket state lives in shared memory, so an instance created in the master process and passed to worker
+        processes when they are started enforces a single limit across all of them. Requests larger than the
+        available tokens are granted immediately but leave the bucket in debt, and the caller sleeps until the debt
+        is repaid. This keeps callers in arrival order and allows single requests larger than the capacity.
+
+        Args:
+            rate(float): Tokens (bytes) added per second
+            capacity(float): Maximum number of tokens that can accumulate while idle. Defaults to one second's worth
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else self.rate
+        # [available tokens, time of the last update]
+        self._state = mp.RawArray('d', [self.capacity, time.time()])
+        self._lock = mp.Lock()
+
+    def reserve(self, amount):
+        """
+        Method to take tokens from the bucket without waiting
+
+        Args:
+            amount(float): Number of tokens to take
+
+        Returns:
+            (float): Seconds the caller must wait before using the tokens
+        """
+        with self._lock:
+            now = time.time()
+            tokens = min(self.capacity, self._state[0] + (now - self._state[1]) * self.rate)
+            tokens -= amount
+            self._state[0] = tokens
+            self._state[1] = now
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def consume(self, amount):
+        """
+        Method to take tokens from the bucket, blocking until they are available
+
+        Args:
+            amount(float): Number of tokens to take
+
+        Returns:
+            (float): Seconds spent waiting
+        """
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
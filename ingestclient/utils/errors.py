@@ -0,0 +1,218 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import botocore.exceptions
+import threading
+import random
+import socket
+import errno
+import time
+
+
+# Classes of errors, each handled with its own backoff policy
+THROTTLING = "throttling"
+AUTH = "auth"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+ERROR_CLASSES = (THROTTLING, AUTH, TRANSIENT, PERMANENT)
+
+# AWS error codes returned when requests are being rate limited
+THROTTLING_ERROR_CODES = {"SlowDown", "Throttling", "ThrottlingException", "ThrottledException",
+                          "RequestLimitExceeded", "RequestThrottled", "TooManyRequestsException",
+                          "ProvisionedThroughputExceededException"}
+
+# AWS error codes caused by missing, expired or not yet valid credentials. Temporary credentials can take a few
+# seconds to become valid, and are refreshed by the engine, so these are retried
+AUTH_ERROR_CODES = {"AccessDenied", "InvalidAccessKeyId", "ExpiredToken", "ExpiredTokenException",
+                    "InvalidClientTokenId", "SignatureDoesNotMatch", "RequestExpired", "TokenRefreshRequired"}
+
+# AWS error codes that are expected to clear up on their own
+TRANSIENT_ERROR_CODES = {"RequestTimeout", "RequestTimeTooSkewed", "InternalError", "ServiceUnavailable",
+                         "InternalFailure", "ServiceUnavailableException"}
+
+# OS errors that will not go away by trying again
+PERMANENT_ERRNOS = {errno.ENOENT, errno.EISDIR, errno.ENOTDIR, errno.EACCES}
+
+
+def get_error_code(error):
+    """Method to get the AWS error code from an exception
+
+    Args:
+        error(Exception): The exception
+
+    Returns:
+        (str): The error code, or None if the exception is not an AWS client error
+    """
+    if isinstance(error, botocore.exceptions.ClientError):
+        return error.response.get("Error", {}).get("Code")
+    return None
+
+
+def classify_error(error):
+    """Method to decide which class of error an exception belongs to
+
+    Args:
+        error(Exception): The exception raised
+
+    Returns:
+        (str): One of THROTTLING, AUTH, TRANSIENT or PERMANENT
+    """
+    if isinstance(error, botocore.exceptions.ClientError):
+        code = get_error_code(error)
+        if code in THROTTLING_ERROR_CODES:
+            return THROTTLING
+        if code in AUTH_ERROR_CODES:
+            return AUTH
+        if code in TRANSIENT_ERROR_CODES:
+            return TRANSIENT
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        if status == 429 or status == 503:
+            return THROTTLING
+        if status is not None and status >= 500:
+            return TRANSIENT
+        return PERMANENT
+
+    if isinstance(error, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return TRANSIENT
+
+    if isinstance(error, socket.timeout):
+        return TRANSIENT
+
+    if isinstance(error, (IOError, OSError)):
+        # OSErrors without an errno come from libraries rather than the OS, e.g. Pillow failing to decode a corrupt
+        # tile, and fail the same way on every attempt
+        if error.errno is None or error.errno in PERMANENT_ERRNOS:
+            return PERMANENT
+        return TRANSIENT
+
+    return PERMANENT
+
+
+def is_transient_error(error):
+    """Method to decide if an operation that failed with this error is worth retrying
+
+    Args:
+        error(Exception): The exception raised
+
+    Returns:
+        (bool): True if the error is expected to be transient
+    """
+    return classify_error(error) != PERMANENT
+
+
+class BackoffPolicy(object):
+    def __init__(self, base_delay, max_delay, max_attempts=None):
+        """
+        A class to compute jittered exponential backoff delays
+
+        Args:
+            base_delay (float): Delay after the first failure, in seconds
+            max_delay (float): Upper bound on the delay, in seconds
+            max_attempts (int): Number of consecutive failures after which to give up, or None to never give up
+        """
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+
+    def delay(self, attempt):
+        """
+        Method to get the delay after a number of consecutive failures
+
+        Args:
+            attempt (int): Number of consecutive failures so far, starting at 1
+
+        Returns:
+            (float): Delay in seconds
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def exhausted(self, attempt):
+        """
+        Method to check if an operation should be given up on
+
+        Args:
+            attempt (int): Number of consecutive failures so far
+
+        Returns:
+            (bool)
+        """
+        return self.max_attempts is not None and attempt >= self.max_attempts
+
+
+# Default backoff for each class of error. Permanent errors are not retried
+BACKOFF_POLICIES = {THROTTLING: BackoffPolicy(1.0, 60.0),
+                    AUTH: BackoffPolicy(5.0, 60.0, max_attempts=20),
+                    TRANSIENT: BackoffPolicy(0.5, 30.0, max_attempts=20),
+                    PERMANENT: BackoffPolicy(0, 0, max_attempts=1)}
+
+
+class Backoff(object):
+    def __init__(self, policies=None):
+        """
+        A class to track consecutive failures of an operation shared by several threads and pace retries
+
+        A failure pushes back every thread calling wait(), so the service being throttled sees all of a worker's
+        requests slow down, not just the one that failed. A success resets the backoff.
+
+        Args:
+            policies (dict): Error class to BackoffPolicy. Defaults to BACKOFF_POLICIES
+        """
+        self.policies = dict(BACKOFF_POLICIES)
+        if policies:
+            self.policies.update(policies)
+        self.attempts = dict((name, 0) for name in ERROR_CLASSES)
+        self.resume_time = 0
+        self._lock = threading.Lock()
+
+    def failure(self, error_class):
+        """
+        Method to record a failure and push back the next attempt
+
+        Args:
+            error_class (str): The class of the error, from classify_error()
+
+        Returns:
+            (float): Seconds until the next attempt
+        """
+        policy = self.policies[error_class]
+        with self._lock:
+            self.attempts[error_class] += 1
+            delay = policy.delay(self.attempts[error_class])
+            self.resume_time = max(self.resume_time, time.time() + delay)
+        return delay
+
+    def success(self):
+        """Method to record a success, resetting consecutive failure counts"""
+        if any(self.attempts.values()):
+            with self._lock:
+                for name in self.attempts:
+                    self.attempts[name] = 0
+
+    def exhausted(self, error_class):
+        """
+        Method to check if an operation has failed too many times in a row to continue
+
+        Args:
+            error_class (str): The class of the error, from classify_error()
+
+        Returns:
+            (bool)
+        """
+        return self.policies[error_class].exhausted(self.attempts[error_class])
+
+    def wait(self):
+        """Method to block until any backoff in effect has passed"""
+        delay = self.resume_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from abc import ABCMeta, abstractmethod
-import boto3
 import os
 import six
 import tempfile
@@ -41,6 +40,9 @@ class DynamicFilesystem(object):
     def get_file(self, path):
         return self.fs.get_file(path)
 
+    def after_fork(self):
+        self.fs.after_fork()
+
 
 class DynamicFilesystemAbsPath(object):
     """Class to support converting between things that can look like a filesystem
@@ -64,6 +66,9 @@ class DynamicFilesystemAbsPath(object):
     def get_file(self, path):
         return self.fs.get_file(path)
 
+    def after_fork(self):
+        self.fs.after_fork()
+
 
 # #############################################
 # Handle only filesystems
@@ -92,6 +97,11 @@ class BaseFilesystem(object):
         """
         raise NotImplemented
 
+    def after_fork(self):
+        """Method called in a worker process forked after the filesystem was created, to re-open anything that can't
+        be shared between processes"""
+        pass
+
 
 class LocalFilesystem(BaseFilesystem):
     """A normal local filesystem"""
@@ -130,9 +140,16 @@ class S3Filesystem(BaseFilesystem):
         """
         BaseFilesystem.__init__(self, parameters)
 
+        import boto3
         self.s3 = boto3.resource('s3')
         self.bucket = self.s3.Bucket(parameters['bucket'])
 
+    def after_fork(self):
+        """Method to connect to S3 again in a worker process forked after the filesystem was created"""
+        import boto3
+        self.s3 = boto3.resource('s3')
+        self.bucket = self.s3.Bucket(self.parameters['bucket'])
+
     def get_file(self, path):
         """Method to get a file from the "file system"
 
@@ -162,6 +179,7 @@ class S3CopyTempFilesystem(BaseFilesystem):
         """
         BaseFilesystem.__init__(self, parameters)
 
+        import boto3
         self.s3 = boto3.resource('s3')
         self.bucket = self.s3.Bucket(parameters['bucket'])
         self.file_map = {}
@@ -171,6 +189,14 @@ class S3CopyTempFilesystem(BaseFilesystem):
         for path in self.file_map:
             os.remove(self.file_map[path])
 
+    def after_fork(self):
+        """Method to connect to S3 again in a worker process forked after the filesystem was created"""
+        import boto3
+        self.s3 = boto3.resource('s3')
+        self.bucket = self.s3.Bucket(self.parameters['bucket'])
+        # Temporary copies belong to the process that downloaded them
+        self.file_map = {}
+
     def get_file(self, path):
         """Method to get a file from the "file system"
 
@@ -221,6 +247,11 @@ class BaseFilesystemAbsPath(object):
         """
         raise NotImplemented
 
+    def after_fork(self):
+        """Method called in a worker process forked after the filesystem was created, to re-open anything that can't
+        be shared between processes"""
+        pass
+
 
 class LocalFilesystemAbsPath(BaseFilesystem):
     """A normal local filesystem"""
@@ -259,6 +290,7 @@ class S3CopyTempFilesystemAbsPath(BaseFilesystem):
         """
         BaseFilesystem.__init__(self, parameters)
 
+        import boto3
         self.s3 = boto3.resource('s3')
         self.bucket = self.s3.Bucket(parameters['bucket'])
         self.file_map = {}
@@ -273,6 +305,14 @@ class S3CopyTempFilesystemAbsPath(BaseFilesystem):
         for path in self.file_map:
             os.remove(self.file_map[path])
 
+    def after_fork(self):
+        """Method to connect to S3 again in a worker process forked after the filesystem was created"""
+        import boto3
+        self.s3 = boto3.resource('s3')
+        self.bucket = self.s3.Bucket(self.parameters['bucket'])
+        # Temporary copies belong to the process that downloaded them
+        self.file_map = {}
+
     def get_file(self, path):
         """Method to get a file from the "file system"
 
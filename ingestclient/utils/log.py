@@ -1,4 +1,28 @@
 import logging
+import threading
+import os
+
+try:
+    from logging.handlers import QueueHandler
+except ImportError:
+    # Python 2. Workers keep writing to the handlers they inherit from the master
+    QueueHandler = None
+
+# Pass as extra= on high volume per-tile INFO lines so SamplingFilter can thin them out
+SAMPLED = {"sampled": True}
+
+# always_log_info() is called from several threads, e.g. the master's monitor loop and credential broker
+_level_lock = threading.RLock()
+
+
+def _reset_level_lock():
+    # A worker forked while another master thread was logging would otherwise inherit the lock held
+    global _level_lock
+    _level_lock = threading.RLock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_level_lock)
 
 
 def always_log_info(msg):
@@ -13,7 +37,129 @@ def always_log_info(msg):
         None
     """
     logger = logging.getLogger('ingest-client')
-    current_level = logger.getEffectiveLevel()
-    logger.setLevel(logging.INFO)
-    logger.info(msg)
-    logger.setLevel(current_level)
+    with _level_lock:
+        current_level = logger.getEffectiveLevel()
+        logger.setLevel(logging.INFO)
+        try:
+            logger.info(msg)
+        finally:
+            logger.setLevel(current_level)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=100):
+        """
+        A filter to let through only one in every rate per-tile log records
+
+        Only records logged with extra=SAMPLED are sampled, and each message is counted separately, starting with
+        its first occurrence. Warnings, errors and every other record always pass.
+
+        Args:
+            rate(int): Pass one in every rate sampled records. 1 passes them all
+        """
+        logging.Filter.__init__(self)
+        self.rate = max(1, int(rate))
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, "sampled", False) or record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            # Messages are logged with lazy %-style arguments, so msg is the same for every tile
+            count = self.counts.get(record.msg, 0)
+            self.counts[record.msg] = count + 1
+        return count % self.rate == 0
+
+
+def set_log_sampling(rate):
+    """Method to sample the per-tile lines of the ingest-client logger, replacing any previous sampling
+
+    Args:
+        rate(int): Log one in every rate per-tile lines. 1 logs every tile
+
+    Returns:
+        (SamplingFilter): The installed filter
+    """
+    logger = logging.getLogger('ingest-client')
+    for log_filter in list(logger.filters):
+        if isinstance(log_filter, SamplingFilter):
+            logger.removeFilter(log_filter)
+    log_filter = SamplingFilter(rate)
+    logger.addFilter(log_filter)
+    return log_filter
+
+
+class LogListener(object):
+    def __init__(self, log_queue):
+        """
+        A class to write the log records of every worker process from a single thread in the master process
+
+        Workers put their records on log_queue instead of writing to the log file themselves, see
+        configure_worker_logging(). Each record is passed to the handlers of the master's logger of the same name, so
+        it ends up in the same file and console output as if the worker had written it, but only one process
+        formats lines and writes the file.
+
+        Args:
+            log_queue(multiprocessing.Queue): Queue shared with the worker processes
+        """
+        self.queue = log_queue
+        self._thread = None
+
+    def start(self):
+        """Method to start handling records in a background thread"""
+        self._thread = threading.Thread(target=self._run, name="log-listener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to handle the records already queued and stop the thread"""
+        if self._thread:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get()
+            except (EOFError, IOError, OSError):
+                break
+            if record is None:
+                break
+            self.handle(record)
+
+    def handle(self, record):
+        """Method to write a worker's record with the master's handlers
+
+        Logger filters are skipped, as the worker already applied them (including sampling).
+
+        Args:
+            record(logging.LogRecord): The record to write
+
+        Returns:
+            None
+        """
+        logging.getLogger(record.name).callHandlers(record)
+
+
+def configure_worker_logging(log_queue):
+    """Method to send the log records of a worker process to the master's LogListener
+
+    The handlers the worker inherited from the master are replaced with a single QueueHandler. Levels and filters,
+    including per-tile sampling, stay in place, so dropped records are never formatted or sent.
+
+    Args:
+        log_queue(multiprocessing.Queue): Queue read by the master's LogListener
+
+    Returns:
+        (bool): False if records could not be redirected (e.g. Python 2) and the worker keeps its own handlers
+    """
+    if QueueHandler is None or log_queue is None:
+        return False
+    root = logging.getLogger()
+    for logger in (root, logging.getLogger('ingest-client')):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    return True
@@ -0,0 +1,307 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import defaultdict, deque
+from .log import always_log_info
+import threading
+import time
+import sys
+import os
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2. Only RSS is sampled
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Root of the ingestclient package, used to attribute allocations to the client's own code
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Categories that allocation growth is attributed to
+CATEGORIES = ("plugin", "filesystem", "engine", "ingestclient", "other")
+
+# tracemalloc tracebacks list the most recent frame first before Python 3.7, and last from 3.7 on
+MOST_RECENT_FIRST = sys.version_info < (3, 7)
+
+
+def get_rss_bytes():
+    """Method to get the resident memory of the calling process
+
+    Returns:
+        (int): Current RSS in bytes on Linux. Peak RSS elsewhere, or None if it can't be determined
+    """
+    try:
+        with open("/proc/self/statm", 'rt') as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def classify_file(file_name, plugin_files=()):
+    """Method to find which part of the client a source file belongs to
+
+    Args:
+        file_name(str): Path of the source file
+        plugin_files(iterable(str)): Source files of the configured plugins, which may live outside the package
+
+    Returns:
+        (str): "plugin", "filesystem", "engine" or "ingestclient", or None for code outside the client
+    """
+    path = os.path.abspath(file_name)
+    if path in plugin_files:
+        return "plugin"
+    if not path.startswith(PACKAGE_DIR + os.sep):
+        return None
+    parts = os.path.relpath(path, PACKAGE_DIR).split(os.sep)
+    if parts[0] == "plugins":
+        return "plugin"
+    if parts == ["utils", "filesystem.py"]:
+        return "filesystem"
+    if parts[0] == "core":
+        return "engine"
+    return "ingestclient"
+
+
+def attribute(traceback, plugin_files=(), most_recent_first=MOST_RECENT_FIRST):
+    """Method to find the client code responsible for an allocation
+
+    The innermost client frame is used, so memory allocated by numpy or Pillow on behalf of a plugin is charged to
+    the plugin line that called them.
+
+    Args:
+        traceback(tracemalloc.Traceback): Where the memory was allocated
+        plugin_files(iterable(str)): Source files of the configured plugins
+        most_recent_first(bool): True if the traceback starts with the frame that made the allocation
+
+    Returns:
+        (str, str): The category and "file:line" of the responsible frame
+    """
+    frames = list(traceback)
+    if not most_recent_first:
+        frames.reverse()
+    for frame in frames:
+        category = classify_file(frame.filename, plugin_files)
+        if category:
+            path = os.path.abspath(frame.filename)
+            if path.startswith(PACKAGE_DIR + os.sep):
+                path = os.path.relpath(path, PACKAGE_DIR)
+            else:
+                # A plugin outside the package
+                path = os.path.basename(path)
+            return category, "{}:{}".format(path, frame.lineno)
+    frame = frames[0]
+    return "other", "{}:{}".format(frame.filename, frame.lineno)
+
+
+class MemoryProfiler(object):
+    def __init__(self, interval=60, nframes=16, top=10, plugin_files=()):
+        """
+        A class to track the memory use of a worker while it runs
+
+        RSS is sampled and a tracemalloc snapshot is taken every interval seconds. Memory allocated since profiling
+        started and still held is attributed to the plugin, filesystem, engine or other code that allocated it, and
+        the largest allocation sites are reported. A line is logged every interval, so the growth is on record even if
+        the worker is killed for running out of memory.
+
+        tracemalloc slows allocation-heavy code down and adds memory of its own. Use it for diagnosis rather than
+        normal runs.
+
+        Args:
+            interval(float): Seconds between samples
+            nframes(int): Number of frames stored per allocation. Deeper stacks attribute allocations made inside
+                          numpy, Pillow or h5py more reliably
+            top(int): Number of allocation sites to report
+            plugin_files(iterable(str)): Source files of the configured plugins
+        """
+        self.interval = interval
+        self.nframes = nframes
+        self.top = top
+        self.plugin_files = set(os.path.abspath(x) for x in plugin_files)
+        self.start_time = None
+        self.rss_start = None
+        self.rss_peak = None
+        # Enough samples for a couple of days at one a minute
+        self.rss_samples = deque(maxlen=2880)
+        self.baseline = None
+        self.latest = None
+        self._started_tracing = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Method to start tracing allocations and sampling in a background thread"""
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.nframes)
+                self._started_tracing = True
+            self.baseline = self.take_snapshot()
+        self.start_time = time.time()
+        self.rss_start = get_rss_bytes()
+        self.sample_rss()
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-profiler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to take a final sample and stop tracing
+
+        Returns:
+            (dict): The final report, see report()
+        """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.sample()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self.report()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+            always_log_info("(pid={}) {}".format(os.getpid(), format_memory(self.report(), top=3)))
+
+    def take_snapshot(self):
+        """Method to take a tracemalloc snapshot, ignoring tracemalloc's own memory
+
+        Returns:
+            (tracemalloc.Snapshot)
+        """
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")))
+
+    def sample_rss(self):
+        """Method to record the current RSS"""
+        rss = get_rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            self.rss_samples.append((round(time.time() - self.start_time, 1), rss))
+            self.rss_peak = max(self.rss_peak or 0, rss)
+
+    def sample(self):
+        """Method to record the current RSS and allocations"""
+        self.sample_rss()
+        if tracemalloc is not None and tracemalloc.is_tracing() and self.baseline is not None:
+            snapshot = self.take_snapshot()
+            with self._lock:
+                self.latest = snapshot
+
+    def report(self):
+        """Method to summarize the memory use of the worker so far
+
+        Returns:
+            (dict): RSS start, end, peak and samples, traced memory, growth per category and the top allocation sites
+        """
+        with self._lock:
+            samples = list(self.rss_samples)
+            latest = self.latest
+            rss_peak = self.rss_peak
+
+        report = {"interval": self.interval,
+                  "rss": {"start": self.rss_start,
+                          "end": samples[-1][1] if samples else None,
+                          "peak": rss_peak,
+                          "samples": samples},
+                  "growth_by_category": dict((name, 0) for name in CATEGORIES),
+                  "top_allocators": []}
+        if latest is None:
+            return report
+
+        sites = defaultdict(lambda: {"size_diff": 0, "count_diff": 0})
+        for stat in latest.compare_to(self.baseline, "traceback"):
+            if not stat.size_diff:
+                continue
+            category, location = attribute(stat.traceback, self.plugin_files)
+            report["growth_by_category"][category] += stat.size_diff
+            site = sites[(category, location)]
+            site["size_diff"] += stat.size_diff
+            site["count_diff"] += stat.count_diff
+
+        top = sorted(sites.items(), key=lambda item: item[1]["size_diff"], reverse=True)[:self.top]
+        report["top_allocators"] = [{"category": category, "location": location,
+                                     "size_diff": site["size_diff"], "count_diff": site["count_diff"]}
+                                    for (category, location), site in top]
+        return report
+
+
+def merge_memory_reports(reports, top=10):
+    """Method to combine the memory reports of several workers
+
+    Args:
+        reports(list(dict)): Output of MemoryProfiler.report() for each worker
+        top(int): Number of allocation sites to keep
+
+    Returns:
+        (dict): Peak RSS of the busiest worker and the sum over workers, growth per category and the top allocation
+                sites summed across workers
+    """
+    growth = dict((name, 0) for name in CATEGORIES)
+    sites = defaultdict(lambda: {"size_diff": 0, "count_diff": 0})
+    peaks = []
+    for report in reports:
+        if report["rss"]["peak"] is not None:
+            peaks.append(report["rss"]["peak"])
+        for name, value in report["growth_by_category"].items():
+            growth[name] = growth.get(name, 0) + value
+        for allocator in report["top_allocators"]:
+            site = sites[(allocator["category"], allocator["location"])]
+            site["size_diff"] += allocator["size_diff"]
+            site["count_diff"] += allocator["count_diff"]
+
+    top_sites = sorted(sites.items(), key=lambda item: item[1]["size_diff"], reverse=True)[:top]
+    return {"rss": {"peak": max(peaks) if peaks else None,
+                    "total_peak": sum(peaks) if peaks else None},
+            "growth_by_category": growth,
+            "top_allocators": [{"category": category, "location": location,
+                                "size_diff": site["size_diff"], "count_diff": site["count_diff"]}
+                               for (category, location), site in top_sites]}
+
+
+def format_memory(report, top=5):
+    """Method to format a memory report as a short human readable line
+
+    Args:
+        report(dict): Output of MemoryProfiler.report() or merge_memory_reports()
+        top(int): Number of allocation sites to include
+
+    Returns:
+        (str)
+    """
+    log_str = "Memory - peak RSS {:.1f} MB".format((report["rss"]["peak"] or 0) / 1e6)
+    growth = [(name, report["growth_by_category"].get(name)) for name in CATEGORIES]
+    if any(value for _, value in growth):
+        log_str += " - growth {}".format(" ".join("{}:{:.1f}MB".format(name, value / 1e6)
+                                                  for name, value in growth if value))
+    if report["top_allocators"]:
+        log_str += " - top {}".format(", ".join("{} {:.1f}MB".format(x["location"], x["size_diff"] / 1e6)
+                                                for x in report["top_allocators"][:top]))
+    return log_str
@@ -0,0 +1,541 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from .errors import ERROR_CLASSES
+from .memory import merge_memory_reports, format_memory
+from collections import defaultdict
+import threading
+import json
+import math
+import time
+import os
+
+
+class Histogram(object):
+    """Class to record a distribution of durations in log-spaced buckets
+
+    Recording is a single dictionary update, and histograms with the same bucket layout can be merged exactly.
+    Percentiles are accurate to within the bucket growth factor (10%).
+    """
+    min_value = 0.0001  # 100 us. Anything faster lands in the first bucket
+    growth = 1.1
+    _log_growth = math.log(growth)
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        """Method to add a sample
+
+        Args:
+            value(float): The sample, in seconds
+
+        Returns:
+            None
+        """
+        if value <= self.min_value:
+            idx = 0
+        else:
+            idx = int(math.log(value / self.min_value) / self._log_growth) + 1
+        self.buckets[idx] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Method to estimate a percentile
+
+        Args:
+            q(float): The percentile to compute, between 0 and 100
+
+        Returns:
+            (float): The upper bound of the bucket containing the percentile, or None if there are no samples
+        """
+        if not self.count:
+            return None
+
+        target = self.count * q / 100.0
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= target:
+                return min(self.min_value * self.growth ** idx, self.max)
+        return self.max
+
+    def merge(self, other):
+        """Method to add the samples of another histogram to this one
+
+        Args:
+            other(Histogram): The histogram to merge in
+
+        Returns:
+            None
+        """
+        for idx, cnt in other.buckets.items():
+            self.buckets[idx] += cnt
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def to_dict(self):
+        """Method to encode the histogram as a JSON serializable dictionary
+
+        Returns:
+            (dict)
+        """
+        return {"count": self.count,
+                "sum": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "min": self.min,
+                "max": self.max,
+                "p50": self.percentile(50),
+                "p95": self.percentile(95),
+                "p99": self.percentile(99),
+                "buckets": dict((str(idx), cnt) for idx, cnt in self.buckets.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Method to rebuild a histogram from the output of to_dict()
+
+        Args:
+            data(dict): Encoded histogram
+
+        Returns:
+            (Histogram)
+        """
+        hist = cls()
+        for idx, cnt in data["buckets"].items():
+            hist.buckets[int(idx)] = cnt
+        hist.count = data["count"]
+        hist.total = data["sum"]
+        hist.min = data["min"]
+        hist.max = data["max"]
+        return hist
+
+
+class RunStats(object):
+    """Class to collect timings and counters for a single worker's upload run
+
+    Safe to update from multiple threads.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.start_time = time.time()
+        self.end_time = None
+        self.stages = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+        # Memory report of the run, see ingestclient.utils.memory.MemoryProfiler. Only set when memory profiling
+        self.memory = None
+        self._lock = threading.Lock()
+
+    def record(self, stage, duration):
+        """Method to record how long a stage took for one tile
+
+        Args:
+            stage(str): Name of the stage
+            duration(float): Duration in seconds
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.stages[stage].record(duration)
+
+    def increment(self, counter, value=1):
+        """Method to increment a counter
+
+        Args:
+            counter(str): Name of the counter
+            value(int): Amount to add
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.counters[counter] += value
+
+    def finish(self):
+        """Method to mark the end of the run"""
+        self.end_time = time.time()
+
+    def to_dict(self):
+        """Method to encode the run statistics as a JSON serializable dictionary
+
+        Returns:
+            (dict)
+        """
+        with self._lock:
+            end_time = self.end_time if self.end_time else time.time()
+            elapsed = end_time - self.start_time
+            counters = dict(self.counters)
+            stages = dict((name, hist.to_dict()) for name, hist in self.stages.items())
+
+        summary = {"pid": self.pid,
+                   "start_time": self.start_time,
+                   "end_time": end_time,
+                   "elapsed_seconds": elapsed,
+                   "tiles_per_second": counters.get("tiles_uploaded", 0) / elapsed if elapsed > 0 else 0.0,
+                   "megabytes_per_second": counters.get("bytes_uploaded", 0) / 1e6 / elapsed if elapsed > 0 else 0.0,
+                   "counters": counters,
+                   "stages": stages}
+        if self.memory is not None:
+            summary["memory"] = self.memory
+        return summary
+
+    def write(self, file_path):
+        """Method to write the run statistics to a JSON file
+
+        Args:
+            file_path(str): Absolute path to the output file
+
+        Returns:
+            None
+        """
+        with open(file_path, 'wt') as file_handle:
+            json.dump(self.to_dict(), file_handle, indent=2)
+
+
+def merge_summaries(summaries):
+    """Method to combine the run statistics of several workers into a single summary
+
+    Counters and stage histograms are summed. Throughput is computed over the wall clock span of all workers. Memory
+    reports, if the workers were memory profiled, are combined with merge_memory_reports().
+
+    Args:
+        summaries(list(dict)): Output of RunStats.to_dict() for each worker
+
+    Returns:
+        (dict): The combined summary, including a short per-worker breakdown
+    """
+    counters = defaultdict(int)
+    stages = defaultdict(Histogram)
+    workers = []
+    for summary in summaries:
+        for name, value in summary["counters"].items():
+            counters[name] += value
+        for name, data in summary["stages"].items():
+            stages[name].merge(Histogram.from_dict(data))
+        worker = {"pid": summary["pid"],
+                  "elapsed_seconds": summary["elapsed_seconds"],
+                  "tiles_per_second": summary["tiles_per_second"],
+                  "megabytes_per_second": summary["megabytes_per_second"],
+                  "tiles_uploaded": summary["counters"].get("tiles_uploaded", 0)}
+        if "memory" in summary:
+            worker["peak_rss_bytes"] = summary["memory"]["rss"]["peak"]
+        workers.append(worker)
+
+    if summaries:
+        start_time = min(x["start_time"] for x in summaries)
+        end_time = max(x["end_time"] for x in summaries)
+    else:
+        start_time = end_time = time.time()
+    elapsed = end_time - start_time
+
+    merged = {"num_workers": len(summaries),
+              "start_time": start_time,
+              "end_time": end_time,
+              "elapsed_seconds": elapsed,
+              "tiles_per_second": counters.get("tiles_uploaded", 0) / elapsed if elapsed > 0 else 0.0,
+              "megabytes_per_second": counters.get("bytes_uploaded", 0) / 1e6 / elapsed if elapsed > 0 else 0.0,
+              "counters": dict(counters),
+              "stages": dict((name, hist.to_dict()) for name, hist in stages.items()),
+              "workers": workers}
+    memory_reports = [x["memory"] for x in summaries if "memory" in x]
+    if memory_reports:
+        merged["memory"] = merge_memory_reports(memory_reports)
+    return merged
+
+
+def format_summary(summary):
+    """Method to format a summary as a short human readable report
+
+    Args:
+        summary(dict): Output of RunStats.to_dict() or merge_summaries()
+
+    Returns:
+        (str)
+    """
+    lines = ["Uploaded {} tiles ({:.1f} MB) at {:.2f} tiles/s, {:.2f} MB/s".format(
+        summary["counters"].get("tiles_uploaded", 0),
+        summary["counters"].get("bytes_uploaded", 0) / 1e6,
+        summary["tiles_per_second"],
+        summary["megabytes_per_second"])]
+    if summary["counters"].get("visibility_extensions"):
+        lines.append("  Visibility extended {} times for {} slow tiles".format(
+            summary["counters"]["visibility_extensions"], summary["counters"].get("extended_tasks", 0)))
+    errors = [(name, summary["counters"].get("{}_errors".format(name), 0)) for name in ERROR_CLASSES]
+    if any(count for _, count in errors):
+        lines.append("  Errors - {}".format(" ".join("{}:{}".format(name, count) for name, count in errors)))
+    for name in sorted(summary["stages"]):
+        stage = summary["stages"][name]
+        if not stage["count"]:
+            continue
+        lines.append("  {:<8} n={:<8d} p50={:.4f}s p95={:.4f}s p99={:.4f}s max={:.4f}s".format(
+            name, stage["count"], stage["p50"], stage["p95"], stage["p99"], stage["max"]))
+    if "memory" in summary:
+        lines.append("  {}".format(format_memory(summary["memory"])))
+    return "\n".join(lines)
+
+
+def _prometheus_name(name):
+    """Method to turn a counter name into a valid Prometheus metric name component"""
+    return "".join(c if c.isalnum() else "_" for c in name).lower()
+
+
+class MetricsAggregator(object):
+    """Class to combine the live statistics pushed by worker processes in the master process
+
+    Keeps the latest snapshot from each worker, plus a set of gauges and counters maintained by the master itself.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self):
+        self.workers = {}
+        self.gauges = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def update(self, worker_id, snapshot):
+        """Method to store the latest statistics from a worker
+
+        Args:
+            worker_id(int): Identifier of the worker, typically its pid
+            snapshot(dict): Output of RunStats.to_dict()
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.workers[worker_id] = snapshot
+
+    def set_gauge(self, name, value, help_str=""):
+        """Method to set a gauge owned by the master process
+
+        Args:
+            name(str): Name of the gauge, without the "ingest_" prefix
+            value(float): Current value
+            help_str(str): Description of the gauge
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.gauges[name] = (value, help_str)
+
+    def increment(self, name, value=1, help_str=""):
+        """Method to increment a counter owned by the master process, e.g. the number of workers restarted
+
+        Args:
+            name(str): Name of the counter, without the "ingest_" prefix and "_total" suffix
+            value(int): Amount to add
+            help_str(str): Description of the counter
+
+        Returns:
+            None
+        """
+        with self._lock:
+            current = self.counters.get(name, (0, help_str))[0]
+            self.counters[name] = (current + value, help_str)
+
+    def summary(self):
+        """Method to get the combined statistics of all workers
+
+        Returns:
+            (dict): Output of merge_summaries()
+        """
+        with self._lock:
+            snapshots = list(self.workers.values())
+        return merge_summaries(snapshots)
+
+    def to_prometheus(self):
+        """Method to render the current metrics in the Prometheus text exposition format
+
+        Returns:
+            (str)
+        """
+        with self._lock:
+            workers = sorted(self.workers.items())
+            gauges = sorted(self.gauges.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        for name, (value, help_str) in gauges:
+            metric = "ingest_{}".format(_prometheus_name(name))
+            lines.append("# HELP {} {}".format(metric, help_str))
+            lines.append("# TYPE {} gauge".format(metric))
+            lines.append("{} {}".format(metric, value))
+
+        for name, (value, help_str) in counters:
+            metric = "ingest_{}_total".format(_prometheus_name(name))
+            lines.append("# HELP {} {}".format(metric, help_str))
+            lines.append("# TYPE {} counter".format(metric))
+            lines.append("{} {}".format(metric, value))
+
+        # Per-worker counters
+        counter_names = sorted(set(name for _, snapshot in workers for name in snapshot["counters"]))
+        for name in counter_names:
+            metric = "ingest_{}_total".format(_prometheus_name(name))
+            lines.append("# TYPE {} counter".format(metric))
+            for worker_id, snapshot in workers:
+                lines.append('{}{{worker="{}"}} {}'.format(metric, worker_id, snapshot["counters"].get(name, 0)))
+
+        # Per-worker gauges, e.g. the current upload concurrency
+        gauge_names = sorted(set(name for _, snapshot in workers for name in snapshot.get("gauges", {})))
+        for name in gauge_names:
+            metric = "ingest_{}".format(_prometheus_name(name))
+            lines.append("# TYPE {} gauge".format(metric))
+            for worker_id, snapshot in workers:
+                if name in snapshot.get("gauges", {}):
+                    lines.append('{}{{worker="{}"}} {}'.format(metric, worker_id, snapshot["gauges"][name]))
+
+        # Stage latencies across all workers
+        summary = merge_summaries([snapshot for _, snapshot in workers])
+        if summary["stages"]:
+            metric = "ingest_stage_latency_seconds"
+            lines.append("# HELP {} Time spent per tile in each stage of the upload pipeline".format(metric))
+            lines.append("# TYPE {} summary".format(metric))
+            for stage in sorted(summary["stages"]):
+                data = summary["stages"][stage]
+                for quantile in ["p50", "p95", "p99"]:
+                    if data[quantile] is not None:
+                        lines.append('{}{{stage="{}",quantile="0.{}"}} {}'.format(metric, stage, quantile[1:],
+                                                                                 data[quantile]))
+                lines.append('{}_sum{{stage="{}"}} {}'.format(metric, stage, data["sum"]))
+                lines.append('{}_count{{stage="{}"}} {}'.format(metric, stage, data["count"]))
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, file_path):
+        """Method to write the current metrics to a text file
+
+        The file is replaced atomically so a scraper never reads a partial file.
+
+        Args:
+            file_path(str): Absolute path to the output file
+
+        Returns:
+            None
+        """
+        temp_path = "{}.tmp{}".format(file_path, os.getpid())
+        with open(temp_path, 'wt') as file_handle:
+            file_handle.write(self.to_prometheus())
+        os.rename(temp_path, file_path)
+
+
+class MetricsCollector(object):
+    """Class to read the statistics that worker processes push over their pipes, on a background thread
+
+    Workers send ("metrics", snapshot) tuples. Reading continuously keeps the pipes drained, so a worker never blocks
+    on a full pipe while the master is busy (e.g. waiting for user input).
+    """
+
+    def __init__(self, workers, aggregator, poll_interval=0.5):
+        """
+
+        Args:
+            workers(list): List of (multiprocessing.Process, multiprocessing.Connection) tuples. Read on every poll,
+                           so workers added later are picked up
+            aggregator(MetricsAggregator): Where snapshots are stored
+            poll_interval(float): Seconds between polls of the pipes
+        """
+        self.workers = workers
+        self.aggregator = aggregator
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Method to start the collector thread"""
+        self._thread = threading.Thread(target=self._run, name="metrics-collector")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """Method to read all pending messages from the worker pipes
+
+        Returns:
+            None
+        """
+        for process, pipe in list(self.workers):
+            try:
+                while pipe.poll():
+                    msg = pipe.recv()
+                    if isinstance(msg, tuple) and msg[0] == "metrics":
+                        self.aggregator.update(process.pid, msg[1])
+            except (EOFError, IOError, OSError):
+                # Worker has gone away
+                continue
+
+    def stop(self):
+        """Method to stop the collector thread after a final poll"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.poll()
+
+
+class MetricsServer(object):
+    """Class to serve the aggregated metrics over HTTP for scraping"""
+
+    def __init__(self, aggregator, port, host="127.0.0.1"):
+        """
+
+        Args:
+            aggregator(MetricsAggregator): The metrics to serve
+            port(int): Port to listen on
+            host(str): Address to bind. Defaults to localhost only
+        """
+        from six.moves import BaseHTTPServer
+
+        class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = aggregator.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Don't write a line to stderr for every scrape
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((host, port), MetricsHandler)
+        self._thread = None
+
+    def start(self):
+        """Method to start serving on a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-server")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Method to stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
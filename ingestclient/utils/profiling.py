@@ -0,0 +1,342 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import Counter
+from .log import always_log_info
+import traceback
+import threading
+import datetime
+import logging
+import cProfile
+import pstats
+import signal
+import glob
+import time
+import sys
+import six
+import os
+
+
+# Python 3.12+ allows only one active profiler per process. Enabling a second raises ValueError
+SINGLE_PROFILER = sys.version_info >= (3, 12)
+
+
+class RunProfiler(object):
+    def __init__(self):
+        """
+        A class to profile the engine with cProfile across the run loop and the pipeline threads
+
+        cProfile only sees the thread that enabled it, so each thread gets its own profile. They are merged into a
+        single set of statistics when dumped.
+
+        On Python 3.12+ only one profiler can be active at a time. A single profile is enabled by the thread that
+        calls start() and wrap() leaves functions as they are. cProfile is built on sys.monitoring there, which
+        reports the calls of every thread to that profile.
+        """
+        self.profiles = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def get_profile(self):
+        """
+        Method to get the profile of the calling thread
+
+        Returns:
+            (cProfile.Profile)
+        """
+        profile = getattr(self._local, "profile", None)
+        if profile is None:
+            profile = cProfile.Profile()
+            self._local.profile = profile
+            with self._lock:
+                self.profiles.append(profile)
+        return profile
+
+    def start(self):
+        """Method to start profiling the calling thread"""
+        try:
+            self.get_profile().enable()
+        except ValueError as e:
+            # Another profiler is already active
+            logging.getLogger('ingest-client').warning("(pid={}) Profiling disabled: {}".format(os.getpid(), e))
+
+    def stop(self):
+        """Method to stop profiling the calling thread"""
+        self.get_profile().disable()
+
+    def wrap(self, fn):
+        """
+        Method to profile every call of a function, on whichever thread makes it
+
+        If the profile can't be enabled, the function runs unprofiled, so profiling never fails a tile.
+
+        Args:
+            fn(callable): The function to profile
+
+        Returns:
+            (callable)
+        """
+        if SINGLE_PROFILER:
+            return fn
+
+        def wrapped(*args, **kwargs):
+            profile = self.get_profile()
+            try:
+                profile.enable()
+            except ValueError:
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+        return wrapped
+
+    def dump(self, file_path):
+        """
+        Method to write the merged statistics of every thread in pstats format
+
+        Args:
+            file_path(str): The .prof file to write
+
+        Returns:
+            (bool): False if nothing was profiled
+        """
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # The profile never ran, so it has no statistics
+                continue
+        if stats is None:
+            return False
+        stats.dump_stats(file_path)
+        return True
+
+
+def merge_profiles(profile_dir, since=None, top=25):
+    """Method to merge the per-worker profiles into a single .prof file and log the most expensive functions
+
+    Args:
+        profile_dir(str): Directory containing the worker_<pid>.prof files
+        since(float): If provided, ignore profiles written before this time (e.g. left over from a previous run)
+        top(int): Number of functions to log, by cumulative time
+
+    Returns:
+        (str): Path of the merged profile, or None if no worker profiles were found
+    """
+    logger = logging.getLogger('ingest-client')
+    stats = None
+    for file_name in sorted(glob.glob(os.path.join(profile_dir, "worker_*.prof"))):
+        if since is not None and os.path.getmtime(file_name) < since:
+            continue
+        try:
+            if stats is None:
+                stats = pstats.Stats(file_name)
+            else:
+                stats.add(file_name)
+        except (IOError, OSError, ValueError, EOFError) as e:
+            logger.warning("Skipping unreadable worker profile {}: {}".format(file_name, e))
+
+    if stats is None:
+        return None
+
+    merged_file = os.path.join(profile_dir, "profile.prof")
+    stats.dump_stats(merged_file)
+
+    output = six.StringIO()
+    stats.stream = output
+    stats.sort_stats("cumulative").print_stats(top)
+    always_log_info("Top {} functions by cumulative time across all workers:\n{}".format(top, output.getvalue()))
+    always_log_info("Merged profile written to {}. View it with: python -m pstats {}".format(merged_file,
+                                                                                            merged_file))
+    return merged_file
+
+
+def format_frame(frame):
+    """Method to describe a stack frame as file:function:line"""
+    code = frame.f_code
+    return "{}:{}:{}".format(os.path.basename(code.co_filename), code.co_name, frame.f_lineno)
+
+
+def get_thread_names():
+    """Method to map thread IDs to thread names"""
+    return dict((thread.ident, thread.name) for thread in threading.enumerate())
+
+
+def format_stacks():
+    """Method to format the current stack of every thread in the process
+
+    Returns:
+        (str)
+    """
+    names = get_thread_names()
+    lines = []
+    for thread_id, frame in sys._current_frames().items():
+        lines.append("Thread {} ({}):".format(names.get(thread_id, "unknown"), thread_id))
+        lines.extend(line.rstrip("\n") for line in traceback.format_stack(frame))
+        lines.append("")
+    return "\n".join(lines)
+
+
+class StackSampler(object):
+    def __init__(self, duration=10, interval=0.01):
+        """
+        A class to sample the stacks of every thread in the process at a fixed interval
+
+        A lightweight statistical profiler that can be started on a live worker. Samples are counted per distinct
+        stack and written in the folded format used by flame graph tools (e.g. flamegraph.pl, speedscope).
+
+        Args:
+            duration(float): Seconds to sample for
+            interval(float): Seconds between samples
+        """
+        self.duration = duration
+        self.interval = interval
+        self.samples = Counter()
+        self.num_samples = 0
+        self._thread = None
+
+    def start(self):
+        """Method to start sampling in a background thread"""
+        self._thread = threading.Thread(target=self.run, name="stack-sampler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Method to take samples until the duration has passed"""
+        own_id = threading.current_thread().ident
+        end_time = time.time() + self.duration
+        while time.time() < end_time:
+            self.sample(own_id)
+            time.sleep(self.interval)
+
+    def sample(self, exclude=None):
+        """
+        Method to record the current stack of every thread
+
+        Args:
+            exclude(int): ID of a thread to skip, e.g. the sampler's own
+
+        Returns:
+            None
+        """
+        names = get_thread_names()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == exclude:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(format_frame(frame))
+                frame = frame.f_back
+            # Collapse the per-thread index so all threads of a stage share a root, e.g. "read-0" -> "read"
+            thread_name = names.get(thread_id, "unknown").rsplit("-", 1)[0]
+            self.samples[";".join([thread_name] + stack[::-1])] += 1
+        self.num_samples += 1
+
+    def top_functions(self, top=15):
+        """
+        Method to get the functions that were running (not waiting on a callee) in the most samples
+
+        Returns:
+            (list(tuple(str, int))): Function and sample count
+        """
+        counts = Counter()
+        for stack, count in self.samples.items():
+            counts[stack.rsplit(";", 1)[-1]] += count
+        return counts.most_common(top)
+
+    def write(self, file_path):
+        """
+        Method to write the samples in folded stack format, one "frame;frame;frame count" line per distinct stack
+
+        Args:
+            file_path(str): The file to write
+
+        Returns:
+            None
+        """
+        with open(file_path, 'wt') as file_handle:
+            for stack, count in self.samples.most_common():
+                file_handle.write("{} {}\n".format(stack, count))
+
+
+def install_stack_dump_handler(output_dir, duration=10, interval=0.01):
+    """Method to dump stacks and sample the process when it receives SIGUSR1
+
+    On the signal, the current stack of every thread is written to output_dir and logged, and a StackSampler runs
+    for duration seconds. Its folded samples are written to output_dir and the busiest functions are logged. Use it
+    to see what a slow worker is doing without restarting it, e.g. `kill -USR1 <worker pid>`.
+
+    Must be called from the main thread. Does nothing on platforms without SIGUSR1.
+
+    Args:
+        output_dir(str): Directory to write the stack dumps and samples to
+        duration(float): Seconds to sample for after each signal
+        interval(float): Seconds between samples
+
+    Returns:
+        (bool): True if the handler was installed
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+
+    samplers = []
+
+    def write_samples(sampler, file_path):
+        sampler.join()
+        try:
+            sampler.write(file_path)
+        except (IOError, OSError) as e:
+            logging.getLogger('ingest-client').warning("Failed to write stack samples to {}: {}".format(file_path, e))
+            return
+        always_log_info("(pid={}) Took {} stack samples, busiest functions: {}. Folded stacks written to {}".format(
+            os.getpid(), sampler.num_samples,
+            ", ".join("{} ({})".format(name, count) for name, count in sampler.top_functions(5)), file_path))
+
+    def handler(signum, frame):
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        prefix = os.path.join(output_dir, "worker_{}_{}".format(os.getpid(), timestamp))
+        stacks = format_stacks()
+        try:
+            with open("{}_stacks.txt".format(prefix), 'wt') as file_handle:
+                file_handle.write(stacks)
+        except (IOError, OSError):
+            pass
+        always_log_info("(pid={}) Received SIGUSR1, current stacks:\n{}".format(os.getpid(), stacks))
+
+        if samplers and samplers[-1].is_alive():
+            # Already sampling
+            return
+        sampler = StackSampler(duration, interval)
+        sampler.start()
+        samplers.append(sampler)
+        writer = threading.Thread(target=write_samples, args=(sampler, "{}_samples.folded".format(prefix)),
+                                  name="stack-sample-writer")
+        writer.daemon = True
+        writer.start()
+
+    signal.signal(signal.SIGUSR1, handler)
+    return True
@@ -0,0 +1,49 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import numpy as np
+
+
+def synthetic_slice(height, width, dtype="uint8", compressibility=0.8, seed=0):
+    """Method to generate an image slice that compresses roughly like microscopy data
+
+    The slice mixes smooth structure (background gradients and blob-like cells) with uniform noise. compressibility
+    sets the share of structure, from 0 (pure noise, which no encoder can shrink) to 1 (noise free). For 8 bit PNG
+    tiles, 0.8 compresses about 1.2:1 and 0.95 about 1.8:1, the range of typical EM data.
+
+    Args:
+        height(int): Number of rows
+        width(int): Number of columns
+        dtype(str): Integer data type of the slice, e.g. "uint8" or "uint16"
+        compressibility(float): Share of structure in the slice, from 0 to 1
+        seed(int): Random seed, so datasets are reproducible
+
+    Returns:
+        (np.ndarray): The slice
+    """
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    structure = 0.5 + 0.2 * np.sin(x / 37.0 + seed) * np.cos(y / 53.0 - seed)
+    structure += 0.1 * np.sin((x + y) / 11.0)
+    for _ in range(max(1, height * width // 20000)):
+        cy, cx = rng.uniform(0, height), rng.uniform(0, width)
+        radius = rng.uniform(4, 24)
+        structure -= 0.3 * np.exp(-((y - cy) ** 2 + (x - cx) ** 2) / (2 * radius ** 2))
+    structure = np.clip(structure, 0, 1)
+
+    compressibility = min(1.0, max(0.0, compressibility))
+    data = compressibility * structure + (1 - compressibility) * rng.uniform(0, 1, size=(height, width))
+
+    max_value = np.iinfo(dtype).max
+    return (data * max_value).astype(dtype)
@@ -0,0 +1,102 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import logging
+import json
+import time
+import os
+
+
+class TraceRecorder(object):
+    def __init__(self, file_path):
+        """
+        A class to record the upload tasks a worker receives, in the order it receives them
+
+        The trace is NDJSON, one compact object per task with the receive time (seconds since the epoch), the worker's
+        pid, and the tile and chunk keys of the task:
+
+            {"time":1507577200.153,"pid":1234,"tile_key":"...","chunk_key":"..."}
+
+        Traces from several workers can be merged by time and replayed against a LocalBackend, see
+        ingestclient.benchmark.replay.
+
+        Args:
+            file_path(str): File to append the trace to
+        """
+        self.file_path = file_path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(file_path, 'at')
+
+    def record(self, msg):
+        """
+        Method to add a received task to the trace
+
+        Args:
+            msg(dict): The upload task message
+
+        Returns:
+            None
+        """
+        line = json.dumps({"time": round(time.time(), 3),
+                           "pid": os.getpid(),
+                           "tile_key": msg["tile_key"],
+                           "chunk_key": msg["chunk_key"]}, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line)
+            self._file.write("\n")
+            self.count += 1
+
+    def flush(self):
+        """Method to write buffered records to the file"""
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        """Method to flush and close the trace file"""
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(file_paths):
+    """Method to load one or more traces, merged in the order the tasks were received
+
+    Lines that can't be parsed, e.g. the last line of a trace whose worker was killed, are skipped.
+
+    Args:
+        file_paths(list(str)): Trace files written by TraceRecorder
+
+    Returns:
+        (list(dict)): The trace records, ordered by receive time
+    """
+    logger = logging.getLogger('ingest-client')
+    records = []
+    for file_path in file_paths:
+        with open(file_path, 'rt') as file_handle:
+            for line_number, line in enumerate(file_handle, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    if "tile_key" not in record or "chunk_key" not in record:
+                        raise ValueError("missing tile_key or chunk_key")
+                except ValueError as e:
+                    logger.warning("Skipping malformed trace record at {}:{}: {}".format(file_path, line_number, e))
+                    continue
+                records.append(record)
+
+    # Stable, so records with the same time keep the order they were written in
+    records.sort(key=lambda record: record.get("time", 0))
+    return records
@@ -35,13 +35,16 @@ setup(
     author_email='iarpamicrons@jhuapl.edu',
 
     entry_points={
-        'console_scripts': ['boss-ingest=ingestclient.client:main'],
+        'console_scripts': ['boss-ingest=ingestclient.client:main',
+                            'boss-ingest-bench=ingestclient.benchmark.bench:main',
+                            'boss-ingest-replay=ingestclient.benchmark.replay:main'],
     },
     #packages=find_packages('ingestclient'),
     packages=['ingestclient',
               'ingestclient.core',
               'ingestclient.plugins',
               'ingestclient.utils',
+              'ingestclient.benchmark',
               'ingestclient.configs',
               'ingestclient.schema'],
     package_data={